@@ -0,0 +1,103 @@
+import threading
+
+from cold_start import lazy_import
+
+# boto3 and botocore dominate import time; load them when the first client is built
+boto3 = lazy_import('boto3')
+botocore_config = lazy_import('botocore.config')
+
+# Tuned defaults shared by every handler. Lambda containers serve one request
+# at a time but handlers fan out with threads, so the pool is sized for that.
+DEFAULT_CONFIG_OPTIONS = {
+    'max_pool_connections': 50,
+    'tcp_keepalive': True,
+    'connect_timeout': 5,
+    'read_timeout': 60,
+    'retries': {
+        'max_attempts': 3,
+        'mode': 'standard'
+    }
+}
+
+# Clients and resources are cached for the lifetime of the container so warm
+# invocations reuse the connection pool instead of paying a new TLS handshake.
+_clients = {}
+_lock = threading.Lock()
+
+
+def _build_config(options):
+    """
+    Merge a handler's Config options into the shared defaults.
+    """
+    merged = botocore_config.Config(**DEFAULT_CONFIG_OPTIONS)
+    if options:
+        merged = merged.merge(botocore_config.Config(**options))
+    return merged
+
+
+def _freeze(value):
+    """
+    A hashable, order-independent copy of nested option values (e.g. retries).
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _cache_key(kind, service_name, region_name, options):
+    # Key on the option values, so equal options share one client and the
+    # cache holds one entry per distinct configuration
+    return (kind, service_name, region_name, _freeze(options))
+
+
+def _get(kind, service_name, region_name, config, overrides):
+    if config is not None and not isinstance(config, dict):
+        raise TypeError('config must be a dict of botocore Config options, e.g. {"read_timeout": 120}')
+    options = dict(config or {}, **overrides)
+    key = _cache_key(kind, service_name, region_name, options)
+    cached = _clients.get(key)
+    if cached is not None:
+        return cached
+
+    with _lock:
+        # Another thread may have created it while we waited for the lock
+        cached = _clients.get(key)
+        if cached is None:
+            kwargs = {'config': _build_config(options)}
+            if region_name:
+                kwargs['region_name'] = region_name
+            # boto3.client / boto3.resource; the first call imports boto3
+            cached = getattr(boto3, kind)(service_name, **kwargs)
+            _clients[key] = cached
+        return cached
+
+
+def get_client(service_name, region_name=None, config=None, **overrides):
+    """
+    Return a boto3 client that is created once per container and reused.
+
+    Handlers can pass botocore Config options, as a dict in config or as
+    keyword arguments (e.g. read_timeout=120), to override the shared
+    defaults. Clients are cached per distinct set of option values.
+
+    Example:
+        bedrock = get_client('bedrock-runtime', read_timeout=120)
+    """
+    return _get('client', service_name, region_name, config, overrides)
+
+
+def get_resource(service_name, region_name=None, config=None, **overrides):
+    """
+    Return a boto3 resource that is created once per container and reused.
+    """
+    return _get('resource', service_name, region_name, config, overrides)
+
+
+def clear_clients():
+    """
+    Drop every cached client. Mainly useful for benchmarks and local runs.
+    """
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,180 @@
+import os
+import re
+import uuid
+from datetime import datetime
+
+from metrics import span
+from s3_jsonl import JsonlShardWriter, iter_jsonl, iter_keys
+
+# Bedrock batch inference quotas: records per input file, input file size,
+# and the minimum number of records a job must contain
+MAX_RECORDS_PER_SHARD = int(os.environ.get('BEDROCK_BATCH_SHARD_RECORDS', '50000'))
+MAX_SHARD_BYTES = 1024 * 1024 * 1024
+MIN_RECORDS_PER_JOB = 100
+
+# Statuses after which a job will not change any more
+TERMINAL_STATUSES = frozenset(('Completed', 'PartiallyCompleted', 'Failed', 'Stopped', 'Expired'))
+
+# Job statuses whose output can be collected
+COLLECTABLE_STATUSES = frozenset(('Completed', 'PartiallyCompleted'))
+
+_JOB_NAME_INVALID = re.compile(r'[^a-zA-Z0-9+\-.]')
+
+
+def model_input(model_id, prompt, system=None, max_tokens=1000, temperature=0.7):
+    """
+    Build the native InvokeModel body for one prompt. Batch inference takes
+    model-native bodies, not Converse requests.
+    """
+    if 'anthropic.' in model_id:
+        body = {
+            'anthropic_version': 'bedrock-2023-05-31',
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'messages': [{'role': 'user', 'content': [{'type': 'text', 'text': prompt}]}]
+        }
+        if system:
+            body['system'] = system
+        return body
+
+    if 'amazon.nova' in model_id:
+        body = {
+            'schemaVersion': 'messages-v1',
+            'messages': [{'role': 'user', 'content': [{'text': prompt}]}],
+            'inferenceConfig': {'max_new_tokens': max_tokens, 'temperature': temperature}
+        }
+        if system:
+            body['system'] = [{'text': system}]
+        return body
+
+    raise ValueError(f"Batch mode does not know the request format for {model_id}")
+
+
+def parse_model_output(output):
+    """
+    Return (text, inputTokens, outputTokens) from a native model response.
+    """
+    if 'content' in output:
+        usage = output.get('usage', {})
+        text = ''.join(block.get('text', '') for block in output['content'])
+        return text, usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+
+    usage = output.get('usage', {})
+    text = ''.join(block.get('text', '') for block in output['output']['message']['content'])
+    return text, usage.get('inputTokens', 0), usage.get('outputTokens', 0)
+
+
+def batch_records(prompts, model_id, defaults=None):
+    """
+    Generator that turns prompt objects ({"id"?, "prompt", "system"?, ...})
+    into batch input records.
+
+    A prompt's "id" becomes its recordId (Bedrock expects 11 alphanumeric
+    characters); prompts without one are numbered in order.
+    """
+    defaults = defaults or {}
+    for index, item in enumerate(prompts):
+        if isinstance(item, str):
+            item = {'prompt': item}
+        yield {
+            'recordId': str(item.get('id') or f"{index:011d}"),
+            'modelInput': model_input(
+                model_id,
+                item['prompt'],
+                system=item.get('system', defaults.get('system')),
+                max_tokens=int(item.get('maxTokens', defaults.get('maxTokens', 1000))),
+                temperature=float(item.get('temperature', defaults.get('temperature', 0.7)))
+            )
+        }
+
+
+def write_input_shards(s3, bucket, prefix, records, max_records=None, max_bytes=MAX_SHARD_BYTES):
+    """
+    Stream records into JSONL shards under prefix and return the shard list.
+    """
+    with JsonlShardWriter(s3, bucket, prefix, max_records or MAX_RECORDS_PER_SHARD, max_bytes) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.shards
+
+
+def job_name(prefix='bedrock-batch'):
+    name = f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return _JOB_NAME_INVALID.sub('-', name)[:63]
+
+
+def submit_job(bedrock, name, model_id, role_arn, input_uri, output_uri):
+    """
+    Create a model invocation job reading every shard under input_uri and
+    return its ARN.
+    """
+    with span('submit_job'):
+        response = bedrock.create_model_invocation_job(
+            jobName=name,
+            roleArn=role_arn,
+            modelId=model_id,
+            inputDataConfig={
+                's3InputDataConfig': {
+                    's3Uri': input_uri,
+                    's3InputFormat': 'JSONL'
+                }
+            },
+            outputDataConfig={
+                's3OutputDataConfig': {
+                    's3Uri': output_uri
+                }
+            }
+        )
+    return response['jobArn']
+
+
+def job_id(job_arn):
+    """
+    Bedrock writes a job's output under <output prefix>/<job id>/.
+    """
+    return job_arn.rsplit('/', 1)[-1]
+
+
+def iter_results(s3, bucket, output_prefix, job_arn):
+    """
+    Generator over per-prompt results from a finished job's output files.
+
+    Each .jsonl.out file is streamed line by line, so memory use does not
+    depend on the size of the job.
+    """
+    prefix = f"{output_prefix.rstrip('/')}/{job_id(job_arn)}/"
+    for key in iter_keys(s3, bucket, prefix, suffix='.jsonl.out'):
+        for record in iter_jsonl(s3, bucket, key):
+            if 'modelOutput' in record:
+                text, input_tokens, output_tokens = parse_model_output(record['modelOutput'])
+                yield {
+                    'recordId': record.get('recordId'),
+                    'text': text,
+                    'inputTokens': input_tokens,
+                    'outputTokens': output_tokens
+                }
+            else:
+                error = record.get('error', {})
+                yield {
+                    'recordId': record.get('recordId'),
+                    'error': error.get('errorMessage', str(error)) if isinstance(error, dict) else str(error)
+                }
+
+
+def collect_results(s3, bucket, output_prefix, job_arn, results_prefix, max_records=None):
+    """
+    Stream a finished job's output into per-prompt result shards under
+    results_prefix and return totals.
+    """
+    totals = {'succeeded': 0, 'failed': 0, 'inputTokens': 0, 'outputTokens': 0}
+    with JsonlShardWriter(s3, bucket, results_prefix, max_records or MAX_RECORDS_PER_SHARD) as writer:
+        for result in iter_results(s3, bucket, output_prefix, job_arn):
+            writer.write(result)
+            if 'error' in result:
+                totals['failed'] += 1
+            else:
+                totals['succeeded'] += 1
+                totals['inputTokens'] += result['inputTokens']
+                totals['outputTokens'] += result['outputTokens']
+    totals['shards'] = writer.shards
+    return totals
@@ -0,0 +1,180 @@
+import re
+import time
+
+from cold_start import lazy_import
+from metrics import count
+
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+DEFAULT_INFERENCE_CONFIG = {
+    'maxTokens': 1000,
+    'temperature': 0.7
+}
+
+# Marks the end of a prefix that Bedrock may serve from its prompt cache
+CACHE_POINT = {'cachePoint': {'type': 'default'}}
+
+# Document names may only contain alphanumerics, single spaces, hyphens,
+# parentheses and square brackets
+_DOCUMENT_NAME_INVALID = re.compile(r'[^A-Za-z0-9\-\(\)\[\] ]+|\s{2,}')
+
+# Models that rejected cache points; later requests to them are sent without
+_no_cache_points = set()
+
+
+def build_request(model_id, prompt, system=None, documents=None, inference_config=None, cache=True):
+    """
+    Build the Converse/ConverseStream arguments for a single-turn prompt.
+
+    documents is a list of {"name": ..., "text": ...} (or "bytes" plus a
+    "format" such as "pdf"). They are placed ahead of the prompt in the user
+    turn, so the system prompt and documents form a prefix that stays the
+    same when only the question changes. With cache=True a cache point is
+    added after the system prompt and after the documents, and Bedrock reads
+    that prefix from its prompt cache on repeat calls instead of processing
+    it again.
+    """
+    cache = cache and model_id not in _no_cache_points
+
+    content = []
+    for index, document in enumerate(documents or []):
+        data = document.get('bytes')
+        if data is None:
+            data = document['text'].encode('utf-8')
+        name = _DOCUMENT_NAME_INVALID.sub('-', document.get('name') or f"document-{index + 1}")
+        content.append({
+            'document': {
+                'name': name,
+                'format': document.get('format', 'txt'),
+                'source': {'bytes': data}
+            }
+        })
+    if content and cache:
+        content.append(CACHE_POINT)
+    content.append({'text': prompt})
+
+    request = {
+        'modelId': model_id,
+        'messages': [{'role': 'user', 'content': content}],
+        'inferenceConfig': dict(DEFAULT_INFERENCE_CONFIG, **(inference_config or {}))
+    }
+    if system:
+        request['system'] = [{'text': system}] + ([CACHE_POINT] if cache else [])
+    return request
+
+
+def without_cache_points(request):
+    """
+    Return a copy of request with every cache point removed.
+    """
+    stripped = dict(request)
+    stripped['messages'] = [
+        dict(message, content=[block for block in message['content'] if 'cachePoint' not in block])
+        for message in request['messages']
+    ]
+    if 'system' in request:
+        stripped['system'] = [block for block in request['system'] if 'cachePoint' not in block]
+    return stripped
+
+
+def _has_cache_points(request):
+    blocks = list(request.get('system', []))
+    for message in request['messages']:
+        blocks.extend(message['content'])
+    return any('cachePoint' in block for block in blocks)
+
+
+def _call(operation, request):
+    """
+    Call converse or converse_stream, retrying once without cache points if
+    the model does not support prompt caching.
+    """
+    try:
+        return operation(**request)
+    except botocore_exceptions.ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        if code != 'ValidationException' or 'cach' not in str(e).lower() or not _has_cache_points(request):
+            raise
+        _no_cache_points.add(request['modelId'])
+        print(f"Model {request['modelId']} does not support prompt caching; sending without cache points")
+        return operation(**without_cache_points(request))
+
+
+def usage_report(usage, server_metrics, elapsed):
+    """
+    Summarize one call's token usage and latency.
+
+    Converse reports inputTokens excluding tokens read from or written to
+    the prompt cache, so inputTokens is the uncached part of the input.
+    """
+    report = {
+        'inputTokens': usage.get('inputTokens', 0),
+        'cacheReadInputTokens': usage.get('cacheReadInputTokens', 0),
+        'cacheWriteInputTokens': usage.get('cacheWriteInputTokens', 0),
+        'outputTokens': usage.get('outputTokens', 0),
+        'serverLatencyMs': server_metrics.get('latencyMs'),
+        'totalTimeMs': round(elapsed * 1000, 1)
+    }
+
+    # Token counts are emitted with the invocation's latency metrics
+    count('input_tokens', report['inputTokens'])
+    count('cache_read_input_tokens', report['cacheReadInputTokens'])
+    count('cache_write_input_tokens', report['cacheWriteInputTokens'])
+    count('output_tokens', report['outputTokens'])
+    return report
+
+
+def converse(bedrock, request):
+    """
+    Run a Converse call and return {"text", "stopReason", "usage"}.
+    """
+    start = time.perf_counter()
+    response = _call(bedrock.converse, request)
+    elapsed = time.perf_counter() - start
+
+    content = response['output']['message']['content']
+    usage = usage_report(response.get('usage', {}), response.get('metrics', {}), elapsed)
+    usage['tokensPerSecond'] = round(usage['outputTokens'] / elapsed, 1) if elapsed > 0 else None
+    return {
+        'text': ''.join(block.get('text', '') for block in content),
+        'stopReason': response.get('stopReason'),
+        'usage': usage
+    }
+
+
+def converse_stream(bedrock, request, metrics=None):
+    """
+    Generator that yields text deltas from ConverseStream as soon as Bedrock emits them.
+
+    If a metrics dict is passed it is filled in once the stream finishes
+    with timeToFirstTokenMs, tokensPerSecond, stopReason and the usage
+    report (cached and uncached input tokens, output tokens, latency).
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    usage, server_metrics, stop_reason = {}, {}, None
+
+    response = _call(bedrock.converse_stream, request)
+    for event in response['stream']:
+        if 'contentBlockDelta' in event:
+            text = event['contentBlockDelta']['delta'].get('text', '')
+            if text:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield text
+        elif 'messageStop' in event:
+            stop_reason = event['messageStop'].get('stopReason')
+        elif 'metadata' in event:
+            usage = event['metadata'].get('usage', {})
+            server_metrics = event['metadata'].get('metrics', {})
+
+    total = time.perf_counter() - start
+    report = usage_report(usage, server_metrics, total)
+    if metrics is not None:
+        generation = total - (first_token_at - start) if first_token_at else 0
+        metrics.update({
+            'timeToFirstTokenMs': round((first_token_at - start) * 1000, 1) if first_token_at else None,
+            'tokensPerSecond': round(report['outputTokens'] / generation, 1) if generation > 0 else None,
+            'stopReason': stop_reason,
+            **report
+        })
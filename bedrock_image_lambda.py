@@ -1,14 +1,147 @@
 import json
-import boto3
 import base64
+import binascii
+import io
 import uuid
 import os
+import re
 from datetime import datetime
 
+from cold_start import preload, priming_hook
+from concurrency import bounded_map
+from metrics import instrumented, span
+from throttling import throttled_client
+
+# Derivative formats Pillow can encode, mapped to their S3 content types
+DERIVATIVE_CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png'
+}
+
+MODEL_ID = 'stability.stable-diffusion-xl-v1'
+
+THUMBNAIL = {'name': 'thumbnail', 'format': 'webp', 'size': 128}
+
+# Derivatives one request may ask for, and the largest edge they may have
+MAX_DERIVATIVES = 8
+MAX_DERIVATIVE_SIZE = 4096
+
+# Variant names become part of the S3 key, so only these characters are allowed
+VARIANT_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Variants rendered and uploaded at once, the original included
+DERIVATIVE_WORKERS = 4
+
+_BASE64_FIELD = b'"base64"'
+
+
+def decode_first_artifact(raw):
+    """
+    Decode the first artifact's base64 image straight from the raw response bytes.
+
+    Parsing the whole response with json.loads would create a str copy of
+    the base64 data (plus the dict holding it) on top of the raw bytes and
+    the decoded image. Instead the base64 value is located in the raw
+    bytes and decoded from a zero-copy memoryview slice. Responses that do
+    not look like the expected shape fall back to a full JSON parse.
+    """
+    field = raw.find(_BASE64_FIELD)
+    if field != -1:
+        start = raw.find(b'"', raw.find(b':', field + len(_BASE64_FIELD)) + 1) + 1
+        end = raw.find(b'"', start)
+        # Base64 never contains backslashes unless the JSON escaped something
+        if 0 < start <= end and raw.find(b'\\', start, end) == -1:
+            return binascii.a2b_base64(memoryview(raw)[start:end])
+
+    return base64.b64decode(json.loads(raw)['artifacts'][0]['base64'])
+
+
+def render_derivative(image_bytes, spec):
+    """
+    Resize the image to fit within spec['size'] pixels and encode it as spec['format'].
+    """
+    # Pillow is only needed when derivatives are requested
+    from PIL import Image
+
+    image_format = spec['format'].lower()
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.thumbnail((spec['size'], spec['size']))
+        if image_format == 'jpeg' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format.upper(), quality=spec.get('quality', 80))
+        return buffer.getvalue(), image.size
+
+
+def validate_derivatives(specs):
+    """
+    Return the derivative specs with size and quality as ints and their
+    variant name (default "<format>_<size>") resolved.
+
+    Raises ValueError naming the first spec that is not a dict with a
+    supported format, a size from 1 to MAX_DERIVATIVE_SIZE, a quality from
+    1 to 100 and a name matching VARIANT_NAME, or whose name another spec
+    already has (the two would be written to the same S3 key).
+    """
+    if not isinstance(specs, list):
+        raise ValueError('derivatives must be a list')
+    if len(specs) > MAX_DERIVATIVES:
+        raise ValueError(f'at most {MAX_DERIVATIVES} derivatives are allowed')
+    validated = []
+    names = {'original'}
+    for spec in specs:
+        try:
+            image_format = str(spec.get('format', '')).lower()
+            size = int(spec.get('size', 0))
+            quality = int(spec.get('quality', 80))
+        except (AttributeError, TypeError, ValueError):
+            raise ValueError(f'invalid derivative: {json.dumps(spec, default=str)}')
+        if image_format not in DERIVATIVE_CONTENT_TYPES or not 0 < size <= MAX_DERIVATIVE_SIZE or not 0 < quality <= 100:
+            raise ValueError(f'invalid derivative: {json.dumps(spec, default=str)}')
+        name = spec.get('name', f"{image_format}_{size}")
+        if not isinstance(name, str) or not VARIANT_NAME.match(name):
+            raise ValueError(f'invalid derivative name (letters, digits, "_" and "-" only): {json.dumps(name, default=str)}')
+        if name in names:
+            raise ValueError(f'duplicate derivative name: {name}')
+        names.add(name)
+        validated.append(dict(spec, format=image_format, size=size, quality=quality, name=name))
+    return validated
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Bedrock and S3 clients ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('bedrock-runtime', read_timeout=120)
+    throttled_client('s3')
+
+
+@instrumented('bedrock_image', MODEL_ID)
 def lambda_handler(event, context):
-    # Initialize Bedrock and S3 clients
-    bedrock = boto3.client('bedrock-runtime')
-    s3 = boto3.client('s3')
+    """
+    Generate an image with Stable Diffusion XL and store it in S3.
+
+    Optional derivatives are rendered in parallel and uploaded concurrently
+    with the original so clients can fetch the smallest variant that fits.
+    Each derivative is {"format": "webp" | "jpeg" | "png", "size": <max
+    edge in pixels, up to 4096>, "quality": <optional, 1-100, default 80>};
+    "thumbnail": true adds a 128px WebP. At most 8 derivatives are allowed.
+    Derivatives require Pillow in the deployment package.
+
+    Example test event:
+    {
+      "prompt": "A beautiful sunset over mountains",
+      "derivatives": [{"format": "webp", "size": 256}, {"format": "jpeg", "size": 512}],
+      "thumbnail": true
+    }
+    """
+    # Reuse the container's Bedrock and S3 clients
+    with span('client_init'):
+        bedrock = throttled_client('bedrock-runtime', context, read_timeout=120)
+        s3 = throttled_client('s3', context)
     
     # Validate environment variable
     bucket_name = os.environ.get('S3_BUCKET_NAME')
@@ -20,6 +153,18 @@ def lambda_handler(event, context):
     
     # Get the prompt from the event
     prompt = event.get('prompt', 'A beautiful sunset over mountains')
+
+    # Collect and validate the requested derivative variants
+    derivatives = event.get('derivatives') or []
+    if event.get('thumbnail') and isinstance(derivatives, list):
+        derivatives = derivatives + [THUMBNAIL]
+    try:
+        derivatives = validate_derivatives(derivatives)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'Invalid input: {str(e)}'})
+        }
     
     # Prepare the request body for Stable Diffusion
     request_body = {
@@ -33,32 +178,56 @@ def lambda_handler(event, context):
     
     try:
         # Call Bedrock with Stable Diffusion model
-        response = bedrock.invoke_model(
-            modelId='stability.stable-diffusion-xl-v1',
-            body=json.dumps(request_body)
-        )
+        with span('model_invoke'):
+            response = bedrock.invoke_model(
+                modelId=MODEL_ID,
+                body=json.dumps(request_body)
+            )
+            raw_body = response.get('body').read()
         
-        # Parse the response
-        response_body = json.loads(response.get('body').read())
-        
-        # The response includes base64-encoded image
-        image_data = response_body['artifacts'][0]['base64']
-        
-        # Decode base64 string to bytes
-        image_bytes = base64.b64decode(image_data)
+        # Decode the base64-encoded image without materializing the parsed
+        # response; the raw body is released as soon as it is decoded
+        with span('decode'):
+            image_bytes = decode_first_artifact(raw_body)
+            del raw_body
         
         # Generate a unique filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_id = str(uuid.uuid4())[:8]
-        file_name = f"image_{timestamp}_{file_id}.png"
+        base_name = f"image_{timestamp}_{file_id}"
+        file_name = f"{base_name}.png"
         
-        # Upload the image to S3
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=file_name,
-            Body=image_bytes,
-            ContentType='image/png'
-        )
+        def store_variant(spec):
+            if spec is None:
+                body, size, name, content_type = image_bytes, None, file_name, 'image/png'
+                variant = 'original'
+            else:
+                image_format = spec['format'].lower()
+                with span('render'):
+                    body, size = render_derivative(image_bytes, spec)
+                variant = spec['name']
+                name = f"{base_name}_{variant}.{'jpg' if image_format == 'jpeg' else image_format}"
+                content_type = DERIVATIVE_CONTENT_TYPES[image_format]
+
+            # Upload the image to S3
+            with span('s3_upload'):
+                s3.put_object(
+                    Bucket=bucket_name,
+                    Key=name,
+                    Body=body,
+                    ContentType=content_type
+                )
+            return {
+                'variant': variant,
+                'file_name': name,
+                's3_url': f"s3://{bucket_name}/{name}",
+                'content_type': content_type,
+                'bytes': len(body),
+                **({'width': size[0], 'height': size[1]} if size else {})
+            }
+
+        # Render and upload every variant in parallel, original first
+        variants = bounded_map(store_variant, [None] + derivatives, DERIVATIVE_WORKERS, context)
         
         # Generate the S3 URL
         s3_url = f"s3://{bucket_name}/{file_name}"
@@ -68,11 +237,13 @@ def lambda_handler(event, context):
             'statusCode': 200,
             'body': json.dumps({
                 's3_url': s3_url,
-                'file_name': file_name
+                'file_name': file_name,
+                'variants': variants
             })
         }
         
     except Exception as e:
+        print(f"Error: {str(e)}")
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -1,13 +1,28 @@
 import json
-import boto3
 import os
 
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-east-1'
-)
+from bedrock_converse import build_request, converse
+from cold_start import priming_hook
+from metrics import instrumented, span
+from throttling import throttled_client
 
+# Any model that supports the Converse API can be used, e.g. amazon.nova-pro-v1:0
+MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Bedrock client ahead of the first request.
+    """
+    throttled_client('bedrock-runtime', region_name='us-east-1', read_timeout=120)
+
+
+@instrumented('bedrock_nova', MODEL_ID)
 def lambda_handler(event, context):
+    with span('client_init'):
+        bedrock = throttled_client('bedrock-runtime', context, region_name='us-east-1', read_timeout=120)
+
     try:
         # Get the prompt from the event
         body = json.loads(event['body'])
@@ -19,27 +34,25 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'No prompt provided'})
             }
 
-        # Prepare the request body for Nova
-        request_body = {
-            "prompt": prompt,
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
-            "temperature": 0.7,
-            "top_k": 250,
-            "top_p": 1,
-            "stop_sequences": ["\n\nHuman:"]
-        }
-
-        # Call Amazon Bedrock with Anthropic Claude
-        response = bedrock.invoke_model(
-            modelId='anthropic.claude-3-sonnet-20240229-v1:0',
-            contentType='application/json',
-            body=json.dumps(request_body)
+        # Prepare the Converse request; a shared system prompt and documents
+        # are sent with cache points so repeat calls reuse the cached prefix
+        request = build_request(
+            MODEL_ID,
+            prompt,
+            system=body.get('system'),
+            documents=body.get('documents'),
+            inference_config={
+                'maxTokens': 1000,
+                'temperature': 0.7,
+                'topP': 1
+            },
+            cache=body.get('promptCache', True)
         )
         
-        # Parse the response
-        response_body = json.loads(response['body'].read())
-        generated_text = response_body['completion']
+        # Call Amazon Bedrock through the model-agnostic Converse API
+        with span('model_invoke'):
+            response = converse(bedrock, request)
+        print(json.dumps({'bedrockUsage': response['usage']}))
 
         return {
             'statusCode': 200,
@@ -48,7 +61,8 @@ def lambda_handler(event, context):
                 'Access-Control-Allow-Origin': '*'
             },
             'body': json.dumps({
-                'response': generated_text
+                'response': response['text'],
+                'usage': response['usage']
             })
         }
 
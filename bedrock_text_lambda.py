@@ -1,54 +1,506 @@
 import json
-import boto3
+import os
+import time
 
+from bedrock_converse import build_request, converse, converse_stream
+from cold_start import lazy_import, preload, priming_hook
+from concurrency import bounded_map
+from metrics import instrumented, span
+from result_cache import HIT_DYNAMODB, HIT_MEMORY, cache_headers, get_or_compute, prime as prime_result_cache
+from throttling import throttled_client
+
+# Only the batch handlers need the batch and S3 streaming helpers
+bedrock_batch = lazy_import('bedrock_batch')
+s3_jsonl = lazy_import('s3_jsonl')
+
+# Any model that supports the Converse API can be used
+MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
+
+# Prompts mode: Converse calls in flight at once, and how much invocation
+# time to keep for calls already running when no new prompt may start
+PROMPTS_CONCURRENCY = int(os.environ.get('BEDROCK_PROMPTS_CONCURRENCY', '8'))
+PROMPTS_DEADLINE_RESERVE_MS = int(os.environ.get('BEDROCK_PROMPTS_DEADLINE_RESERVE_MS', '10000'))
+
+# Batch mode: where job files are written, and the service role Bedrock
+# assumes to read the input shards and write the output
+BATCH_BUCKET = os.environ.get('BEDROCK_BATCH_BUCKET')
+BATCH_ROLE_ARN = os.environ.get('BEDROCK_BATCH_ROLE_ARN')
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Bedrock client (and cache table) ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('bedrock-runtime', read_timeout=120)
+    prime_result_cache()
+
+
+def run_prompts(bedrock, prompts, shared, concurrency, context=None):
+    """
+    Run many prompts that share a system prompt, documents and inference
+    settings, and return one result per prompt in input order.
+
+    Prompts run concurrently, up to concurrency Converse calls at once.
+    Each result holds the prompt's "id" (its given id or its index) and
+    either "generated_text", "stopReason" and "usage", or "error". Once
+    less than PROMPTS_DEADLINE_RESERVE_MS (at most a quarter of the time
+    left when the prompts start) of the invocation remains no new prompt
+    is started; those prompts get "skipped": true. The first prompt is
+    always started.
+    """
+    def run(indexed):
+        index, item = indexed
+        prompt_id = item.get('id', index)
+        request = build_request(
+            MODEL_ID,
+            item['prompt'],
+            system=shared['system'],
+            documents=shared['documents'],
+            inference_config=shared['inferenceConfig'],
+            cache=shared['promptCache']
+        )
+        try:
+            response = converse(bedrock, request)
+            return {
+                'id': prompt_id,
+                'generated_text': response['text'],
+                'stopReason': response['stopReason'],
+                'usage': response['usage']
+            }
+        except Exception as e:
+            print(f"Error running prompt {prompt_id}: {str(e)}")
+            return {'id': prompt_id, 'error': str(e)}
+
+    reserve_ms = PROMPTS_DEADLINE_RESERVE_MS
+    if context is not None:
+        # Short function timeouts keep most of their time for prompts
+        reserve_ms = min(reserve_ms, context.get_remaining_time_in_millis() // 4)
+
+    with span('model_invoke'):
+        results = bounded_map(
+            run,
+            list(enumerate(prompts)),
+            concurrency,
+            context,
+            reserve_ms=reserve_ms
+        )
+
+    # Prompts that were never started are reported, not dropped
+    return [
+        result if result is not None else {
+            'id': prompts[index].get('id', index),
+            'error': 'Not started before the invocation deadline',
+            'skipped': True
+        }
+        for index, result in enumerate(results)
+    ]
+
+
+def summarize_prompts(results, concurrency, elapsed_ms):
+    """
+    Totals across a prompts-mode response.
+    """
+    summary = {
+        'prompts': len(results),
+        'succeeded': 0,
+        'failed': 0,
+        'skipped': 0,
+        'inputTokens': 0,
+        'cacheReadInputTokens': 0,
+        'cacheWriteInputTokens': 0,
+        'outputTokens': 0,
+        'concurrency': concurrency,
+        'totalTimeMs': round(elapsed_ms, 1)
+    }
+    for result in results:
+        if result.get('skipped'):
+            summary['skipped'] += 1
+        elif 'error' in result:
+            summary['failed'] += 1
+        else:
+            summary['succeeded'] += 1
+            for field in ('inputTokens', 'cacheReadInputTokens', 'cacheWriteInputTokens', 'outputTokens'):
+                summary[field] += result['usage'][field]
+    return summary
+
+
+@instrumented('bedrock_text', MODEL_ID)
 def lambda_handler(event, context):
-    # Initialize Bedrock client
-    bedrock = boto3.client('bedrock-runtime')
+    """
+    Generate text with Claude 3 Sonnet (or BEDROCK_MODEL_ID) through the Converse API.
+
+    By default the full completion is returned as one JSON response. Set
+    "stream": true in the event to generate through ConverseStream
+    instead; the deltas are returned in order as "chunks" alongside the
+    assembled text. Both modes report latency and token usage, split into
+    uncached input, cache-read and cache-write tokens, and streaming mode
+    adds time-to-first-token.
+
+    An optional "system" prompt and "documents" ([{"name", "text"}]) are
+    sent ahead of the prompt with cache points after them, so repeated
+    calls that share them are served from Bedrock's prompt cache. Set
+    "promptCache": false to send them without cache points.
+
+    Buffered responses are cached by result_cache, keyed on the model and
+    the full request. Because sampled output differs between calls,
+    requests with temperature > 0 are only cached when "cacheControl"
+    sets "cacheNonDeterministic". The X-Cache header reports the outcome.
+
+    Send "prompts" (a list of strings or {"id", "prompt"} objects) instead
+    of "prompt" to run many prompts in one invocation. They share system,
+    documents, temperature, maxTokens and promptCache, run concurrently
+    (up to "concurrency", default BEDROCK_PROMPTS_CONCURRENCY) and come
+    back in order as "results", each with its own usage or error, plus a
+    "summary". Prompts not started before the invocation deadline are
+    returned as skipped. Prompts mode does not use the result cache.
+
+    Example test event:
+    {
+      "system": "You are a concise assistant for our product manual.",
+      "documents": [{"name": "manual", "text": "..."}],
+      "prompt": "How do I reset the device?",
+      "temperature": 0,
+      "cacheControl": {"maxAge": 3600}
+    }
+    """
+    # Reuse the container's Bedrock client
+    with span('client_init'):
+        bedrock = throttled_client('bedrock-runtime', context, read_timeout=120)
     
     # Get the input text from the event
+    prompts = event.get('prompts')
     input_text = event.get('prompt', 'Tell me a short story.')
+    system = event.get('system')
+    documents = event.get('documents') or []
     
     # Validate input
-    if not input_text or not isinstance(input_text, str):
+    if prompts is not None:
+        if isinstance(prompts, list):
+            prompts = [{'prompt': item} if isinstance(item, str) else item for item in prompts]
+        valid_prompts = isinstance(prompts, list) and prompts and all(
+            isinstance(item, dict) and isinstance(item.get('prompt'), str) and item['prompt'] for item in prompts
+        )
+        if not valid_prompts:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({
+                    'error': 'Invalid input: prompts must be a non-empty list of strings or {"id", "prompt"} objects'
+                })
+            }
+    elif not input_text or not isinstance(input_text, str):
         return {
             'statusCode': 400,
             'body': json.dumps({'error': 'Invalid input: prompt must be a non-empty string'})
         }
-    
-    # Prepare the request body
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 1000,
-        "messages": [
-            {
-                "role": "user",
-                "content": input_text
-            }
-        ],
-        "temperature": 0.7
-    }
+    valid_documents = isinstance(documents, list) and all(
+        isinstance(document, dict) and isinstance(document.get('text'), str) for document in documents
+    )
+    if not valid_documents:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: documents must be a list of {"name", "text"} objects'})
+        }
     
     try:
-        # Call Bedrock with Claude model
-        response = bedrock.invoke_model(
-            modelId='anthropic.claude-3-sonnet-20240229-v1:0',
-            body=json.dumps(request_body)
-        )
-        
-        # Parse the response
-        response_body = json.loads(response.get('body').read())
-        generated_text = response_body['content'][0]['text']
-        
+        temperature = float(event.get('temperature', 0.7))
+        max_tokens = int(event['maxTokens']) if event.get('maxTokens') else None
+        concurrency = int(event.get('concurrency', PROMPTS_CONCURRENCY))
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': 'Invalid input: temperature, maxTokens and concurrency must be numbers'
+            })
+        }
+    if concurrency < 1 or (max_tokens is not None and max_tokens < 1):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: maxTokens and concurrency must be at least 1'})
+        }
+
+    # Prepare the Converse request
+    inference_config = {'temperature': temperature}
+    if max_tokens is not None:
+        inference_config['maxTokens'] = max_tokens
+
+    if prompts is not None:
+        shared = {
+            'system': system,
+            'documents': documents,
+            'inferenceConfig': inference_config,
+            'promptCache': event.get('promptCache', True)
+        }
+        start = time.perf_counter()
+        results = run_prompts(bedrock, prompts, shared, concurrency, context)
+        summary = summarize_prompts(results, concurrency, (time.perf_counter() - start) * 1000)
+        print(json.dumps({'bedrockPromptsSummary': summary}))
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'generated_text': generated_text
+                'results': results,
+                'summary': summary
             })
         }
+
+    request = build_request(
+        MODEL_ID,
+        input_text,
+        system=system,
+        documents=documents,
+        inference_config=inference_config,
+        cache=event.get('promptCache', True)
+    )
+
+    try:
+        if event.get('stream'):
+            # Consume the delta generator; a streaming transport would
+            # forward each chunk to the client as it arrives
+            metrics = {}
+            with span('model_invoke'):
+                chunks = list(converse_stream(bedrock, request, metrics))
+            print(json.dumps({'bedrockStreamMetrics': metrics}))
+
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'generated_text': ''.join(chunks),
+                    'chunks': chunks,
+                    'metrics': metrics
+                })
+            }
+
+        def invoke():
+            # Call Bedrock through the Converse API
+            with span('model_invoke'):
+                response = converse(bedrock, request)
+            print(json.dumps({'bedrockUsage': response['usage']}))
+
+            return {
+                'generated_text': response['text'],
+                'metrics': dict(
+                    response['usage'],
+                    # Nothing is visible until the whole completion arrives
+                    timeToFirstTokenMs=response['usage']['totalTimeMs']
+                )
+            }
+
+        cache_control = dict(event.get('cacheControl') or {})
+        if temperature > 0 and not cache_control.get('cacheNonDeterministic'):
+            cache_control['bypass'] = True
+
+        # Key on the request as the caller described it; document bytes are not JSON
+        cache_params = {
+            'system': system,
+            'documents': documents,
+            'prompt': input_text,
+            'inferenceConfig': request['inferenceConfig']
+        }
+        result, cache_status, cache_key = get_or_compute(
+            f"bedrock:{MODEL_ID}", cache_params, invoke, cache_control
+        )
+        if cache_status in (HIT_MEMORY, HIT_DYNAMODB):
+            # Served from cache: report the lookup, not the original call
+            result = dict(result, metrics={'cached': True})
+        
+        return {
+            'statusCode': 200,
+            'headers': cache_headers(cache_status, cache_key),
+            'body': json.dumps(result)
+        }
         
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
             'statusCode': 500,
             'body': json.dumps({'error': 'Internal server error'})
-        }
\ No newline at end of file
+        }
+
+
+@instrumented('bedrock_text_batch_submit', MODEL_ID)
+def batch_submit_handler(event, context):
+    """
+    Lambda function that submits a prompt set as a Bedrock batch inference job.
+
+    This function:
+    1. Streams prompts from "promptsUri" (a JSONL object of {"id"?, "prompt",
+       "system"?, "maxTokens"?, "temperature"?} lines) or an inline
+       "prompts" list
+    2. Writes them as JSONL shards of at most BEDROCK_BATCH_SHARD_RECORDS
+       records under s3://<bucket>/bedrock-batch/<job name>/input/
+    3. Submits a model invocation job over the shards and returns its ARN
+
+    Collect the output with batch_collect_handler once the job finishes.
+    Bedrock requires at least 100 records per job; smaller sets should use
+    lambda_handler instead.
+
+    The Lambda function requires these permissions:
+    bedrock:CreateModelInvocationJob
+    iam:PassRole (for BEDROCK_BATCH_ROLE_ARN)
+    s3:GetObject
+    s3:PutObject
+    s3:DeleteObject
+
+    Example test event:
+    {
+      "promptsUri": "s3://your-batch-bucket/prompts/nightly.jsonl",
+      "system": "Answer in one paragraph.",
+      "maxTokens": 500
+    }
+    """
+    with span('client_init'):
+        bedrock = throttled_client('bedrock', context)
+        s3 = throttled_client('s3', context)
+
+    prompts_uri = event.get('promptsUri')
+    bucket = event.get('bucket') or BATCH_BUCKET or (s3_jsonl.parse_s3_uri(prompts_uri)[0] if prompts_uri else None)
+    role_arn = event.get('roleArn') or BATCH_ROLE_ARN
+    if not bucket or not role_arn:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'A bucket and a role ARN are required (event or BEDROCK_BATCH_* variables)'})
+        }
+    if not prompts_uri and not event.get('prompts'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Provide promptsUri or prompts'})
+        }
+
+    try:
+        if prompts_uri:
+            prompts = s3_jsonl.iter_jsonl(s3, *s3_jsonl.parse_s3_uri(prompts_uri))
+        else:
+            prompts = event['prompts']
+
+        name = bedrock_batch.job_name('bedrock-text')
+        prefix = f"bedrock-batch/{name}/"
+        records = bedrock_batch.batch_records(prompts, MODEL_ID, {
+            'system': event.get('system'),
+            'maxTokens': event.get('maxTokens', 1000),
+            'temperature': event.get('temperature', 0.7)
+        })
+
+        # Prompts are streamed straight into the shards, one part in memory at a time
+        with span('write_shards'):
+            shards = bedrock_batch.write_input_shards(s3, bucket, f"{prefix}input/", records)
+        record_count = sum(shard['records'] for shard in shards)
+
+        if record_count < bedrock_batch.MIN_RECORDS_PER_JOB:
+            for shard in shards:
+                s3.delete_object(Bucket=bucket, Key=shard['key'])
+            return {
+                'statusCode': 400,
+                'body': json.dumps({
+                    'error': f'Batch jobs need at least {bedrock_batch.MIN_RECORDS_PER_JOB} prompts, got {record_count}'
+                })
+            }
+
+        output_uri = f"s3://{bucket}/{prefix}output/"
+        job_arn = bedrock_batch.submit_job(
+            bedrock, name, MODEL_ID, role_arn, f"s3://{bucket}/{prefix}input/", output_uri
+        )
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'jobArn': job_arn,
+                'jobName': name,
+                'records': record_count,
+                'shards': len(shards),
+                'outputUri': output_uri
+            })
+        }
+
+    except Exception as e:
+        print(f"Error submitting batch job: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+
+@instrumented('bedrock_text_batch_collect', MODEL_ID)
+def batch_collect_handler(event, context):
+    """
+    Lambda function that collects the results of a Bedrock batch inference job.
+
+    This function:
+    1. Gets the job ARN from a "Batch Inference Job State Change" event or
+       a "jobArn" field (e.g. when invoked on a schedule to poll)
+    2. Returns the job status if the job has not finished
+    3. Otherwise streams every output .jsonl.out file line by line into
+       per-prompt result shards ({"recordId", "text", "inputTokens",
+       "outputTokens"} or {"recordId", "error"}) next to the job's output
+
+    The Lambda function requires these permissions:
+    bedrock:GetModelInvocationJob
+    s3:ListBucket
+    s3:GetObject
+    s3:PutObject
+
+    Example test event:
+    {
+      "jobArn": "arn:aws:bedrock:us-east-1:123456789012:model-invocation-job/abc123"
+    }
+    """
+    with span('client_init'):
+        bedrock = throttled_client('bedrock', context)
+        s3 = throttled_client('s3', context)
+
+    if 'detail' in event:
+        job_arn = event['detail']['batchJobArn']
+    else:
+        job_arn = event.get('jobArn')
+    if not job_arn:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'jobArn is required'})
+        }
+
+    try:
+        with span('get_job'):
+            job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+        status = job['status']
+
+        if status not in bedrock_batch.COLLECTABLE_STATUSES:
+            return {
+                'statusCode': 500 if status in bedrock_batch.TERMINAL_STATUSES else 202,
+                'body': json.dumps({
+                    'jobArn': job_arn,
+                    'jobStatus': status,
+                    'message': job.get('message')
+                })
+            }
+
+        bucket, output_prefix = s3_jsonl.parse_s3_uri(job['outputDataConfig']['s3OutputDataConfig']['s3Uri'])
+        base = output_prefix.rstrip('/')
+        if base.endswith('/output'):
+            # Jobs submitted by batch_submit_handler keep results beside input/ and output/
+            results_prefix = f"{base[:-len('output')]}results/"
+        else:
+            results_prefix = f"{base}/{bedrock_batch.job_id(job_arn)}/results/"
+
+        with span('collect_results'):
+            totals = bedrock_batch.collect_results(s3, bucket, output_prefix, job_arn, results_prefix)
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'jobArn': job_arn,
+                'jobStatus': status,
+                'succeeded': totals['succeeded'],
+                'failed': totals['failed'],
+                'inputTokens': totals['inputTokens'],
+                'outputTokens': totals['outputTokens'],
+                'resultsUri': f"s3://{bucket}/{results_prefix}",
+                'resultShards': [shard['key'] for shard in totals['shards']]
+            })
+        }
+
+    except Exception as e:
+        print(f"Error collecting batch job {job_arn}: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
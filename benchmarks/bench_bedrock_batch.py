@@ -0,0 +1,145 @@
+"""
+Benchmark: Bedrock batch mode end to end against the offline job stub.
+
+1. Runs batch_submit_handler and batch_collect_handler on the checked-in
+   prompt fixture (benchmarks/fixtures/bedrock_batch/prompts.jsonl) and
+   checks every prompt comes back, including the injected failures.
+2. Parses the recorded Bedrock output fixture (output.jsonl.out), which
+   holds Claude and Nova responses plus an error record.
+3. Submits and collects a generated prompt set of --prompts records and
+   reports time and the working memory (peak traced allocations minus the
+   bytes the fake S3 keeps), which stays flat as the set grows because
+   prompts, shards and results are streamed.
+
+Usage:
+    python benchmarks/bench_bedrock_batch.py [--prompts 100000] [--shard-records 50000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(BENCHMARKS, 'fixtures', 'bedrock_batch')
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+# Keep the per-invocation EMF lines out of the benchmark output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('BEDROCK_BATCH_ROLE_ARN', 'arn:aws:iam::123456789012:role/bedrock-batch')
+
+import fake_aws
+
+fake = fake_aws.install(fake_aws.Profile(latency_ms=0, jitter_ms=0, text_tokens=20, seed=0))
+
+import bedrock_batch
+import bedrock_text_lambda
+from s3_jsonl import iter_jsonl, parse_s3_uri
+
+BUCKET = 'batch-bucket'
+
+
+def fake_client(service_name):
+    return fake.client(service_name)
+
+
+def stored_bytes():
+    return sum(len(data) for data in fake.state.objects.values())
+
+
+def run(event, handler):
+    response = handler(event, fake_aws.FakeContext(timeout_ms=900000))
+    body = json.loads(response['body'])
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"{handler.__name__} returned {response['statusCode']}: {body}")
+    return body
+
+
+def submit_and_collect(prompts_uri):
+    submitted = run({'promptsUri': prompts_uri}, bedrock_text_lambda.batch_submit_handler)
+    collected = run({'jobArn': submitted['jobArn']}, bedrock_text_lambda.batch_collect_handler)
+    return submitted, collected
+
+
+def check_fixture_prompts():
+    with open(os.path.join(FIXTURES, 'prompts.jsonl'), 'rb') as f:
+        fake.state.objects[(BUCKET, 'prompts/fixture.jsonl')] = f.read()
+
+    submitted, collected = submit_and_collect(f"s3://{BUCKET}/prompts/fixture.jsonl")
+    bucket, results_prefix = parse_s3_uri(collected['resultsUri'])
+    results = {}
+    for key in collected['resultShards']:
+        for result in iter_jsonl(fake_client('s3'), bucket, key):
+            results[result['recordId']] = result
+
+    assert submitted['records'] == 100, submitted
+    assert collected['succeeded'] == 98 and collected['failed'] == 2, collected
+    assert sorted(id for id, result in results.items() if 'error' in result) == ['FIX00000017', 'FIX00000064']
+    print(f"fixture prompts:  {submitted['records']} records in {submitted['shards']} shard(s), "
+          f"{collected['succeeded']} succeeded, {collected['failed']} failed, results under {results_prefix}")
+
+
+def check_fixture_output():
+    job_arn = 'arn:aws:bedrock:us-east-1:123456789012:model-invocation-job/fixture'
+    with open(os.path.join(FIXTURES, 'output.jsonl.out'), 'rb') as f:
+        fake.state.objects[(BUCKET, 'recorded/output/fixture/prompts.jsonl.out')] = f.read()
+
+    results = list(bedrock_batch.iter_results(fake_client('s3'), BUCKET, 'recorded/output/', job_arn))
+    assert [result['recordId'] for result in results] == ['CALL0000001', 'CALL0000002', 'CALL0000003']
+    assert results[0]['text'].startswith('Water evaporates') and results[0]['outputTokens'] == 15
+    assert results[1]['text'] == '7' and results[1]['inputTokens'] == 5
+    assert 'non-empty' in results[2]['error']
+    print(f"fixture output:   parsed {len(results)} records (Claude, Nova, error)")
+
+
+def scale_run(count, shard_records):
+    bedrock_batch.MAX_RECORDS_PER_SHARD = shard_records
+    lines = (
+        json.dumps({'prompt': f"Write a haiku about the number {index}."}) + '\n'
+        for index in range(count)
+    )
+    fake.state.objects[(BUCKET, 'prompts/generated.jsonl')] = ''.join(lines).encode('utf-8')
+
+    tracemalloc.start()
+    before = stored_bytes()
+    start = time.perf_counter()
+    submitted = run({'promptsUri': f"s3://{BUCKET}/prompts/generated.jsonl"}, bedrock_text_lambda.batch_submit_handler)
+    submit_seconds = time.perf_counter() - start
+    _, submit_peak = tracemalloc.get_traced_memory()
+    submit_working = submit_peak - (stored_bytes() - before)
+
+    # Run the stub job outside the measurement; it is Bedrock's work, not ours
+    tracemalloc.stop()
+    fake_client('bedrock').get_model_invocation_job(jobIdentifier=submitted['jobArn'])
+
+    tracemalloc.start()
+    before = stored_bytes()
+    start = time.perf_counter()
+    collected = run({'jobArn': submitted['jobArn']}, bedrock_text_lambda.batch_collect_handler)
+    collect_seconds = time.perf_counter() - start
+    _, collect_peak = tracemalloc.get_traced_memory()
+    collect_working = collect_peak - (stored_bytes() - before)
+    tracemalloc.stop()
+
+    print(f"{count} prompts:  {submitted['shards']} shard(s)")
+    print(f"  submit   {submit_seconds:6.2f} s  {count / submit_seconds:9.0f} prompts/s  "
+          f"working memory {submit_working / 1e6:6.1f} MB")
+    print(f"  collect  {collect_seconds:6.2f} s  {count / collect_seconds:9.0f} results/s  "
+          f"working memory {collect_working / 1e6:6.1f} MB")
+    assert collected['succeeded'] == count, collected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--prompts', type=int, default=100000)
+    parser.add_argument('--shard-records', type=int, default=50000)
+    args = parser.parse_args()
+
+    check_fixture_prompts()
+    check_fixture_output()
+    scale_run(args.prompts, args.shard_records)
+
+
+if __name__ == '__main__':
+    main()
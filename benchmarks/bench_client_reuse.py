@@ -0,0 +1,78 @@
+"""
+Benchmark: per-request cost of creating boto3 clients vs reusing the
+container-wide clients from aws_clients.
+
+Each "request" builds the clients a handler needs and makes one stubbed API
+call, so the numbers isolate client construction (endpoint resolution, service
+model loading, connection pool setup) from network latency. Pass --live to
+make a real call instead and include the TLS handshake in the measurement.
+
+Usage:
+    python benchmarks/bench_client_reuse.py [--requests 200] [--live]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+from botocore.stub import Stubber
+
+import aws_clients
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+
+def _call(client, live):
+    if live:
+        client.list_languages(MaxResults=1)
+        return
+    with Stubber(client) as stubber:
+        stubber.add_response('list_languages', {'Languages': []})
+        client.list_languages(MaxResults=1)
+
+
+def fresh_client_request(live):
+    client = boto3.client('translate')
+    _call(client, live)
+
+
+def shared_client_request(live):
+    client = aws_clients.get_client('translate')
+    _call(client, live)
+
+
+def run(label, request, count, live):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        request(live)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<16} p50={p50:8.3f} ms  p99={p99:8.3f} ms")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--live', action='store_true', help='make real API calls')
+    args = parser.parse_args()
+
+    # Warm the shared client once, as the first invocation in a container would
+    shared_client_request(args.live)
+
+    fresh = run('fresh client', fresh_client_request, args.requests, args.live)
+    shared = run('shared client', shared_client_request, args.requests, args.live)
+    print(f"saved per warm request: {fresh - shared:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: document-to-speech as one pipeline vs three stages run back to back.
+
+The staged run mirrors chaining textract_lambda, translate_lambda and
+polly_lambda: every page is extracted, then every page translated, then
+every page synthesized. The pipelined run is document_speech_lambda,
+where the stages overlap page by page. Both use the fake AWS services with
+the given per-call latency; the pipeline's per-stage report is printed so
+the bottleneck stage is visible. The fake text detection job finishes at
+once, so neither run includes the job's own runtime, which the pipeline
+cannot overlap either: only reading the finished job's result pages does.
+
+Usage:
+    python benchmarks/bench_document_speech.py [--pages 20] [--latency-ms 40] [--synthesize-workers 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the per-invocation EMF lines out of the benchmark output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import fake_aws
+
+BUCKET = 'speech-bucket'
+RECORD = {'s3': {'bucket': {'name': 'documents'}, 'object': {'key': 'report.pdf'}}}
+OPTIONS = {
+    'bucket': BUCKET,
+    'mode': 'async',
+    'sourceLanguage': 'en',
+    'targetLanguage': 'es',
+    'voiceId': 'Mia',
+    'languageCode': 'es-MX',
+    'outputFormat': 'mp3'
+}
+
+
+def staged(clients):
+    import document_speech_lambda
+    from polly_lambda import synthesize_long_form
+    from translate_lambda import translate_document
+
+    textract, translate, polly, s3 = clients
+    concurrency = document_speech_lambda.CHUNK_CONCURRENCY
+    pages = list(document_speech_lambda.iter_document_pages(textract, 'documents', 'report.pdf'))
+    translated = [
+        (number, translate_document(translate, text, 'en', 'es', concurrency)[0])
+        for number, text in pages
+    ]
+    for number, text in translated:
+        synthesize_long_form(polly, s3, BUCKET, f"staged/page-{number:04d}.mp3", text,
+                             'Mia', 'mp3', 'es-MX', concurrency)
+    return len(translated)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--synthesize-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    fake_aws.install(fake_aws.Profile(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5,
+                                      pages=args.pages, blocks=100, seed=0))
+    import document_speech_lambda
+    from throttling import throttled_client
+
+    clients = tuple(throttled_client(service) for service in ('textract', 'translate', 'polly', 's3'))
+
+    start = time.perf_counter()
+    staged(clients)
+    staged_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    options = dict(OPTIONS, workers=document_speech_lambda.stage_workers({'synthesize': args.synthesize_workers}))
+    result = document_speech_lambda.document_to_speech(clients, RECORD, options)
+    pipelined_seconds = time.perf_counter() - start
+
+    print(f"{args.pages} pages, {args.latency_ms:g} ms per call")
+    print(f"  staged     {staged_seconds:7.2f} s")
+    print(f"  pipelined  {pipelined_seconds:7.2f} s  ({staged_seconds / pipelined_seconds:.1f}x)")
+    print(f"\n{'stage':<12}{'items':>7}{'busy s':>9}{'waiting s':>11}{'blocked s':>11}{'items/s':>9}{'util':>7}")
+    for name, stage in result['pipeline']['stages'].items():
+        print(f"{name:<12}{stage['items']:>7}{stage['busySeconds']:>9.2f}{stage['waitingSeconds']:>11.2f}"
+              f"{stage['blockedSeconds']:>11.2f}{stage['itemsPerSecond'] or 0:>9.1f}{stage['utilization']:>7.2f}")
+    print(f"bottleneck: {result['pipeline']['bottleneck']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: peak memory and time of decoding a Bedrock image response.
+
+Compares the original path (json.loads of the whole body, then
+base64.b64decode of the parsed string) with
+bedrock_image_lambda.decode_first_artifact, which decodes straight from the
+raw response bytes. Peak memory is measured with tracemalloc and covers
+only allocations made while decoding; the raw response body is allocated
+beforehand, as botocore would.
+
+Usage:
+    python benchmarks/bench_image_decode.py [--image-bytes 1500000] [--runs 20]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bedrock_image_lambda import decode_first_artifact
+
+
+def legacy_decode(raw):
+    response_body = json.loads(raw)
+    image_data = response_body['artifacts'][0]['base64']
+    return base64.b64decode(image_data)
+
+
+def make_response(image_bytes):
+    image = os.urandom(image_bytes)
+    body = {
+        'result': 'success',
+        'artifacts': [{
+            'seed': 42,
+            'base64': base64.b64encode(image).decode('ascii'),
+            'finishReason': 'SUCCESS'
+        }]
+    }
+    return json.dumps(body).encode('utf-8'), image
+
+
+def measure(label, decode, raw, expected, runs):
+    tracemalloc.start()
+    decoded = decode(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert decoded == expected
+    del decoded
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        decode(raw)
+    elapsed = (time.perf_counter() - start) / runs * 1000
+
+    print(f"{label:<10} peak={peak / 1024 / 1024:7.2f} MiB  time={elapsed:7.3f} ms")
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image-bytes', type=int, default=1500000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    raw, image = make_response(args.image_bytes)
+    print(f"response body: {len(raw) / 1024 / 1024:.2f} MiB, image: {len(image) / 1024 / 1024:.2f} MiB")
+
+    legacy = measure('legacy', legacy_decode, raw, image, args.runs)
+    lean = measure('lean', decode_first_artifact, raw, image, args.runs)
+    print(f"peak reduction: {(legacy - lean) / 1024 / 1024:.2f} MiB ({(1 - lean / legacy) * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: overhead of the metrics span API and per-invocation EMF flush.
+
+Times an empty span, a whole instrumented invocation with a typical number
+of spans (flushing to /dev/null), and the same handler undecorated.
+
+Usage:
+    python benchmarks/bench_metrics_overhead.py [--iterations 20000] [--spans 6]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--spans', type=int, default=6)
+    args = parser.parse_args()
+
+    phases = [f"phase_{index}" for index in range(args.spans)]
+
+    def handler(event, context):
+        for phase in phases:
+            with metrics.span(phase):
+                pass
+        return {'statusCode': 200}
+
+    instrumented = metrics.instrumented('benchmark', 'model-id')(handler)
+    recorder = metrics.InvocationMetrics('benchmark')
+
+    def empty_span():
+        with recorder.span('phase'):
+            pass
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        span_cost = per_call_us(empty_span, args.iterations)
+        plain = per_call_us(lambda: handler({}, None), args.iterations)
+        measured = per_call_us(lambda: instrumented({}, None), args.iterations)
+
+    print(f"span enter/exit:                 {span_cost:8.2f} us")
+    print(f"handler, no instrumentation:     {plain:8.2f} us")
+    print(f"handler, {args.spans} spans + EMF flush:    {measured:8.2f} us")
+    print(f"overhead per invocation:         {measured - plain:8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark: QR code throughput of batch mode vs one invocation per URL.
+
+Both paths run the real renderer against in-process fake S3 and DynamoDB
+clients that sleep for a configurable latency per call, so the numbers
+reflect request round trips rather than a real network. A share of the URLs
+is repeated to exercise deduplication.
+
+Usage:
+    python benchmarks/bench_qrcode_batch.py [--urls 500] [--latency-ms 15] [--duplicates 0.2]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'qr-code', 'python'))
+
+# Keep the per-invocation EMF lines out of the benchmark output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+from botocore.exceptions import ClientError
+
+import qrcode_lambda
+import throttling
+
+
+class FakeS3:
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = set()
+        self.lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        time.sleep(self.latency)
+        with self.lock:
+            self.objects.add(Key)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://{Params['Bucket']}.example/{Params['Key']}"
+
+
+class FakeTable:
+    def __init__(self, latency):
+        self.latency = latency
+        self.items = {}
+
+    def put_item(self, Item):
+        time.sleep(self.latency)
+        self.items[Item['id']] = Item
+
+    @contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        table = self
+        pending = []
+
+        class Writer:
+            def put_item(self, Item):
+                pending.append(Item)
+                # BatchWriteItem sends up to 25 items per request
+                if len(pending) == 25:
+                    flush()
+
+        def flush():
+            time.sleep(table.latency)
+            for item in pending:
+                table.items[item['id']] = item
+            pending.clear()
+
+        yield Writer()
+        if pending:
+            flush()
+
+
+class FakeDynamoDB:
+    def __init__(self, latency):
+        self.table = FakeTable(latency)
+
+    def Table(self, name):
+        return self.table
+
+
+def install_fakes(latency):
+    s3 = FakeS3(latency)
+    dynamodb = FakeDynamoDB(latency)
+    throttling.get_client = lambda *args, **kwargs: s3
+    qrcode_lambda.get_resource = lambda *args, **kwargs: dynamodb
+
+
+def make_urls(count, duplicates):
+    unique = [f"https://example.com/campaign/{index}" for index in range(count)]
+    return [random.choice(unique[:max(1, index)]) if random.random() < duplicates else url
+            for index, url in enumerate(unique)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=15)
+    parser.add_argument('--duplicates', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, default=qrcode_lambda.DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    random.seed(7)
+    urls = make_urls(args.urls, args.duplicates)
+    latency = args.latency_ms / 1000
+
+    install_fakes(latency)
+    start = time.perf_counter()
+    for url in urls:
+        response = qrcode_lambda.lambda_handler({'url': url, 'bucket': 'bench', 'tableName': 'bench'}, None)
+        assert response['statusCode'] == 200
+    single = time.perf_counter() - start
+
+    install_fakes(latency)
+    start = time.perf_counter()
+    response = qrcode_lambda.lambda_handler({
+        'urls': urls,
+        'bucket': 'bench',
+        'tableName': 'bench',
+        'concurrency': args.concurrency
+    }, None)
+    batch = time.perf_counter() - start
+    results = json.loads(response['body'])['results']
+    assert all(result['success'] for result in results)
+
+    print(f"urls: {len(urls)} ({len(set(urls))} unique), latency per call: {args.latency_ms} ms")
+    print(f"one at a time: {single:7.2f} s  {len(urls) / single:8.1f} codes/s")
+    print(f"batch:         {batch:7.2f} s  {len(urls) / batch:8.1f} codes/s")
+    print(f"speedup: {single / batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
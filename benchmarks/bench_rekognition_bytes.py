@@ -0,0 +1,170 @@
+"""
+Benchmark: Rekognition S3-object mode vs bytes mode with local downscaling.
+
+For each image size (in megapixels) a synthetic photo-like JPEG is
+analyzed by rekognition_lambda in both modes, reporting end-to-end latency
+per image, the bytes read from S3 and the bytes sent to Rekognition.
+
+Offline (the default) the images live in the fake S3 and detect_labels
+costs --latency-ms regardless of image size, so the numbers show what bytes
+mode adds locally (ranged read, decode, resize, re-encode) but not the time
+Rekognition saves on smaller images, and the fake labels are the same in
+both modes.
+
+With --live the given keys of a real bucket are analyzed with real AWS
+credentials, and the labels of the two modes are compared: labels found by
+both, the mean and largest absolute confidence difference, and labels only
+one mode found. Use real photos of the sizes you expect; synthetic images
+give meaningless labels.
+
+Usage:
+    python benchmarks/bench_rekognition_bytes.py [--sizes 1,4,12,24] [--latency-ms 150] [--repeat 3]
+    python benchmarks/bench_rekognition_bytes.py --live --bucket my-images --keys a.jpg,b.jpg [--max-dimension 1600]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the per-invocation EMF lines out of the benchmark output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import fake_aws
+
+BUCKET = 'benchmark-images'
+
+
+def synthetic_jpeg(megapixels, seed=0):
+    """
+    A 3:2 JPEG with smooth gradients and fine noise, which compresses
+    about as well as a camera photo.
+    """
+    from PIL import Image, ImageChops
+
+    width = int((megapixels * 1e6 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 24 + seed)
+    image = Image.merge('RGB', (
+        gradient,
+        ImageChops.add(gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), noise, scale=2),
+        noise
+    ))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def analyze(key, mode, max_dimension):
+    import rekognition_lambda
+
+    event = {
+        'mode': mode,
+        'maxDimension': max_dimension,
+        'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}]
+    }
+    start = time.perf_counter()
+    response = rekognition_lambda.lambda_handler(event, fake_aws.FakeContext())
+    elapsed = time.perf_counter() - start
+    result = json.loads(response['body'])['results'][0]
+    if 'error' in result:
+        raise RuntimeError(f"{key} ({mode}): {result['error']}")
+    return elapsed, result
+
+
+def timed(key, mode, max_dimension, repeat):
+    runs = [analyze(key, mode, max_dimension) for _ in range(repeat)]
+    return statistics.median(elapsed for elapsed, _ in runs), runs[-1][1]
+
+
+def compare_labels(s3_labels, bytes_labels):
+    s3_confidence = {label['name']: label['confidence'] for label in s3_labels}
+    bytes_confidence = {label['name']: label['confidence'] for label in bytes_labels}
+    common = s3_confidence.keys() & bytes_confidence.keys()
+    differences = [abs(s3_confidence[name] - bytes_confidence[name]) for name in common]
+    return {
+        'common': len(common),
+        'meanDifference': statistics.mean(differences) if differences else None,
+        'maxDifference': max(differences) if differences else None,
+        'onlyS3': sorted(s3_confidence.keys() - common),
+        'onlyBytes': sorted(bytes_confidence.keys() - common)
+    }
+
+
+def print_row(label, s3_seconds, bytes_seconds, sent):
+    sent_bytes = sent.get('sentBytes', sent['originalBytes'])
+    read_bytes = sent['originalBytes'] if sent['source'] == 'bytes' else 64 * 1024
+    print(f"{label:<24}{s3_seconds * 1000:>10.1f}{bytes_seconds * 1000:>10.1f}"
+          f"{sent['originalBytes'] / 1e6:>11.2f}{min(read_bytes, sent['originalBytes']) / 1e6:>10.2f}"
+          f"{sent_bytes / 1e6:>10.2f}  {sent['source']}")
+
+
+def header():
+    print(f"{'image':<24}{'s3 ms':>10}{'bytes ms':>10}{'object MB':>11}{'read MB':>10}{'sent MB':>10}  sent as")
+
+
+def run_offline(args):
+    fake = fake_aws.install(fake_aws.Profile(latency_ms=args.latency_ms, jitter_ms=0, seed=0))
+
+    print(f"detect_labels {args.latency_ms:g} ms per call (not size-dependent), "
+          f"max dimension {args.max_dimension}, median of {args.repeat}")
+    header()
+    for megapixels in args.sizes:
+        key = f"synthetic-{megapixels:g}mp.jpg"
+        fake.state.objects[(BUCKET, key)] = synthetic_jpeg(megapixels)
+        s3_seconds, _ = timed(key, 's3', args.max_dimension, args.repeat)
+        bytes_seconds, result = timed(key, 'bytes', args.max_dimension, args.repeat)
+        width, height = result['imageSent']['originalSize']
+        print_row(f"{megapixels:g} MP ({width}x{height})", s3_seconds, bytes_seconds, result['imageSent'])
+    print("\nLabel confidences are only comparable against the real service; run with --live.")
+
+
+def run_live(args):
+    global BUCKET
+    BUCKET = args.bucket
+
+    print(f"max dimension {args.max_dimension}, median of {args.repeat}")
+    header()
+    comparisons = []
+    for key in args.keys:
+        s3_seconds, s3_result = timed(key, 's3', args.max_dimension, args.repeat)
+        bytes_seconds, bytes_result = timed(key, 'bytes', args.max_dimension, args.repeat)
+        print_row(key[-24:], s3_seconds, bytes_seconds, bytes_result['imageSent'])
+        comparisons.append((key, compare_labels(s3_result['labels'], bytes_result['labels'])))
+
+    print(f"\n{'image':<24}{'common':>8}{'mean diff':>11}{'max diff':>10}  only s3 / only bytes")
+    for key, comparison in comparisons:
+        mean = comparison['meanDifference']
+        largest = comparison['maxDifference']
+        print(f"{key[-24:]:<24}{comparison['common']:>8}"
+              f"{'-' if mean is None else f'{mean:.2f}':>11}{'-' if largest is None else f'{largest:.2f}':>10}"
+              f"  {', '.join(comparison['onlyS3']) or '-'} / {', '.join(comparison['onlyBytes']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1,4,12,24',
+                        type=lambda value: [float(size) for size in value.split(',')])
+    parser.add_argument('--latency-ms', type=float, default=150)
+    parser.add_argument('--max-dimension', type=int, default=1600)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--live', action='store_true')
+    parser.add_argument('--bucket')
+    parser.add_argument('--keys', type=lambda value: value.split(','))
+    args = parser.parse_args()
+
+    if args.live:
+        if not args.bucket or not args.keys:
+            parser.error('--live needs --bucket and --keys')
+        run_live(args)
+    else:
+        run_offline(args)
+
+
+if __name__ == '__main__':
+    main()
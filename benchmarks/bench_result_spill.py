@@ -0,0 +1,94 @@
+"""
+Benchmark: peak memory of building a large handler response.
+
+Produces --records results of about --record-kb KB each (like Textract
+pages of text) one at a time, as the handlers' bounded_imap loop does, and
+builds the response three ways:
+
+1. the previous approach: collect every result dict, then json.dumps the
+   whole {"message", "results"} body
+2. SpillingResults without a bucket: results are serialized as they arrive
+   and the body is joined from the serialized pieces
+3. SpillingResults with a bucket: past the threshold, results stream as
+   compressed JSON Lines into (fake) S3 and the body is a manifest
+
+Peak traced allocations exclude the bytes the fake S3 keeps.
+
+Usage:
+    python benchmarks/bench_result_spill.py [--records 200] [--record-kb 50] [--compression gzip]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the per-invocation EMF lines out of the benchmark output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import fake_aws
+
+fake = fake_aws.install(fake_aws.Profile(latency_ms=0, jitter_ms=0, seed=0))
+
+import json
+
+from result_spill import SpillingResults
+
+BUCKET = 'spill-bucket'
+
+
+def results(count, record_kb):
+    line = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. '
+    lines = range(record_kb * 1024 // (len(line) + 12))
+    for index in range(count):
+        # Every result gets its own text, as separate documents would
+        text = '\n'.join(f"{index}.{number}: {line}" for number in lines)
+        yield {'documentLocation': f"s3://documents/file-{index}.pdf", 'extractedText': text}
+
+
+def collect_then_dump(count, record_kb):
+    collected = list(results(count, record_kb))
+    return json.dumps({'message': f'Processed {len(collected)} document(s)', 'results': collected})
+
+
+def serialize_incrementally(count, record_kb, bucket, compression):
+    spilled = SpillingResults('benchmark', bucket, fake_aws.FakeContext(), compression=compression)
+    for result in results(count, record_kb):
+        spilled.add(result)
+    return spilled.body(f'Processed {spilled.count} document(s)')
+
+
+def stored_bytes():
+    return sum(len(data) for data in fake.state.objects.values())
+
+
+def measure(label, build):
+    tracemalloc.start()
+    before = stored_bytes()
+    start = time.perf_counter()
+    body = build()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    working = peak - (stored_bytes() - before)
+    print(f"{label:<32}{elapsed * 1000:>10.1f}{working / 1e6:>12.1f}{len(body) / 1e6:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--record-kb', type=int, default=50)
+    parser.add_argument('--compression', default='gzip', choices=('gzip', 'zstd'))
+    args = parser.parse_args()
+
+    print(f"{'approach':<32}{'ms':>10}{'peak MB':>12}{'body MB':>12}")
+    measure('collect + json.dumps', lambda: collect_then_dump(args.records, args.record_kb))
+    measure('incremental, inline', lambda: serialize_incrementally(args.records, args.record_kb, None, None))
+    measure(f'incremental, spilled ({args.compression})',
+            lambda: serialize_incrementally(args.records, args.record_kb, BUCKET, args.compression))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: resolving tables and forms from large AnalyzeDocument block sets.
+
+For synthetic block sets of increasing size (see fake_aws.analysis_blocks),
+times BlockGraph resolving every table, key/value pair and the line
+layout, against a per-reference scan of the block list (what resolving
+relationships without an Id index costs). Both must produce the same
+tables and forms; the blocks are shuffled first since Textract does not
+promise parents before children. Also compares the JSON size of the
+columnar layout with one dict per line.
+
+Usage:
+    python benchmarks/bench_textract_blocks.py [--sizes 1000,10000,100000] [--scan-max 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_aws import analysis_blocks
+from textract_blocks import BlockGraph
+
+
+class ScanGraph(BlockGraph):
+    """
+    BlockGraph that looks every related block up by scanning the block list.
+    """
+
+    def __init__(self, blocks):
+        super().__init__(blocks)
+        self.block_list = list(blocks)
+
+    def related(self, block, relationship_type):
+        for relationship in block.get('Relationships', ()):
+            if relationship['Type'] != relationship_type:
+                continue
+            for block_id in relationship['Ids']:
+                yield next(candidate for candidate in self.block_list if candidate['Id'] == block_id)
+
+
+def blocks_for(size, columns=10):
+    """
+    About size blocks: a quarter in tables (one per 2,000 blocks), a quarter
+    in form fields and the rest in lines.
+    """
+    tables = max(1, size // 2000)
+    rows = max(1, size // 8 // tables // columns)
+    pairs = size // 16
+    used = 1 + tables * (1 + 2 * rows * columns) + 4 * pairs
+    blocks = analysis_blocks(tables=tables, rows=rows, columns=columns, pairs=pairs,
+                             lines=max(0, (size - used) // 2))
+    random.Random(size).shuffle(blocks)
+    return blocks
+
+
+def resolve(graph_class, blocks):
+    start = time.perf_counter()
+    graph = graph_class(blocks)
+    output = {'tables': graph.tables(), 'forms': graph.forms(), 'layout': graph.layout()}
+    return output, time.perf_counter() - start
+
+
+def per_line_layout(blocks):
+    return [
+        {
+            'text': block['Text'],
+            'page': block['Page'],
+            'confidence': block['Confidence'],
+            'geometry': block['Geometry']
+        }
+        for block in blocks if block['BlockType'] == 'LINE'
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated approximate block counts')
+    parser.add_argument('--scan-max', type=int, default=20000,
+                        help='Largest block set to also resolve by scanning')
+    args = parser.parse_args()
+
+    print(f"{'blocks':>8}{'indexed ms':>12}{'scan ms':>12}{'speedup':>9}"
+          f"{'columnar KB':>13}{'per-line KB':>13}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        blocks = blocks_for(size)
+        output, indexed = resolve(BlockGraph, blocks)
+
+        scan_ms, speedup = '-', '-'
+        if len(blocks) <= args.scan_max:
+            scanned, scan = resolve(ScanGraph, blocks)
+            assert scanned['tables'] == output['tables'] and scanned['forms'] == output['forms']
+            scan_ms, speedup = f"{scan * 1000:.1f}", f"{scan / indexed:.0f}x"
+
+        columnar = len(json.dumps(output['layout'], separators=(',', ':')))
+        per_line = len(json.dumps(per_line_layout(blocks), separators=(',', ':')))
+        print(f"{len(blocks):>8}{indexed * 1000:>12.1f}{scan_ms:>12}{speedup:>9}"
+              f"{columnar / 1024:>13.1f}{per_line / 1024:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
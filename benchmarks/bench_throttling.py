@@ -0,0 +1,147 @@
+"""
+Benchmark: the shared retry layer against a local stub that injects throttles.
+
+The stub service admits a fixed number of requests per second, per model,
+and raises ThrottlingException for anything above that. The same burst of
+calls is sent once straight to the stub (what the handlers did before:
+the first throttle is a failure) and once through throttling.ThrottledClient.
+Reports success rate, wall time, throttles seen and the rate each limiter
+adapted to, and exits non-zero unless every call succeeded and each
+throttled model's adapted rate is at most twice its quota (a model that
+was never throttled stays unlimited).
+
+A second burst goes to a model whose quota is never reached, to check that
+the retry layer then does not limit at all: its limiter must stay
+unlimited and the burst must take about as long as the direct calls.
+
+Usage:
+    python benchmarks/bench_throttling.py [--calls 400] [--quota 40] [--workers 16]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botocore.exceptions import ClientError
+
+import throttling
+
+
+class ThrottlingStub:
+    """
+    Fake bedrock-runtime client with a per-model requests/second quota.
+    """
+
+    def __init__(self, quota_per_model, latency):
+        self.quota = quota_per_model
+        self.latency = latency
+        self.windows = {}
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        now = time.monotonic()
+        with self.lock:
+            # Sliding one-second window of admitted requests for this model
+            window = [t for t in self.windows.get(modelId, []) if now - t < 1]
+            if len(window) >= self.quota[modelId]:
+                self.windows[modelId] = window
+                self.throttled += 1
+                raise ClientError(
+                    {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                    'InvokeModel'
+                )
+            window.append(now)
+            self.windows[modelId] = window
+        time.sleep(self.latency)
+        return {'body': b'{}'}
+
+
+class Context:
+    def __init__(self, timeout_ms):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+# The retry layer may add this much wall time to an unthrottled burst
+UNTHROTTLED_OVERHEAD = 1.25
+
+
+def run(label, client, models, calls, workers):
+    def call(index):
+        try:
+            client.invoke_model(modelId=models[index % len(models)], body='{}')
+            return True
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} succeeded {sum(outcomes)}/{calls}  in {elapsed:6.2f} s")
+    return sum(outcomes), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--quota', type=int, default=40, help='requests/second for the first model')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--timeout-ms', type=int, default=60000)
+    args = parser.parse_args()
+
+    # Two models with different quotas show the per-model adaptation
+    models = ['model-a', 'model-b']
+    quota = {'model-a': args.quota, 'model-b': max(1, args.quota // 4)}
+    latency = args.latency_ms / 1000
+
+    stub = ThrottlingStub(quota, latency)
+    run('direct', stub, models, args.calls, args.workers)
+    print(f"{'':<12} throttles: {stub.throttled}")
+
+    stub = ThrottlingStub(quota, latency)
+    client = throttling.ThrottledClient(stub, 'bedrock-runtime', Context(args.timeout_ms))
+    succeeded, _ = run('retry layer', client, models, args.calls, args.workers)
+    print(f"{'':<12} throttles: {stub.throttled}")
+    failures = [] if succeeded == args.calls else [f"retry layer: {args.calls - succeeded} call(s) failed"]
+    stats = throttling.limiter_stats()
+    for model in models:
+        limiter = stats[f"bedrock-runtime:{model}"]
+        rate = limiter['rate']
+        print(f"{'':<12} {model}: quota {quota[model]}/s, adapted rate "
+              f"{'unlimited' if rate is None else f'{rate}/s'}, throttle rate {limiter['throttleRate']:.1%}")
+        if limiter['throttles'] and (rate is None or rate > 2 * quota[model]):
+            failures.append(f"{model}: adapted rate {rate} does not track its {quota[model]}/s quota")
+
+    # A quota the burst never reaches: the layer should not slow it down
+    unthrottled = {'model-unthrottled': args.calls * 10}
+    direct_succeeded, direct_seconds = run('direct', ThrottlingStub(unthrottled, latency),
+                                           list(unthrottled), args.calls, args.workers)
+    client = throttling.ThrottledClient(ThrottlingStub(unthrottled, latency), 'bedrock-runtime',
+                                        Context(args.timeout_ms))
+    layer_succeeded, layer_seconds = run('retry layer', client, list(unthrottled), args.calls, args.workers)
+    rate = throttling.limiter_stats()['bedrock-runtime:model-unthrottled']['rate']
+    print(f"{'':<12} model-unthrottled: quota never reached, limiter "
+          f"{'unlimited' if rate is None else f'limited to {rate}/s'}, "
+          f"{layer_seconds / direct_seconds:.2f}x the direct time")
+    if rate is not None or layer_seconds > direct_seconds * UNTHROTTLED_OVERHEAD:
+        failures.append('model-unthrottled: the retry layer limited a burst that was never throttled')
+
+    if failures:
+        print('\nFailed:')
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
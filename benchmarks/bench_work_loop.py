@@ -0,0 +1,152 @@
+"""
+Benchmark: a record batch larger than one invocation can finish.
+
+rekognition_lambda gets --records images with a --timeout-ms function
+timeout and detect_labels taking --latency-ms, so one invocation can only
+analyze part of the batch.
+
+1. Previous behaviour: records are analyzed until the timeout kills the
+   invocation, and Lambda's asynchronous retries (two by default) start
+   the whole batch again each time.
+2. Work loop: the handler stops starting records before the deadline and
+   re-invokes itself with the unstarted remainder; those invocations are
+   run one after another until none is left. With --checkpoint, the
+   invocation is also retried once as if it had failed after returning,
+   and the completed records are skipped.
+
+Reports invocations, detect_labels calls, and records left unanalyzed.
+Then checks that when the re-enqueueing Invoke fails, the handler raises
+work_loop.ResumeError instead of returning with the remainder dropped, and
+exits non-zero if it does not.
+
+Usage:
+    python benchmarks/bench_work_loop.py [--records 200] [--timeout-ms 3000] [--latency-ms 100] [--concurrency 4] [--checkpoint]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the per-invocation EMF lines out of the benchmark output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import fake_aws
+
+# Lambda retries a failed asynchronous invocation twice
+ASYNC_ATTEMPTS = 3
+
+
+def records(count):
+    return [
+        {'s3': {'bucket': {'name': 'images'}, 'object': {'key': f"batch/image-{index}.jpg"}}}
+        for index in range(count)
+    ]
+
+
+def previous(batch, timeout_ms, concurrency):
+    """
+    Analyze until the invocation would be killed, then retry from scratch.
+    """
+    from concurrency import bounded_imap
+    from rekognition_lambda import analyze_record
+    from throttling import throttled_client
+
+    rekognition = throttled_client('rekognition')
+    calls = 0
+    for attempt in range(1, ASYNC_ATTEMPTS + 1):
+        context = fake_aws.FakeContext(timeout_ms)
+        finished = 0
+        for _ in bounded_imap(lambda record: analyze_record(rekognition, record), batch, concurrency, context):
+            if context.get_remaining_time_in_millis() == 0:
+                # Killed: results of this attempt are lost
+                break
+            finished += 1
+        calls += finished
+        if finished == len(batch):
+            return attempt, calls, 0
+    return ASYNC_ATTEMPTS, calls, len(batch)
+
+
+def work_loop(fake, batch, timeout_ms, concurrency, checkpoint):
+    import rekognition_lambda
+
+    events = [{'concurrency': concurrency, 'Records': batch}]
+    if checkpoint:
+        # The first invocation is retried once after it returns
+        events.append(events[0])
+    invocations = calls = 0
+    analyzed = set()
+    while events:
+        event = events.pop(0)
+        body = json.loads(rekognition_lambda.lambda_handler(event, fake_aws.FakeContext(timeout_ms))['body'])
+        invocations += 1
+        calls += len(body['results'])
+        analyzed.update(result['imageLocation'] for result in body['results'])
+        # Run the invocations the handler queued for its remainder
+        while fake.state.invocations:
+            events.append(fake.state.invocations.pop(0)[2])
+    return invocations, calls, len(batch) - len(analyzed)
+
+
+def invoke_failure(batch, timeout_ms, concurrency):
+    """
+    Run the batch with every Invoke failing; return the ResumeError raised, or None.
+    """
+    import rekognition_lambda
+    from work_loop import ResumeError
+
+    def failing_invoke(self, **kwargs):
+        raise fake_aws._client_error('ServiceException', 'Invoke')
+
+    original = fake_aws.FakeClient._lambda_invoke
+    fake_aws.FakeClient._lambda_invoke = failing_invoke
+    try:
+        rekognition_lambda.lambda_handler({'concurrency': concurrency, 'Records': batch},
+                                          fake_aws.FakeContext(timeout_ms))
+    except ResumeError as e:
+        return e
+    finally:
+        fake_aws.FakeClient._lambda_invoke = original
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--timeout-ms', type=int, default=3000)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--checkpoint', action='store_true')
+    args = parser.parse_args()
+
+    if args.checkpoint:
+        # Checkpoints go to the fake DynamoDB table
+        os.environ['CHECKPOINT_TABLE'] = 'benchmark-checkpoints'
+    fake = fake_aws.install(fake_aws.Profile(latency_ms=args.latency_ms, jitter_ms=0, seed=0))
+    batch = records(args.records)
+
+    print(f"{args.records} records, {args.timeout_ms} ms timeout, {args.latency_ms:g} ms per call, "
+          f"concurrency {args.concurrency}")
+    print(f"{'approach':<28}{'invocations':>12}{'calls':>8}{'unanalyzed':>12}{'s':>8}")
+    for label, run in (
+        ('kill + retry whole batch', lambda: previous(batch, args.timeout_ms, args.concurrency)),
+        ('work loop' + (' + checkpoints' if args.checkpoint else ''),
+         lambda: work_loop(fake, batch, args.timeout_ms, args.concurrency, args.checkpoint))
+    ):
+        start = time.perf_counter()
+        invocations, calls, unanalyzed = run()
+        print(f"{label:<28}{invocations:>12}{calls:>8}{unanalyzed:>12}{time.perf_counter() - start:>8.1f}")
+
+    error = invoke_failure(batch, args.timeout_ms, args.concurrency)
+    if error is None:
+        print('\nInvoke failing: the handler returned and the remaining records were dropped')
+        return 1
+    print(f"\nInvoke failing: raised ResumeError ({error})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
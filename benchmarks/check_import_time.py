@@ -0,0 +1,123 @@
+"""
+Benchmark: cold import cost of every handler module, checked against baselines.
+
+Runs `python -X importtime -c "import <handler>"` in a fresh interpreter
+for each handler and compares the result with the report checked in under
+benchmarks/importtime/. A handler regresses when it imports a top-level
+package its baseline did not (e.g. boto3 creeping back into module scope),
+or when its median cumulative import time grows by more than the tolerance.
+
+Usage:
+    python benchmarks/check_import_time.py [--only polly_lambda] [--runs 5] [--tolerance 0.5] [--update]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'importtime')
+
+# module -> directory it is deployed from
+HANDLERS = {
+    'bedrock_image_lambda': '',
+    'bedrock_nova_lambda': '',
+    'bedrock_text_lambda': '',
+    'document_speech_lambda': '',
+    'polly_lambda': '',
+    'rekognition_lambda': '',
+    'textract_lambda': '',
+    'transcribe_lambda': '',
+    'translate_lambda': '',
+    'qrcode_lambda': os.path.join('qr-code', 'python'),
+}
+
+# Growth in microseconds below which a change is treated as noise
+NOISE_FLOOR_US = 20000
+
+
+def import_report(module):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (os.path.join(ROOT, HANDLERS[module]), ROOT, env.get('PYTHONPATH')) if path
+    )
+    # Priming during import would measure client creation, not imports
+    env['PRIME_ON_INIT'] = 'false'
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return ''.join(line + '\n' for line in output.stderr.splitlines() if line.startswith('import time:'))
+
+
+def parse_report(report):
+    """
+    Return (cumulative microseconds of the handler module, top-level packages imported).
+    """
+    cumulative = {}
+    packages = set()
+    for line in report.splitlines()[1:]:
+        _, _, cumulative_us, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        cumulative[name] = int(cumulative_us)
+        packages.add(name.split('.')[0])
+    return cumulative, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', help='Comma-separated handler modules')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed relative growth of cumulative import time')
+    parser.add_argument('--update', action='store_true', help='Rewrite the checked-in reports')
+    args = parser.parse_args()
+
+    modules = args.only.split(',') if args.only else list(HANDLERS)
+    unknown = [module for module in modules if module not in HANDLERS]
+    if unknown:
+        parser.error(f"Unknown handler(s): {', '.join(unknown)}")
+
+    failures = []
+    print(f"{'handler':<24}{'median ms':>11}{'baseline ms':>13}{'packages':>10}")
+    for module in modules:
+        reports = [import_report(module) for _ in range(args.runs)]
+        timings = [parse_report(report)[0][module] for report in reports]
+        median_us = statistics.median(timings)
+        # Keep the run closest to the median as the representative report
+        report = reports[min(range(len(timings)), key=lambda index: abs(timings[index] - median_us))]
+        _, packages = parse_report(report)
+
+        path = os.path.join(REPORTS, f"{module}.txt")
+        baseline_us = None
+        if os.path.exists(path) and not args.update:
+            with open(path) as f:
+                baseline_timings, baseline_packages = parse_report(f.read())
+            baseline_us = baseline_timings[module]
+            for package in sorted(packages - baseline_packages):
+                failures.append(f"{module} now imports {package}")
+            if median_us > baseline_us + max(baseline_us * args.tolerance, NOISE_FLOOR_US):
+                failures.append(f"{module} import time {median_us / 1000:.1f} ms vs baseline {baseline_us / 1000:.1f} ms")
+
+        baseline = f"{baseline_us / 1000:.1f}" if baseline_us is not None else '-'
+        print(f"{module:<24}{median_us / 1000:>11.1f}{baseline:>13}{len(packages):>10}")
+
+        if args.update:
+            os.makedirs(REPORTS, exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(report)
+
+    if args.update:
+        print(f"Reports written to {os.path.relpath(REPORTS, ROOT)}")
+        return 0
+    if failures:
+        print('\nRegressions:')
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print('\nNo regressions against baselines')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,566 @@
+"""
+In-process fake AWS services for offline benchmarks.
+
+install() swaps the boto3 module used by aws_clients for a fake whose
+clients and resources answer every operation the handlers use. Each call
+sleeps for a configurable latency and can fail with a configurable error or
+throttle rate, and responses are padded to configurable payload sizes, so
+handlers can be exercised end to end without network access or credentials.
+"""
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+
+class Profile:
+    """
+    Behaviour of the fake services.
+
+    latency_ms/jitter_ms: per-call delay, uniformly jittered
+    error_rate: share of calls failing with InternalServerError
+    throttle_rate: share of calls failing with ThrottlingException
+    text_tokens: words in generated text responses
+    image_bytes: decoded size of generated images
+    blocks: Textract blocks per page
+    pages: Textract pages per asynchronous job
+    audio_bytes: bytes of synthesized audio per request
+    """
+
+    def __init__(self, latency_ms=5, jitter_ms=1, error_rate=0.0, throttle_rate=0.0,
+                 text_tokens=200, image_bytes=400000, blocks=200, pages=3, audio_bytes=64000,
+                 seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.text_tokens = text_tokens
+        self.image_bytes = image_bytes
+        self.blocks = blocks
+        self.pages = pages
+        self.audio_bytes = audio_bytes
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+
+class FakeStreamingBody(io.BytesIO):
+    """
+    Minimal stand-in for botocore's StreamingBody.
+    """
+
+
+def _client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': f'Injected {code}'}}, operation)
+
+
+def _geometry(index):
+    top = (index % 100) / 100
+    return {'BoundingBox': {'Left': 0.1, 'Top': top, 'Width': 0.3, 'Height': 0.0098}}
+
+
+def analysis_blocks(tables=1, rows=10, columns=5, pairs=20, lines=50, page=1):
+    """
+    Synthetic AnalyzeDocument blocks: a PAGE, LINEs with WORD children,
+    TABLEs of CELLs holding one WORD each, and KEY/VALUE KEY_VALUE_SET pairs.
+
+    Every block carries geometry and confidence like the real response, and
+    the returned list counts 1 + 2*lines + tables*(1 + 2*rows*columns)
+    + 4*pairs blocks.
+    """
+    blocks = []
+    counter = iter(range(10 ** 9))
+
+    def add(block_type, **fields):
+        index = next(counter)
+        block = {'BlockType': block_type, 'Id': f"{page}-{index}", 'Page': page,
+                 'Confidence': 99.0 - (index % 7) * 0.13, 'Geometry': _geometry(index)}
+        block.update(fields)
+        blocks.append(block)
+        return block
+
+    def word(text):
+        return add('WORD', Text=text, TextType='PRINTED')
+
+    def children(*ids):
+        return [{'Type': 'CHILD', 'Ids': list(ids)}]
+
+    page_block = add('PAGE')
+    top_level = []
+    for index in range(lines):
+        line_word = word(f"line-{index}")
+        top_level.append(add('LINE', Text=f"line-{index}", Relationships=children(line_word['Id']))['Id'])
+
+    for table_index in range(tables):
+        cell_ids = []
+        for row in range(1, rows + 1):
+            for column in range(1, columns + 1):
+                cell_word = word(f"t{table_index}r{row}c{column}")
+                cell = add('CELL', RowIndex=row, ColumnIndex=column, RowSpan=1, ColumnSpan=1,
+                           Relationships=children(cell_word['Id']))
+                cell_ids.append(cell['Id'])
+        top_level.append(add('TABLE', Relationships=children(*cell_ids))['Id'])
+
+    for pair in range(pairs):
+        value_word = word(f"value-{pair}")
+        value = add('KEY_VALUE_SET', EntityTypes=['VALUE'], Relationships=children(value_word['Id']))
+        key_word = word(f"key-{pair}:")
+        add('KEY_VALUE_SET', EntityTypes=['KEY'],
+            Relationships=[{'Type': 'VALUE', 'Ids': [value['Id']]}] + children(key_word['Id']))
+
+    page_block['Relationships'] = children(*top_level)
+    return blocks
+
+
+class FakeClient:
+    def __init__(self, service_name, profile, state):
+        self.service_name = service_name
+        self.profile = profile
+        self.state = state
+
+    def _delay_and_fail(self, operation):
+        profile = self.profile
+        with profile.lock:
+            roll = profile.random.random()
+            jitter = profile.random.uniform(-profile.jitter_ms, profile.jitter_ms)
+        time.sleep(max(0.0, profile.latency_ms + jitter) / 1000)
+        if roll < profile.throttle_rate:
+            raise _client_error('ThrottlingException', operation)
+        if roll < profile.throttle_rate + profile.error_rate:
+            raise _client_error('InternalServerError', operation)
+
+    def __getattr__(self, name):
+        handler = getattr(self, f"_{self.service_name.replace('-', '_')}_{name}", None)
+        if handler is None:
+            raise AttributeError(f"Fake {self.service_name} client has no operation {name}")
+
+        def call(*args, **kwargs):
+            self._delay_and_fail(name)
+            return handler(*args, **kwargs)
+        return call
+
+    # Non-API helpers answer instantly
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600):
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+    # bedrock-runtime
+
+    def _words(self):
+        return ' '.join('token' for _ in range(self.profile.text_tokens))
+
+    def _bedrock_runtime_invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        if modelId.startswith('stability.'):
+            image = os.urandom(self.profile.image_bytes)
+            payload = {
+                'result': 'success',
+                'artifacts': [{'seed': 42, 'base64': base64.b64encode(image).decode('ascii'), 'finishReason': 'SUCCESS'}]
+            }
+        elif 'prompt' in request:
+            payload = {'completion': self._words(), 'stop_reason': 'stop_sequence'}
+        else:
+            payload = {
+                'content': [{'type': 'text', 'text': self._words()}],
+                'usage': {'input_tokens': 10, 'output_tokens': self.profile.text_tokens}
+            }
+        return {'body': FakeStreamingBody(json.dumps(payload).encode('utf-8'))}
+
+    def _bedrock_runtime_invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        profile = self.profile
+
+        def events():
+            for _ in range(profile.text_tokens):
+                time.sleep(profile.latency_ms / 1000 / max(1, profile.text_tokens))
+                delta = {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'token '}}
+                yield {'chunk': {'bytes': json.dumps(delta).encode('utf-8')}}
+            usage = {'type': 'message_delta', 'usage': {'output_tokens': profile.text_tokens}}
+            yield {'chunk': {'bytes': json.dumps(usage).encode('utf-8')}}
+        return {'body': events()}
+
+    def _converse_usage(self, system=None, messages=()):
+        """
+        Estimate input tokens (4 characters each) and split off the prefix up
+        to the last cache point, which is a cache write the first time it is
+        seen and a cache read afterwards.
+        """
+        blocks = list(system or [])
+        for message in messages:
+            blocks.extend(message['content'])
+
+        def estimate(block):
+            if 'text' in block:
+                return len(block['text']) // 4 + 1
+            if 'document' in block:
+                return len(block['document']['source']['bytes']) // 4 + 1
+            return 0
+
+        tokens = sum(estimate(block) for block in blocks)
+        usage = {'inputTokens': tokens, 'outputTokens': self.profile.text_tokens}
+
+        cache_points = [index for index, block in enumerate(blocks) if 'cachePoint' in block]
+        if cache_points:
+            prefix = blocks[:cache_points[-1]]
+            cached = sum(estimate(block) for block in prefix)
+            key = repr(prefix)
+            with self.profile.lock:
+                hit = key in self.state.prompt_cache
+                self.state.prompt_cache.add(key)
+            usage['inputTokens'] = tokens - cached
+            usage['cacheReadInputTokens' if hit else 'cacheWriteInputTokens'] = cached
+        usage['totalTokens'] = tokens + usage['outputTokens']
+        return usage
+
+    def _bedrock_runtime_converse(self, modelId, messages, system=None, **kwargs):
+        return {
+            'output': {'message': {'role': 'assistant', 'content': [{'text': self._words()}]}},
+            'stopReason': 'end_turn',
+            'usage': self._converse_usage(system, messages),
+            'metrics': {'latencyMs': int(self.profile.latency_ms)}
+        }
+
+    def _bedrock_runtime_converse_stream(self, modelId, messages, system=None, **kwargs):
+        profile = self.profile
+        usage = self._converse_usage(system, messages)
+
+        def events():
+            yield {'messageStart': {'role': 'assistant'}}
+            for _ in range(profile.text_tokens):
+                time.sleep(profile.latency_ms / 1000 / max(1, profile.text_tokens))
+                yield {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': 'token '}}}
+            yield {'contentBlockStop': {'contentBlockIndex': 0}}
+            yield {'messageStop': {'stopReason': 'end_turn'}}
+            yield {'metadata': {'usage': usage, 'metrics': {'latencyMs': int(profile.latency_ms)}}}
+        return {'stream': events()}
+
+    # bedrock (control plane); a stub job API that runs batch jobs in process
+
+    def _bedrock_create_model_invocation_job(self, jobName, roleArn, modelId, inputDataConfig,
+                                             outputDataConfig, **kwargs):
+        job_arn = f"arn:aws:bedrock:us-east-1:123456789012:model-invocation-job/{uuid.uuid4().hex[:12]}"
+        self.state.jobs[job_arn] = {
+            'jobArn': job_arn,
+            'jobName': jobName,
+            'modelId': modelId,
+            'status': 'Submitted',
+            'inputDataConfig': inputDataConfig,
+            'outputDataConfig': outputDataConfig
+        }
+        return {'jobArn': job_arn}
+
+    def _bedrock_get_model_invocation_job(self, jobIdentifier):
+        job = self.state.jobs[jobIdentifier]
+        if job['status'] == 'Submitted':
+            # The first poll runs the whole job
+            failed = self._run_batch_job(job)
+            job['status'] = 'PartiallyCompleted' if failed else 'Completed'
+        return dict(job)
+
+    def _run_batch_job(self, job):
+        """
+        Answer every record under the job's input prefix, writing
+        <output>/<job id>/<input file>.out like Bedrock does. Prompts
+        containing "FAIL" produce an error record.
+        """
+        input_bucket, _, input_prefix = job['inputDataConfig']['s3InputDataConfig']['s3Uri'][5:].partition('/')
+        output_bucket, _, output_prefix = job['outputDataConfig']['s3OutputDataConfig']['s3Uri'][5:].partition('/')
+        job_id = job['jobArn'].rsplit('/', 1)[-1]
+        failed = 0
+
+        for (bucket, key) in sorted(self.state.objects):
+            if bucket != input_bucket or not key.startswith(input_prefix) or not key.endswith('.jsonl'):
+                continue
+            lines = []
+            for line in self.state.objects[(bucket, key)].splitlines():
+                record = json.loads(line)
+                model_input = record['modelInput']
+                prompt = json.dumps(model_input['messages'])
+                output = {'recordId': record['recordId'], 'modelInput': model_input}
+                if 'FAIL' in prompt:
+                    failed += 1
+                    output['error'] = {'errorCode': 400, 'errorMessage': 'Injected batch record failure'}
+                elif 'anthropic_version' in model_input:
+                    output['modelOutput'] = {
+                        'content': [{'type': 'text', 'text': self._words()}],
+                        'usage': {'input_tokens': len(prompt) // 4 + 1, 'output_tokens': self.profile.text_tokens}
+                    }
+                else:
+                    output['modelOutput'] = {
+                        'output': {'message': {'role': 'assistant', 'content': [{'text': self._words()}]}},
+                        'usage': {'inputTokens': len(prompt) // 4 + 1, 'outputTokens': self.profile.text_tokens}
+                    }
+                lines.append(json.dumps(output))
+            name = key.rsplit('/', 1)[-1]
+            self.state.objects[(output_bucket, f"{output_prefix}{job_id}/{name}.out")] = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        self.state.objects[(output_bucket, f"{output_prefix}{job_id}/manifest.json.out")] = b'{}'
+        return failed
+
+    # s3
+
+    def _s3_put_object(self, Bucket, Key, Body, **kwargs):
+        data = Body.read() if hasattr(Body, 'read') else Body
+        self.state.objects[(Bucket, Key)] = bytes(data)
+        return {'ETag': '"fake"'}
+
+    def _s3_head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.state.objects:
+            raise _client_error('404', 'HeadObject')
+        return {'ContentLength': len(self.state.objects[(Bucket, Key)])}
+
+    def _s3_get_object(self, Bucket, Key, Range=None, **kwargs):
+        data = self.state.objects.get((Bucket, Key))
+        if data is None:
+            raise _client_error('NoSuchKey', 'GetObject')
+        if Range is None:
+            return {'Body': FakeStreamingBody(data), 'ContentLength': len(data)}
+
+        first, _, last = Range[len('bytes='):].partition('-')
+        first = int(first)
+        last = min(int(last), len(data) - 1) if last else len(data) - 1
+        if first >= len(data):
+            raise _client_error('InvalidRange', 'GetObject')
+        part = data[first:last + 1]
+        return {
+            'Body': FakeStreamingBody(part),
+            'ContentLength': len(part),
+            'ContentRange': f"bytes {first}-{last}/{len(data)}"
+        }
+
+    def _s3_delete_object(self, Bucket, Key):
+        self.state.objects.pop((Bucket, Key), None)
+        return {}
+
+    def _s3_list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000):
+        keys = sorted(key for bucket, key in self.state.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {
+            'Contents': [{'Key': key, 'Size': len(self.state.objects[(Bucket, key)])} for key in page],
+            'IsTruncated': start + MaxKeys < len(keys)
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+    def _s3_create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.state.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def _s3_upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.state.uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"part-{PartNumber}"'}
+
+    def _s3_complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.state.uploads.pop(UploadId)
+        self.state.objects[(Bucket, Key)] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+        return {}
+
+    def _s3_abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.state.uploads.pop(UploadId, None)
+        return {}
+
+    # polly
+
+    def _polly_synthesize_speech(self, Text, **kwargs):
+        return {'AudioStream': FakeStreamingBody(os.urandom(self.profile.audio_bytes)), 'ContentType': 'audio/mpeg'}
+
+    # textract
+
+    def _page_blocks(self, page):
+        return [
+            {
+                'BlockType': 'LINE',
+                'Id': f"line-{page}-{index}",
+                'Text': f"Line {index} of page {page}",
+                'Confidence': 99.0,
+                'Page': page
+            }
+            for index in range(self.profile.blocks)
+        ]
+
+    def _textract_detect_document_text(self, Document):
+        if 'missing' in Document['S3Object']['Name']:
+            raise _client_error('InvalidS3ObjectException', 'DetectDocumentText')
+        return {'DocumentMetadata': {'Pages': 1}, 'Blocks': self._page_blocks(1)}
+
+    def _textract_analyze_document(self, Document, FeatureTypes, **kwargs):
+        if 'missing' in Document['S3Object']['Name']:
+            raise _client_error('InvalidS3ObjectException', 'AnalyzeDocument')
+        blocks = analysis_blocks(
+            tables=1 if 'TABLES' in FeatureTypes else 0,
+            pairs=20 if 'FORMS' in FeatureTypes else 0,
+            lines=self.profile.blocks
+        )
+        return {'DocumentMetadata': {'Pages': 1}, 'Blocks': blocks}
+
+    def _textract_start_document_text_detection(self, DocumentLocation, **kwargs):
+        job_id = uuid.uuid4().hex
+        self.state.jobs[job_id] = DocumentLocation['S3Object']['Name']
+        return {'JobId': job_id}
+
+    def _textract_get_document_text_detection(self, JobId, NextToken=None, **kwargs):
+        if JobId not in self.state.jobs:
+            raise _client_error('InvalidJobIdException', 'GetDocumentTextDetection')
+        # Documents with "slow" in their key never finish
+        if 'slow' in self.state.jobs[JobId]:
+            return {'JobStatus': 'IN_PROGRESS'}
+        page = int(NextToken or 1)
+        response = {
+            'JobStatus': 'SUCCEEDED',
+            'DocumentMetadata': {'Pages': self.profile.pages},
+            'Blocks': self._page_blocks(page)
+        }
+        if page < self.profile.pages:
+            response['NextToken'] = str(page + 1)
+        return response
+
+    # rekognition
+
+    def _rekognition_detect_labels(self, Image, MaxLabels=10, MinConfidence=70, **kwargs):
+        if 'missing' in Image.get('S3Object', {}).get('Name', ''):
+            raise _client_error('InvalidS3ObjectException', 'DetectLabels')
+        return {'Labels': [
+            {'Name': f"Label{index}", 'Confidence': 99.0 - index}
+            for index in range(MaxLabels)
+        ]}
+
+    # lambda
+
+    def _lambda_invoke(self, FunctionName, Payload, InvocationType='RequestResponse', **kwargs):
+        self.state.invocations.append((FunctionName, InvocationType, json.loads(Payload)))
+        return {'StatusCode': 202 if InvocationType == 'Event' else 200}
+
+    # transcribe
+
+    def _transcribe_start_transcription_job(self, TranscriptionJobName, **kwargs):
+        return {'TranscriptionJob': {'TranscriptionJobName': TranscriptionJobName, 'TranscriptionJobStatus': 'IN_PROGRESS'}}
+
+    # translate
+
+    def _translate_translate_text(self, Text, SourceLanguageCode, TargetLanguageCode, **kwargs):
+        return {
+            'TranslatedText': Text,
+            'SourceLanguageCode': 'en' if SourceLanguageCode == 'auto' else SourceLanguageCode,
+            'TargetLanguageCode': TargetLanguageCode
+        }
+
+
+def _item_key(item):
+    if 'batchId' in item:
+        return item['batchId'], item['recordId']
+    return item.get('id', item.get('cacheKey'))
+
+
+class FakeTable:
+    def __init__(self, client):
+        self.client = client
+        self.items = {}
+
+    def put_item(self, Item):
+        self.client._delay_and_fail('PutItem')
+        self.items[_item_key(Item)] = Item
+        return {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        # Only "<partition key> = :value" conditions on composite keys
+        self.client._delay_and_fail('Query')
+        value = next(iter(ExpressionAttributeValues.values()))
+        return {'Items': [item for key, item in self.items.items()
+                          if isinstance(key, tuple) and key[0] == value]}
+
+    def get_item(self, Key):
+        self.client._delay_and_fail('GetItem')
+        item = self.items.get(next(iter(Key.values())))
+        return {'Item': item} if item else {}
+
+    @contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        table = self
+        pending = []
+
+        class Writer:
+            def put_item(self, Item):
+                pending.append(Item)
+                if len(pending) == 25:
+                    flush()
+
+        def flush():
+            table.client._delay_and_fail('BatchWriteItem')
+            for item in pending:
+                table.items[_item_key(item)] = item
+            pending.clear()
+
+        yield Writer()
+        if pending:
+            flush()
+
+
+class FakeDynamoDBResource:
+    def __init__(self, client):
+        self.client = client
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, FakeTable(self.client))
+
+
+class FakeState:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.prompt_cache = set()
+        self.jobs = {}
+        self.invocations = []
+
+
+class FakeBoto3:
+    """
+    Replacement for the boto3 module as used by aws_clients.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.state = FakeState()
+
+    def client(self, service_name, **kwargs):
+        return FakeClient(service_name, self.profile, self.state)
+
+    def resource(self, service_name, **kwargs):
+        return FakeDynamoDBResource(FakeClient(service_name, self.profile, self.state))
+
+
+class FakeContext:
+    """
+    Lambda context with a real countdown.
+    """
+
+    def __init__(self, timeout_ms=60000, request_id='benchmark'):
+        self.aws_request_id = request_id
+        self.function_name = 'benchmark'
+        self.invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:benchmark'
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def install(profile=None):
+    """
+    Route every aws_clients client and resource to the fakes. Returns the fake module.
+    """
+    fake = FakeBoto3(profile or Profile())
+    aws_clients.boto3 = fake
+    aws_clients.clear_clients()
+    return fake
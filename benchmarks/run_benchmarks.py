@@ -0,0 +1,381 @@
+"""
+Benchmark suite: every handler end to end against latency-injecting fake AWS services.
+
+Each scenario runs in its own interpreter so peak RSS and cold import time
+are measured in isolation. For every scenario the suite reports p50/p99
+latency of sequential warm invocations, throughput with concurrent
+invocations, peak RSS and the cold import time of the handler module, then
+compares them against benchmarks/baselines.json and exits non-zero if any
+metric regressed by more than the tolerance.
+
+Every scenario runs --rounds times, the rounds of all scenarios interleaved
+so a temporary slowdown of the machine does not hit one scenario only.
+Latencies of all rounds are pooled before taking percentiles. To make
+baselines recorded on another machine (or under other load) comparable,
+each worker also times a fixed calibration workload, and baseline timings
+are scaled by the ratio of the two calibrations. A change only counts as a
+regression when it exceeds the tolerance, the metric's absolute noise
+floor, and twice the spread seen between rounds.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--only polly,textract] [--invocations 50] [--rounds 3]
+        [--concurrency 8] [--latency-ms 5] [--tolerance 0.3] [--update-baselines]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(BENCHMARKS, 'baselines.json')
+BUCKET = 'benchmark-bucket'
+
+
+def _records(count, extension):
+    return [
+        {'s3': {'bucket': {'name': BUCKET}, 'object': {'key': f"input/file-{index}.{extension}"}}}
+        for index in range(count)
+    ]
+
+
+def _sqs_records(count, extension, per_message=1):
+    """
+    SQS messages carrying S3 notifications, plus the s3:TestEvent S3 sends
+    when a notification is configured and one message for a missing object.
+    """
+    records = _records(count, extension)
+    bodies = [{'Records': records[index:index + per_message]} for index in range(0, count, per_message)]
+    bodies.append({'Service': 'Amazon S3', 'Event': 's3:TestEvent', 'Bucket': BUCKET})
+    bodies.append({'Records': [{'s3': {'bucket': {'name': BUCKET},
+                                       'object': {'key': f"input/missing.{extension}"}}}]})
+    return [
+        {'messageId': f"message-{index}", 'eventSource': 'aws:sqs', 'body': json.dumps(body),
+         'eventSourceARN': 'arn:aws:sqs:us-east-1:123456789012:benchmark-queue'}
+        for index, body in enumerate(bodies)
+    ]
+
+
+# name -> (directory, module, handler, event, environment)
+SCENARIOS = {
+    'bedrock_text': ('', 'bedrock_text_lambda', 'lambda_handler',
+                     {'prompt': 'Tell me a short story.'}, {}),
+    'bedrock_text_stream': ('', 'bedrock_text_lambda', 'lambda_handler',
+                            {'prompt': 'Tell me a short story.', 'stream': True}, {}),
+    'bedrock_text_prompts': ('', 'bedrock_text_lambda', 'lambda_handler',
+                             {'system': 'Classify the sentiment as positive, negative or neutral.',
+                              'prompts': [f"Review {index}: the product works as described." for index in range(50)],
+                              'temperature': 0, 'maxTokens': 5}, {}),
+    'bedrock_text_cached_context': ('', 'bedrock_text_lambda', 'lambda_handler',
+                                    {'system': 'You answer questions about the attached manual. ' * 50,
+                                     'documents': [{'name': 'manual', 'text': 'Step one. Step two. ' * 2000}],
+                                     'prompt': 'How do I reset the device?'}, {}),
+    'bedrock_nova': ('', 'bedrock_nova_lambda', 'lambda_handler',
+                     {'body': json.dumps({'prompt': 'Tell me a short story.'})}, {}),
+    'bedrock_image': ('', 'bedrock_image_lambda', 'lambda_handler',
+                      {'prompt': 'A beautiful sunset over mountains'}, {'S3_BUCKET_NAME': BUCKET}),
+    'polly': ('', 'polly_lambda', 'lambda_handler',
+              {'text': 'Hola, esta es una prueba de Amazon Polly.', 'bucket': BUCKET,
+               'cacheControl': {'bypass': True}}, {}),
+    'polly_long_form': ('', 'polly_lambda', 'lambda_handler',
+                        {'text': 'Hola, esta es una prueba de Amazon Polly. ' * 400, 'bucket': BUCKET,
+                         'cacheControl': {'bypass': True}}, {}),
+    'textract': ('', 'textract_lambda', 'lambda_handler',
+                 {'Records': _records(5, 'png')}, {}),
+    'textract_async': ('', 'textract_lambda', 'lambda_handler',
+                       {'mode': 'async', 'Records': _records(2, 'pdf')}, {}),
+    'textract_async_spill': ('', 'textract_lambda', 'lambda_handler',
+                             {'mode': 'async', 'Records': _records(4, 'pdf')},
+                             {'RESULT_BUCKET': BUCKET, 'RESULT_SPILL_THRESHOLD_BYTES': '65536'}),
+    'textract_analyze': ('', 'textract_lambda', 'lambda_handler',
+                         {'mode': 'analyze', 'Records': _records(5, 'png')}, {}),
+    'textract_sqs': ('', 'textract_lambda', 'lambda_handler',
+                     {'Records': _sqs_records(10, 'png')}, {}),
+    'rekognition': ('', 'rekognition_lambda', 'lambda_handler',
+                    {'Records': _records(20, 'jpg')}, {}),
+    'rekognition_sqs': ('', 'rekognition_lambda', 'lambda_handler',
+                        {'Records': _sqs_records(40, 'jpg', per_message=4)}, {}),
+    'transcribe': ('', 'transcribe_lambda', 'lambda_handler',
+                   {'Records': _records(20, 'mp3')}, {}),
+    'translate': ('', 'translate_lambda', 'lambda_handler',
+                  {'text': 'Hello, world!', 'cacheControl': {'bypass': True}}, {}),
+    'translate_document': ('', 'translate_lambda', 'lambda_handler',
+                           {'text': 'Hello, world! This is a sentence to translate. ' * 1500,
+                            'cacheControl': {'bypass': True}}, {}),
+    'document_speech': ('', 'document_speech_lambda', 'lambda_handler',
+                        {'bucket': BUCKET, 'Records': _records(1, 'pdf')}, {}),
+    'qrcode': (os.path.join('qr-code', 'python'), 'qrcode_lambda', 'lambda_handler',
+               {'url': 'https://example.com', 'bucket': BUCKET, 'tableName': 'benchmark-table'}, {}),
+    'qrcode_batch': (os.path.join('qr-code', 'python'), 'qrcode_lambda', 'lambda_handler',
+                     {'urls': [f"https://example.com/{index}" for index in range(100)],
+                      'bucket': BUCKET, 'tableName': 'benchmark-table'}, {}),
+}
+
+# Metrics compared against the baselines
+GATED = ('p50_ms', 'p99_ms', 'throughput_per_s', 'peak_rss_mb', 'import_ms')
+
+# Metrics where a larger value is better; everything else regresses upwards
+HIGHER_IS_BETTER = {'throughput_per_s'}
+
+# Timing metrics, which are scaled by the calibration ratio before comparing
+TIMED = {'p50_ms', 'p99_ms', 'throughput_per_s', 'import_ms'}
+
+# Absolute slack below which a change is treated as noise
+NOISE_FLOOR = {
+    'p50_ms': 2.0,
+    'p99_ms': 5.0,
+    'throughput_per_s': 5.0,
+    'peak_rss_mb': 5.0,
+    'import_ms': 20.0
+}
+
+# A regression must exceed this many times the spread between rounds
+NOISE_SPREAD = 2.0
+
+# Calibration: one fake-service sleep plus a fixed amount of Python work
+CALIBRATION_RUNS = 30
+CALIBRATION_LOOP = 20000
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def calibrate(latency_ms):
+    """
+    Median wall time of a fixed unit of work, in milliseconds.
+
+    Reflects both sleep overshoot and interpreter speed, the two things the
+    handler latencies are made of under the fake services.
+    """
+    timings = []
+    for _ in range(CALIBRATION_RUNS):
+        start = time.perf_counter()
+        time.sleep(latency_ms / 1000)
+        sum(index * index for index in range(CALIBRATION_LOOP))
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _worker_environment(scenario):
+    directory, _, _, _, environment = SCENARIOS[scenario]
+    env = dict(os.environ)
+    env.update(environment)
+    # Keep the per-invocation EMF lines out of the benchmark output
+    env['METRICS_ENABLED'] = 'false'
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (os.path.join(ROOT, directory), ROOT, env.get('PYTHONPATH')) if path
+    )
+    return env
+
+
+def measure_import(scenario, runs):
+    """
+    Median wall time of importing the handler module in a fresh interpreter.
+    """
+    module = SCENARIOS[scenario][1]
+    code = (
+        'import time; start = time.perf_counter(); '
+        f'import {module}; print((time.perf_counter() - start) * 1000)'
+    )
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            env=_worker_environment(scenario), cwd=ROOT,
+            capture_output=True, text=True, check=True
+        )
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def run_worker(args):
+    """
+    Run one scenario in this interpreter and print its results as JSON.
+    """
+    import resource
+
+    import fake_aws
+
+    _, module_name, handler_name, event, _ = SCENARIOS[args.worker]
+    fake_aws.install(fake_aws.Profile(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.latency_ms / 5,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=0
+    ))
+    handler = getattr(__import__(module_name), handler_name)
+
+    def invoke():
+        start = time.perf_counter()
+        response = handler(event, fake_aws.FakeContext())
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.get('statusCode', 200) >= 400:
+            raise RuntimeError(f"{args.worker} failed: {response.get('body')}")
+        return elapsed
+
+    # Warm the container before timing
+    invoke()
+
+    calibration = calibrate(args.latency_ms)
+    latencies = [invoke() for _ in range(args.invocations)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda _: invoke(), range(args.invocations)))
+    throughput = args.invocations / (time.perf_counter() - start)
+
+    print(json.dumps({
+        'latencies': [round(latency, 3) for latency in latencies],
+        'throughput_per_s': throughput,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'calibration_ms': calibration
+    }))
+
+
+def run_round(scenario, args):
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        '--worker', scenario,
+        '--invocations', str(args.invocations),
+        '--concurrency', str(args.concurrency),
+        '--latency-ms', str(args.latency_ms),
+        '--error-rate', str(args.error_rate),
+        '--throttle-rate', str(args.throttle_rate)
+    ]
+    env = _worker_environment(scenario)
+    env['PYTHONPATH'] = os.pathsep.join((BENCHMARKS, env['PYTHONPATH']))
+    output = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"{scenario} worker failed:\n{output.stderr}")
+    results = json.loads(output.stdout.strip().splitlines()[-1])
+    results['import_ms'] = measure_import(scenario, args.import_runs)
+    return results
+
+
+def summarize(rounds):
+    """
+    Combine a scenario's rounds: percentiles over the pooled latencies,
+    medians of the other metrics, and the spread of each gated metric
+    between rounds.
+    """
+    latencies = [latency for result in rounds for latency in result['latencies']]
+    per_round = {
+        'p50_ms': [percentile(result['latencies'], 0.5) for result in rounds],
+        'p99_ms': [percentile(result['latencies'], 0.99) for result in rounds]
+    }
+    for metric in ('throughput_per_s', 'peak_rss_mb', 'import_ms'):
+        per_round[metric] = [result[metric] for result in rounds]
+    return {
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'throughput_per_s': round(statistics.median(per_round['throughput_per_s']), 1),
+        'peak_rss_mb': round(statistics.median(per_round['peak_rss_mb']), 1),
+        'import_ms': round(statistics.median(per_round['import_ms']), 1),
+        'calibration_ms': round(statistics.median(result['calibration_ms'] for result in rounds), 3),
+        'spread': {metric: round(max(values) - min(values), 2) for metric, values in per_round.items()}
+    }
+
+
+def regressions(scenario, results, baseline, tolerance):
+    """
+    Metrics of results worse than the baseline by more than the tolerance,
+    the noise floor and NOISE_SPREAD times the larger spread of the two.
+    """
+    scale = 1.0
+    if baseline.get('calibration_ms') and results.get('calibration_ms'):
+        scale = results['calibration_ms'] / baseline['calibration_ms']
+    found = []
+    for metric in GATED:
+        value = results.get(metric)
+        expected = baseline.get(metric)
+        if value is None or expected is None:
+            continue
+        if metric in TIMED:
+            expected = expected / scale if metric in HIGHER_IS_BETTER else expected * scale
+        spread = max(results.get('spread', {}).get(metric, 0), baseline.get('spread', {}).get(metric, 0))
+        slack = max(expected * tolerance, NOISE_FLOOR.get(metric, 0), NOISE_SPREAD * spread)
+        if metric in HIGHER_IS_BETTER:
+            regressed = value < expected - slack
+        else:
+            regressed = value > expected + slack
+        if regressed:
+            change = (value - expected) / expected * 100
+            found.append(f"{scenario}.{metric}: {value} vs calibrated baseline {expected:.2f} "
+                         f"({change:+.0f}%, allowed {slack:.2f})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', help='Comma-separated scenario names')
+    parser.add_argument('--invocations', type=int, default=50, help='Sequential invocations per round')
+    parser.add_argument('--rounds', type=int, default=3, help='Worker runs per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--import-runs', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='Allowed relative change before a metric counts as regressed')
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    if args.rounds < 1 or args.invocations < 1:
+        parser.error('--rounds and --invocations must be at least 1')
+
+    scenarios = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+
+    # Interleave the rounds of all scenarios
+    rounds = {scenario: [] for scenario in scenarios}
+    for _ in range(args.rounds):
+        for scenario in scenarios:
+            rounds[scenario].append(run_round(scenario, args))
+
+    print(f"{'scenario':<30}{'p50 ms':>10}{'p99 ms':>10}{'inv/s':>10}{'rss MB':>10}{'import ms':>11}{'calib ms':>10}")
+    results = {}
+    failures = []
+    for scenario in scenarios:
+        results[scenario] = row = summarize(rounds[scenario])
+        print(f"{scenario:<30}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['throughput_per_s']:>10}"
+              f"{row['peak_rss_mb']:>10}{row['import_ms']:>11}{row['calibration_ms']:>10}")
+        failures.extend(regressions(scenario, row, baselines.get(scenario, {}), args.tolerance))
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baselines written to {os.path.relpath(BASELINES, ROOT)}")
+        return 0
+
+    if failures:
+        print('\nRegressions:')
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print('\nNo regressions against baselines')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
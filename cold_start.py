@@ -0,0 +1,93 @@
+import importlib
+import os
+import threading
+import time
+
+# Lambda sets this to "provisioned-concurrency" or "snap-start" when the
+# init phase runs ahead of any request, so doing work there is free for callers
+INITIALIZATION_TYPE = os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE', 'on-demand')
+
+# "true" always primes during init, "false" never does; unset primes only
+# for provisioned concurrency and SnapStart
+PRIME_ON_INIT = os.environ.get('PRIME_ON_INIT', '').lower()
+
+_import_lock = threading.RLock()
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Handlers run their fan-out on worker threads, so the first access is
+    serialized with a lock; after that attribute lookups go straight to the
+    real module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with _import_lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return a proxy for module name that defers the actual import until the
+    code path that needs it runs.
+
+    Example:
+        boto3 = lazy_import('boto3')
+        ...
+        boto3.client('s3')  # boto3 is imported here, not at module load
+    """
+    return LazyModule(name)
+
+
+def preload(*names):
+    """
+    Import modules now, so lazy_import proxies for them resolve without delay.
+    """
+    for name in names:
+        importlib.import_module(name)
+
+
+def should_prime():
+    if PRIME_ON_INIT in ('true', '1', 'yes'):
+        return True
+    if PRIME_ON_INIT in ('false', '0', 'no'):
+        return False
+    return INITIALIZATION_TYPE in ('provisioned-concurrency', 'snap-start')
+
+
+def priming_hook(prime):
+    """
+    Decorator for a handler module's prime() function.
+
+    prime() should import the modules and create the clients the handler's
+    main path needs. It runs during the init phase when should_prime() says
+    so, which lets provisioned concurrency and SnapStart snapshots absorb
+    the cost; otherwise it is only run when called explicitly. A failure is
+    logged rather than raised so it can never break initialization.
+    """
+    if should_prime():
+        start = time.perf_counter()
+        try:
+            prime()
+            print(f"Primed {prime.__module__} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        except Exception as e:
+            print(f"Error priming {prime.__module__}: {str(e)}")
+    return prime
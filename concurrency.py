@@ -0,0 +1,117 @@
+from collections import deque
+
+from cold_start import lazy_import
+
+# Only handlers that fan out pay for the thread pool machinery
+futures = lazy_import('concurrent.futures')
+
+# Below this much remaining invocation time the number of in-flight calls is
+# scaled down so we do not start work that cannot finish before the timeout.
+LOW_TIME_THRESHOLD_MS = 10000
+
+_EXHAUSTED = object()
+
+
+def effective_concurrency(max_workers, context=None, low_time_threshold_ms=LOW_TIME_THRESHOLD_MS):
+    """
+    Return how many calls may be in flight given the remaining Lambda time.
+
+    Full concurrency is used until the remaining time drops below the
+    threshold, after which it shrinks linearly down to a single worker.
+    """
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return max_workers
+
+    remaining = context.get_remaining_time_in_millis()
+    if remaining >= low_time_threshold_ms:
+        return max_workers
+    return max(1, int(max_workers * remaining / low_time_threshold_ms))
+
+
+def bounded_map(fn, items, max_workers, context=None, low_time_threshold_ms=LOW_TIME_THRESHOLD_MS,
+                reserve_ms=None):
+    """
+    Apply fn to every item on a thread pool and return the results in input order.
+
+    At most max_workers calls run at once, fewer when the invocation is
+    close to its deadline (see effective_concurrency). fn is expected to
+    handle its own errors so one failing item does not affect the others;
+    anything it raises is re-raised here.
+
+    With a context and reserve_ms, no new item is started once less than
+    reserve_ms of invocation time remains. The first item is always
+    started, so every call makes progress. Calls already running are
+    waited for, and the results of items never started are left as None.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+
+    def out_of_time():
+        return (
+            reserve_ms is not None and context is not None
+            and context.get_remaining_time_in_millis() < reserve_ms
+        )
+
+    max_workers = max(1, min(max_workers, len(items)))
+    if max_workers == 1:
+        for index, item in enumerate(items):
+            if index and out_of_time():
+                break
+            results[index] = fn(item)
+        return results
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        next_index = 0
+
+        while next_index < len(items) or pending:
+            # Top up the in-flight set to the currently allowed concurrency
+            if next_index and out_of_time():
+                next_index = len(items)
+            limit = effective_concurrency(max_workers, context, low_time_threshold_ms)
+            while next_index < len(items) and len(pending) < limit:
+                future = executor.submit(fn, items[next_index])
+                pending[future] = next_index
+                next_index += 1
+
+            if not pending:
+                break
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+    return results
+
+
+def bounded_imap(fn, items, max_workers, context=None, low_time_threshold_ms=LOW_TIME_THRESHOLD_MS):
+    """
+    Lazily apply fn to items on a thread pool, yielding results in input order.
+
+    Unlike bounded_map, at most max_workers results exist at any time: a
+    new item is only started once the oldest result has been consumed, so
+    memory stays bounded however many items there are. With a context the
+    window also shrinks near the deadline, as in bounded_map.
+    """
+    iterator = iter(items)
+    max_workers = max(1, max_workers)
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window = deque()
+
+        def top_up():
+            limit = effective_concurrency(max_workers, context, low_time_threshold_ms)
+            while len(window) < limit:
+                item = next(iterator, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    return
+                window.append(executor.submit(fn, item))
+
+        top_up()
+        while window:
+            result = window.popleft().result()
+            # Refill before yielding so the pool keeps working while the
+            # caller consumes this result
+            top_up()
+            yield result
@@ -0,0 +1,267 @@
+import json
+import os
+
+from cold_start import preload, priming_hook
+from metrics import instrumented, span
+from pipeline import Stage, run_pipeline
+from polly_lambda import CONTENT_TYPES, presigned_url, synthesize_long_form
+from s3_events import object_location
+from textract_lambda import iter_page_text, iter_text_detection_pages, wait_for_text_detection
+from throttling import throttled_client
+from translate_lambda import translate_document
+
+# Items that may wait between two stages
+QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '2'))
+
+# Pages each stage works on at once; synthesis is usually the slowest stage
+DEFAULT_WORKERS = {
+    'translate': int(os.environ.get('PIPELINE_TRANSLATE_WORKERS', '1')),
+    'synthesize': int(os.environ.get('PIPELINE_SYNTHESIZE_WORKERS', '2'))
+}
+
+# Most pages a stage may work on at once; larger requests are clamped
+MAX_STAGE_WORKERS = 8
+
+# translate_text and synthesize_speech calls in flight within one page
+CHUNK_CONCURRENCY = int(os.environ.get('PIPELINE_CHUNK_CONCURRENCY', '4'))
+
+
+def stage_workers(overrides):
+    """
+    Merge the event's "workers" overrides into DEFAULT_WORKERS.
+
+    Each override is coerced with int() and clamped to MAX_STAGE_WORKERS.
+    Raises ValueError for unknown stages and values that are not integers
+    of at least 1.
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError('workers must be an object of stage name to worker count')
+    workers = dict(DEFAULT_WORKERS)
+    for stage, value in overrides.items():
+        if stage not in DEFAULT_WORKERS:
+            raise ValueError(f"unknown stage in workers: {stage}")
+        try:
+            count = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"workers.{stage} must be an integer")
+        if count < 1:
+            raise ValueError(f"workers.{stage} must be at least 1")
+        workers[stage] = min(count, MAX_STAGE_WORKERS)
+    return workers
+
+
+def iter_document_pages(textract, bucket, key, mode='async', context=None):
+    """
+    Generator over (page number, text) for a document.
+
+    In async mode (multi-page PDFs and TIFFs) nothing is yielded until the
+    text detection job has finished: GetDocumentTextDetection returns no
+    blocks while the job is IN_PROGRESS. The finished job's results are
+    then read one result page at a time, so the first document page
+    reaches the next stage while later result pages are still being
+    fetched. Sync mode reads a single-page image with DetectDocumentText.
+    """
+    document = {
+        'S3Object': {
+            'Bucket': bucket,
+            'Name': key
+        }
+    }
+    if mode == 'sync':
+        response = textract.detect_document_text(Document=document)
+        yield from iter_page_text([response])
+        return
+
+    job_id = textract.start_document_text_detection(DocumentLocation=document)['JobId']
+    first_page = wait_for_text_detection(textract, job_id, context)
+    if first_page is None:
+        raise TimeoutError(f"Text detection job {job_id} did not finish before the invocation timeout")
+    if first_page['JobStatus'] != 'SUCCEEDED':
+        raise RuntimeError(
+            f"Text detection job {job_id} {first_page['JobStatus']}: "
+            f"{first_page.get('StatusMessage', 'no status message')}"
+        )
+    yield from iter_page_text(iter_text_detection_pages(textract, job_id, first_page))
+
+
+def document_to_speech(clients, record, options, context=None):
+    """
+    Extract, translate and synthesize one document page by page.
+
+    The three steps run as pipeline stages connected by bounded queues, so
+    page 1 is being translated and synthesized while page 2 is still being
+    extracted. Each page's audio is written to S3 as soon as it is ready.
+    """
+    textract, translate, polly, s3 = clients
+    bucket, key = object_location(record)
+    output_bucket = options['bucket']
+    prefix = options.get('outputPrefix') or f"document-speech/{key}/{options['targetLanguage'] or 'original'}/"
+    output_format = options['outputFormat']
+
+    def translate_page(page):
+        number, text = page
+        target_language = options['targetLanguage']
+        if not target_language or target_language == options['sourceLanguage']:
+            return number, text
+        translated, _, _ = translate_document(
+            translate, text, options['sourceLanguage'], target_language, CHUNK_CONCURRENCY, context
+        )
+        return number, translated
+
+    def synthesize_page(page):
+        number, text = page
+        audio_key = f"{prefix}page-{number:04d}.{output_format}"
+        segments = synthesize_long_form(
+            polly, s3, output_bucket, audio_key, text, options['voiceId'], output_format,
+            options['languageCode'], CHUNK_CONCURRENCY
+        )
+        return {
+            'page': number,
+            's3Uri': f"s3://{output_bucket}/{audio_key}",
+            'presignedUrl': presigned_url(s3, output_bucket, audio_key),
+            'characters': len(text),
+            'segments': segments
+        }
+
+    workers = options['workers']
+    pages, report = run_pipeline(
+        'extract',
+        iter_document_pages(textract, bucket, key, options['mode'], context),
+        [
+            Stage('translate', translate_page, workers['translate']),
+            Stage('synthesize', synthesize_page, workers['synthesize'])
+        ],
+        QUEUE_SIZE
+    )
+    return {
+        'documentLocation': f"s3://{bucket}/{key}",
+        'contentType': CONTENT_TYPES.get(output_format, f'audio/{output_format}'),
+        'pages': sorted(pages, key=lambda page: page['page']),
+        'pipeline': report
+    }
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create every client the pipeline uses ahead of the first request.
+    """
+    preload('concurrent.futures')
+    for service in ('textract', 'translate', 'polly', 's3'):
+        throttled_client(service)
+
+
+@instrumented('document_speech')
+def lambda_handler(event, context):
+    """
+    Lambda function that demonstrates chaining Amazon Textract, Amazon Translate
+    and Amazon Polly to turn documents into translated audio.
+
+    This function:
+    1. Gets S3 objects (documents) from the event
+    2. Extracts each document's text page by page with Amazon Textract
+    3. Translates each page with Amazon Translate
+    4. Converts each translated page to speech with Amazon Polly and saves
+       it to S3 as it completes
+    5. Returns the audio location of every page and per-stage throughput
+
+    The stages run in one process connected by bounded queues, so a page
+    is being translated and synthesized while later pages are still being
+    read, without S3 round trips between separate functions. In async mode
+    the Textract job itself must finish before the first page is read;
+    only fetching its results overlaps with the other stages. The
+    "pipeline" report of each document gives every stage's items, busy
+    time, time waiting for input and blocked on a full queue, throughput
+    and utilization, and names the bottleneck stage.
+
+    Set "targetLanguage" to null to read the document in its own language.
+    "mode" is "async" (default, for multi-page PDFs and TIFFs) or "sync"
+    (single-page images). "workers" overrides how many pages the translate
+    and synthesize stages handle at once, e.g. {"synthesize": 4}; values
+    above 8 are clamped.
+
+    The Lambda function requires these permissions:
+    textract:DetectDocumentText (sync mode)
+    textract:StartDocumentTextDetection
+    textract:GetDocumentTextDetection
+    translate:TranslateText
+    polly:SynthesizeSpeech
+    s3:GetObject
+    s3:PutObject
+    s3:AbortMultipartUpload
+
+    Example test event:
+    {
+      "bucket": "your-audio-bucket",
+      "sourceLanguage": "en",
+      "targetLanguage": "es",
+      "voiceId": "Mia",
+      "languageCode": "es-MX",
+      "Records": [
+        {
+          "s3": {
+            "bucket": {
+              "name": "your-document-bucket"
+            },
+            "object": {
+              "key": "path/to/document.pdf"
+            }
+          }
+        }
+      ]
+    }
+    """
+    # Reuse the container's clients
+    with span('client_init'):
+        clients = tuple(throttled_client(service, context) for service in ('textract', 'translate', 'polly', 's3'))
+
+    # Get parameters from the event
+    options = {
+        'bucket': event.get('bucket'),
+        'outputPrefix': event.get('outputPrefix'),
+        'mode': event.get('mode', 'async'),
+        'sourceLanguage': event.get('sourceLanguage', 'auto'),
+        'targetLanguage': event.get('targetLanguage', 'es'),
+        'voiceId': event.get('voiceId', 'Mia'),
+        'languageCode': event.get('languageCode', 'es-MX'),
+        'outputFormat': event.get('outputFormat', 'mp3'),
+    }
+
+    if not options['bucket']:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'message': 'S3 bucket name is required'
+            })
+        }
+
+    # Validate the per-stage worker counts
+    try:
+        options['workers'] = stage_workers(event.get('workers') or {})
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'Invalid input: {str(e)}'})
+        }
+
+    # Process each document through its own pipeline
+    results = []
+    for record in event['Records']:
+        try:
+            results.append(document_to_speech(clients, record, options, context))
+        except Exception as e:
+            bucket, key = object_location(record)
+            print(f"Error converting {bucket}/{key} to speech: {str(e)}")
+            results.append({
+                'documentLocation': f"s3://{bucket}/{key}",
+                'error': str(e)
+            })
+
+    # Return all results
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'Processed {len(results)} document(s)',
+            'results': results
+        })
+    }
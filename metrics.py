@@ -0,0 +1,182 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AwsServicesLambda')
+
+# Set to "false" to turn instrumentation into no-ops
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() != 'false'
+
+# EMF accepts at most 100 values per metric in one log line
+MAX_VALUES = 100
+
+# The first invocation in a container is the cold start
+_cold_start = True
+
+# Lambda runs one invocation at a time per container, so a module-level
+# current recorder is visible to the handler and any worker threads it starts
+_current = None
+
+
+class _Series:
+    """
+    Values recorded under one name: exact count, sum, min and max, plus at
+    most MAX_VALUES samples spread evenly over the recorded values.
+
+    Once the sample is full, every other sample is dropped and only every
+    second value after that is kept, so memory and log size stay fixed
+    however often a phase repeats.
+    """
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'sample', 'stride')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.sample = []
+        self.stride = 1
+
+    def add(self, value):
+        if self.count % self.stride == 0:
+            self.sample.append(value)
+            if len(self.sample) > MAX_VALUES:
+                self.sample = self.sample[::2]
+                self.stride *= 2
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+
+class InvocationMetrics:
+    """
+    Collects phase timings for one invocation and emits them as a single
+    CloudWatch Embedded Metric Format (EMF) log line.
+
+    Phases that run more than once (e.g. one upload per variant) are
+    reported as a list of up to MAX_VALUES evenly spaced samples, which EMF
+    records as separate samples. Their exact count, sum, min and max are
+    added under "Aggregates", which CloudWatch Logs Insights can query.
+    """
+
+    def __init__(self, handler, model_id=None, cold_start=False):
+        self.dimensions = {
+            'Handler': handler,
+            'StartType': 'cold' if cold_start else 'warm'
+        }
+        if model_id:
+            self.dimensions['ModelId'] = model_id
+        self.values = {}
+        self.units = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, value, unit='Milliseconds'):
+        with self._lock:
+            series = self.values.get(name)
+            if series is None:
+                series = self.values[name] = _Series()
+            series.add(round(value, 3))
+            self.units[name] = unit
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def to_emf(self):
+        dimension_sets = [['Handler', 'StartType']]
+        if 'ModelId' in self.dimensions:
+            dimension_sets.append(['Handler', 'ModelId', 'StartType'])
+
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': dimension_sets,
+                    'Metrics': [{'Name': name, 'Unit': self.units[name]} for name in self.values]
+                }]
+            }
+        }
+        document.update(self.dimensions)
+        aggregates = {}
+        for name, series in self.values.items():
+            if series.count == 1:
+                document[name] = series.sample[0]
+                continue
+            document[name] = series.sample
+            aggregates[name] = {
+                'count': series.count,
+                'sum': round(series.total, 3),
+                'min': series.minimum,
+                'max': series.maximum
+            }
+        if aggregates:
+            document['Aggregates'] = aggregates
+        return document
+
+    def flush(self):
+        print(json.dumps(self.to_emf(), separators=(',', ':')))
+
+
+@contextmanager
+def span(name):
+    """
+    Time a phase of the current invocation. A no-op outside an instrumented handler.
+    """
+    recorder = _current
+    if recorder is None:
+        yield
+        return
+    with recorder.span(name):
+        yield
+
+
+def count(name, value):
+    """
+    Record a count (e.g. tokens) for the current invocation. A no-op outside an instrumented handler.
+    """
+    recorder = _current
+    if recorder is not None:
+        recorder.record(name, value, 'Count')
+
+
+def set_model_id(model_id):
+    """
+    Add the ModelId dimension to the current invocation's metrics.
+    """
+    if _current is not None:
+        _current.dimensions['ModelId'] = model_id
+
+
+def instrumented(handler_name, model_id=None):
+    """
+    Decorator for lambda_handler that records a "total" phase plus every span
+    opened while it runs, then flushes one EMF line per invocation.
+    """
+    def decorator(handler):
+        if not ENABLED:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _cold_start, _current
+            recorder = InvocationMetrics(handler_name, model_id, _cold_start)
+            _cold_start = False
+            _current = recorder
+            try:
+                with recorder.span('total'):
+                    return handler(event, context)
+            finally:
+                _current = None
+                recorder.flush()
+        return wrapper
+    return decorator
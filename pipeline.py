@@ -0,0 +1,196 @@
+import queue
+import threading
+import time
+
+from metrics import count, span
+
+# Items that may wait between two stages; a full queue blocks the stage
+# upstream of it, so a slow stage slows the ones before it instead of
+# letting work pile up in memory
+DEFAULT_QUEUE_SIZE = 2
+
+# How often blocked workers check whether the pipeline was stopped
+_POLL_SECONDS = 0.05
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a pipeline: fn(item) -> item for the next stage.
+
+    With workers > 1 the stage processes several items at once, and its
+    output order may differ from its input order.
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+
+
+class _StageStats:
+    def __init__(self, workers):
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.blocked = 0.0
+        self.finished = 0
+        self.lock = threading.Lock()
+
+    def add(self, busy=0.0, waiting=0.0, blocked=0.0, items=0):
+        with self.lock:
+            self.busy += busy
+            self.waiting += waiting
+            self.blocked += blocked
+            self.items += items
+
+    def report(self, elapsed):
+        busy_per_worker = self.busy / self.workers
+        return {
+            'items': self.items,
+            'workers': self.workers,
+            'busySeconds': round(self.busy, 3),
+            'waitingSeconds': round(self.waiting, 3),
+            'blockedSeconds': round(self.blocked, 3),
+            'itemsPerSecond': round(self.items / busy_per_worker, 2) if busy_per_worker > 0 else None,
+            'utilization': round(busy_per_worker / elapsed, 3) if elapsed > 0 else None
+        }
+
+
+def run_pipeline(source_name, source, stages, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Run source and every stage concurrently, connected by bounded queues.
+
+    source is an iterable (typically a generator) that runs on its own
+    thread; each item it yields flows through the stages in order. As soon
+    as the first item is produced the first stage works on it while the
+    source produces the next one, and so on down the line.
+
+    Returns (outputs, report). outputs holds what the last stage returned,
+    in completion order. report["stages"] has one entry per stage (the
+    source first) with its item count, busy time, time spent waiting for
+    input and blocked on a full output queue, throughput while busy and
+    utilization. report["bottleneck"] names the stage that was busy for
+    the largest share of the run.
+
+    If the source or any stage raises, the pipeline stops and the first
+    exception is re-raised.
+
+    Example:
+        outputs, report = run_pipeline('extract', pages, [
+            Stage('translate', translate_page),
+            Stage('synthesize', synthesize_page, workers=2)
+        ])
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = {source_name: _StageStats(1)}
+    for stage in stages:
+        stats[stage.name] = _StageStats(stage.workers)
+    outputs = []
+    outputs_lock = threading.Lock()
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+
+    def put(target, item, stage_stats):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stage_stats.add(blocked=time.perf_counter() - start)
+
+    def get(source_queue, stage_stats):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                item = source_queue.get(timeout=_POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _DONE
+        stage_stats.add(waiting=time.perf_counter() - start)
+        return item
+
+    def produce():
+        source_stats = stats[source_name]
+        try:
+            iterator = iter(source)
+            while not stop.is_set():
+                start = time.perf_counter()
+                with span(source_name):
+                    item = next(iterator, _DONE)
+                source_stats.add(busy=time.perf_counter() - start)
+                if item is _DONE:
+                    break
+                source_stats.add(items=1)
+                put(queues[0], item, source_stats)
+        except Exception as e:
+            fail(e)
+        finally:
+            put(queues[0], _DONE, source_stats)
+
+    def work(index):
+        stage = stages[index]
+        stage_stats = stats[stage.name]
+        last = index == len(stages) - 1
+        try:
+            while not stop.is_set():
+                item = get(queues[index], stage_stats)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                with span(stage.name):
+                    result = stage.fn(item)
+                stage_stats.add(busy=time.perf_counter() - start, items=1)
+                if last:
+                    with outputs_lock:
+                        outputs.append(result)
+                else:
+                    put(queues[index + 1], result, stage_stats)
+        except Exception as e:
+            fail(e)
+        finally:
+            with stage_stats.lock:
+                stage_stats.finished += 1
+                all_finished = stage_stats.finished == stage.workers
+            if all_finished:
+                # The last worker of a stage tells the next stage there is no more input
+                if not last:
+                    put(queues[index + 1], _DONE, stage_stats)
+            else:
+                # Let this stage's other workers see the end of input too
+                put(queues[index], _DONE, stage_stats)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=produce, name=f"pipeline-{source_name}", daemon=True)]
+    for index, stage in enumerate(stages):
+        for worker in range(stage.workers):
+            threads.append(threading.Thread(
+                target=work, args=(index,), name=f"pipeline-{stage.name}-{worker}", daemon=True
+            ))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+
+    stage_reports = {name: stage_stats.report(elapsed) for name, stage_stats in stats.items()}
+    for name, stage_report in stage_reports.items():
+        count(f"{name}_items", stage_report['items'])
+    return outputs, {
+        'stages': stage_reports,
+        'bottleneck': max(stage_reports, key=lambda name: stage_reports[name]['utilization'] or 0),
+        'totalSeconds': round(elapsed, 3)
+    }
@@ -1,8 +1,200 @@
 import json
-import boto3
 import os
-from botocore.exceptions import ClientError
+import re
 
+from cold_start import lazy_import, preload, priming_hook
+from concurrency import bounded_imap
+from metrics import instrumented, span
+from result_cache import cache_key
+from text_chunks import split_text
+from throttling import throttled_client
+
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+ENGINE = 'generative'
+
+# SynthesizeSpeech accepts up to 3,000 billed characters per request; longer
+# text is rendered in segments of at most this many characters
+MAX_SEGMENT_CHARS = 3000
+
+# Maximum number of synthesize_speech calls in flight for one long text
+DEFAULT_CONCURRENCY = int(os.environ.get('POLLY_CONCURRENCY', '4'))
+
+# S3 multipart parts (except the last) must be at least 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+CONTENT_TYPES = {
+    'mp3': 'audio/mpeg',
+    'ogg_vorbis': 'audio/ogg',
+    'pcm': 'audio/L16'
+}
+
+_SPEAK_TAG = re.compile(r'^\s*<speak[^>]*>(.*)</speak>\s*$', re.DOTALL)
+_OPEN_TAG = re.compile(r'<(?!/)[^>]*?(?<!/)>')
+_CLOSE_TAG = re.compile(r'</[^>]+>')
+
+
+def audio_key(text, voice_id, output_format, language_code, engine=ENGINE):
+    """
+    Content-addressed S3 key: identical text and synthesis parameters always
+    map to the same object, so repeated prompts can reuse earlier audio.
+    """
+    digest = cache_key('polly', {
+        'text': text,
+        'voiceId': voice_id,
+        'outputFormat': output_format,
+        'languageCode': language_code,
+        'engine': engine
+    })
+    return f"polly-audio/{digest}.{output_format}"
+
+
+def object_exists(s3, bucket, key):
+    """
+    Cheap existence check with HeadObject.
+    """
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
+def presigned_url(s3, bucket, key, expires_in=3600):
+    """
+    Pre-signed GET URL for the audio object (valid for 1 hour by default).
+    """
+    with span('presign'):
+        return s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+
+def split_segments(text, max_chars):
+    """
+    Split plain text or SSML into segments Polly can synthesize on their own.
+
+    Returns (segments, text_type). SSML is split inside its <speak> element
+    only where no other element is open, and each segment is re-wrapped in
+    <speak>. Markup does not count towards Polly's billed characters, so
+    SSML segments may be somewhat longer than max_chars in total.
+    """
+    match = _SPEAK_TAG.match(text)
+    if not match:
+        return [chunk for chunk, _ in split_text(text, max_chars, len) if chunk.strip()], 'text'
+
+    segments = []
+    pending = ''
+    for chunk, separator in split_text(match.group(1), max_chars, len):
+        pending += chunk + separator
+        # Only cut where every element opened so far has been closed and
+        # no tag was split in half
+        depth = len(_OPEN_TAG.findall(pending)) - len(_CLOSE_TAG.findall(pending))
+        if depth <= 0 and pending.rfind('<') <= pending.rfind('>') and pending.strip():
+            segments.append(f"<speak>{pending.strip()}</speak>")
+            pending = ''
+    if pending.strip():
+        segments.append(f"<speak>{pending.strip()}</speak>")
+    return segments, 'ssml'
+
+
+def strip_id3(audio):
+    """
+    Drop a leading ID3v2 tag so MP3 segments can be joined frame to frame.
+    """
+    if audio[:3] != b'ID3' or len(audio) < 10:
+        return audio
+    size = (audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9]
+    footer = 10 if audio[5] & 0x10 else 0
+    return audio[10 + size + footer:]
+
+
+def synthesize_long_form(polly, s3, bucket, key, text, voice_id, output_format,
+                         language_code, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Synthesize text of any length and stream the audio into S3.
+
+    Segments are rendered concurrently but written in order into a
+    multipart upload, so at most `concurrency` segments plus one part are
+    held in memory at a time. MP3 segments are joined frame to frame and
+    PCM samples are appended directly. Ogg Vorbis segments are written as
+    consecutive logical streams (a chained Ogg file, which the Ogg format
+    defines as the way to concatenate streams).
+    """
+    segments, text_type = split_segments(text, MAX_SEGMENT_CHARS)
+
+    def synthesize(segment):
+        with span('synthesize'):
+            response = polly.synthesize_speech(
+                Text=segment,
+                TextType=text_type,
+                OutputFormat=output_format,
+                VoiceId=voice_id,
+                Engine=ENGINE,
+                LanguageCode=language_code
+            )
+            return response['AudioStream'].read()
+
+    upload = s3.create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ContentType=CONTENT_TYPES.get(output_format, f'audio/{output_format}')
+    )
+    upload_id = upload['UploadId']
+    parts = []
+    buffer = bytearray()
+
+    def flush():
+        part_number = len(parts) + 1
+        with span('s3_upload'):
+            response = s3.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=bytes(buffer)
+            )
+        parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        buffer.clear()
+
+    try:
+        for index, audio in enumerate(bounded_imap(synthesize, segments, concurrency)):
+            if output_format == 'mp3' and index > 0:
+                audio = strip_id3(audio)
+            buffer += audio
+            if len(buffer) >= MULTIPART_PART_SIZE:
+                flush()
+        if buffer or not parts:
+            flush()
+
+        s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    return len(segments)
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Polly and S3 clients ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('polly')
+    throttled_client('s3')
+
+
+@instrumented('polly')
 def lambda_handler(event, context):
     """
     Lambda function that demonstrates using Amazon Polly to convert text to speech.
@@ -13,13 +205,25 @@ def lambda_handler(event, context):
     3. Saves the audio file to S3
     4. Returns the S3 URL of the generated audio
 
+    The S3 key is derived from a hash of the text and every synthesis
+    parameter. When that object already exists, Polly is not called at all
+    and a fresh pre-signed URL for the existing audio is returned. Pass
+    "cacheControl": {"bypass": true} to force a new synthesis.
+
+    Text longer than one request allows, or any text when "longForm" is
+    true, is split at sentence boundaries (plain text or SSML), rendered
+    concurrently and streamed into S3 with a multipart upload.
+
     The Lambda function requires these permissions:
     polly:SynthesizeSpeech
+    s3:GetObject (for the existence check and pre-signed URL)
     s3:PutObject (for storing the audio file)
+    s3:AbortMultipartUpload (long-form mode)
     """
-    # Initialize the Polly client
-    polly = boto3.client('polly')
-    s3 = boto3.client('s3')
+    # Reuse the container's Polly and S3 clients
+    with span('client_init'):
+        polly = throttled_client('polly', context)
+        s3 = throttled_client('s3', context)
     
     # Get parameters from the event
     text = event.get('text', 'Hola, esta es una prueba de Amazon Polly.')
@@ -36,45 +240,85 @@ def lambda_handler(event, context):
             })
         }
     
-    # Generate a unique filename
-    filename = f"polly-{context.aws_request_id}.{output_format}"
-    s3_key = f"polly-audio/{filename}"
+    try:
+        concurrency = int(event.get('concurrency', DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        concurrency = 0
+    if concurrency < 1:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency must be a number of at least 1'})
+        }
+    
+    # Identical requests share one audio object
+    s3_key = audio_key(text, voice_id, output_format, language_code)
+    bypass_cache = (event.get('cacheControl') or {}).get('bypass')
     
     try:
+        with span('exists_check'):
+            exists = not bypass_cache and object_exists(s3, bucket, s3_key)
+        if exists:
+            url = presigned_url(s3, bucket, s3_key)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Text-to-speech audio already available',
+                    's3Uri': f"s3://{bucket}/{s3_key}",
+                    'presignedUrl': url,
+                    'cached': True
+                })
+            }
+
+        if event.get('longForm') or len(text) > MAX_SEGMENT_CHARS:
+            segment_count = synthesize_long_form(
+                polly, s3, bucket, s3_key, text, voice_id, output_format,
+                language_code, concurrency
+            )
+
+            url = presigned_url(s3, bucket, s3_key)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Text-to-speech conversion successful',
+                    's3Uri': f"s3://{bucket}/{s3_key}",
+                    'presignedUrl': url,
+                    'cached': False,
+                    'segments': segment_count
+                })
+            }
+
         # Request speech synthesis with Generative Engine
-        response = polly.synthesize_speech(
-            Text=text,
-            OutputFormat=output_format,
-            VoiceId=voice_id,
-            Engine='generative',
-            LanguageCode=language_code
-        )
+        with span('synthesize'):
+            response = polly.synthesize_speech(
+                Text=text,
+                OutputFormat=output_format,
+                VoiceId=voice_id,
+                Engine=ENGINE,
+                LanguageCode=language_code
+            )
+            audio_stream = response["AudioStream"].read() if "AudioStream" in response else None
         
         # Access the audio stream from the response
-        if "AudioStream" in response:
-            audio_stream = response["AudioStream"].read()
-            
+        if audio_stream is not None:
             # Upload the audio file to S3
-            s3.put_object(
-                Bucket=bucket,
-                Key=s3_key,
-                Body=audio_stream,
-                ContentType=f'audio/{output_format}'
-            )
+            with span('s3_upload'):
+                s3.put_object(
+                    Bucket=bucket,
+                    Key=s3_key,
+                    Body=audio_stream,
+                    ContentType=CONTENT_TYPES.get(output_format, f'audio/{output_format}')
+                )
             
             # Generate a pre-signed URL (valid for 1 hour)
-            url = s3.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket, 'Key': s3_key},
-                ExpiresIn=3600
-            )
+            url = presigned_url(s3, bucket, s3_key)
             
             return {
                 'statusCode': 200,
                 'body': json.dumps({
                     'message': 'Text-to-speech conversion successful',
                     's3Uri': f"s3://{bucket}/{s3_key}",
-                    'presignedUrl': url
+                    'presignedUrl': url,
+                    'cached': False
                 })
             }
         else:
@@ -85,7 +329,7 @@ def lambda_handler(event, context):
                 })
             }
             
-    except ClientError as e:
+    except Exception as e:
         print(f"Error in Polly synthesis: {str(e)}")
         return {
             'statusCode': 500,
@@ -0,0 +1,80 @@
+import struct
+import zlib
+
+# PNG signature and fixed IHDR fields for a 1-bit grayscale image
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_BIT_DEPTH = 1
+_COLOR_TYPE_GRAYSCALE = 0
+
+
+def _png_chunk(chunk_type, data):
+    return (
+        struct.pack('>I', len(data))
+        + chunk_type
+        + data
+        + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+    )
+
+
+def matrix_to_png(matrix, box_size=10, compress_level=6):
+    """
+    Encode a QR module matrix (rows of booleans, True = dark, border
+    included as returned by QRCode.get_matrix()) as a 1-bit grayscale PNG.
+
+    Each module becomes a box_size x box_size square, exactly as
+    qrcode's PIL image factory draws it, so the decoded pixels are
+    identical to qr.make_image(fill_color="black", back_color="white").
+    """
+    size = len(matrix) * box_size
+    row_bytes = (size + 7) // 8
+    padding = row_bytes * 8 - size
+
+    raw = bytearray()
+    rendered_rows = {}
+    for row in matrix:
+        key = tuple(row)
+        scanline = rendered_rows.get(key)
+        if scanline is None:
+            # White pixels are 1 bits; pad the scanline out to a whole byte
+            bits = ''.join(('0' if dark else '1') * box_size for dark in row) + '0' * padding
+            scanline = b'\x00' + int(bits, 2).to_bytes(row_bytes, 'big')
+            rendered_rows[key] = scanline
+        raw += scanline * box_size
+
+    header = struct.pack('>IIBBBBB', size, size, _BIT_DEPTH, _COLOR_TYPE_GRAYSCALE, 0, 0, 0)
+    return b''.join((
+        _PNG_SIGNATURE,
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', zlib.compress(bytes(raw), compress_level)),
+        _png_chunk(b'IEND', b'')
+    ))
+
+
+def matrix_to_svg(matrix, box_size=10):
+    """
+    Encode a QR module matrix as a compact SVG.
+
+    Dark modules are merged into horizontal runs and drawn as a single
+    path in module units; the width and height attributes scale it to the
+    same pixel size as the PNG.
+    """
+    modules = len(matrix)
+    size = modules * box_size
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < modules and row[x]:
+                x += 1
+            path.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path d="{"".join(path)}" fill="#000"/></svg>'
+    ).encode('utf-8')
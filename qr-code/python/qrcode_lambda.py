@@ -1,10 +1,195 @@
 import json
-import boto3
-import qrcode
+import os
 import io
 import uuid
 from datetime import datetime
 
+from aws_clients import get_resource
+from cold_start import lazy_import, preload, priming_hook
+from concurrency import bounded_map
+from metrics import instrumented, span
+from qr_render import matrix_to_png, matrix_to_svg
+from result_cache import cache_key
+from throttling import throttled_client
+
+# The qrcode package pulls in Pillow when it is installed; load both only
+# when a code is actually rendered
+qrcode = lazy_import('qrcode')
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+# Maximum number of S3 uploads in flight for a batch
+DEFAULT_CONCURRENCY = int(os.environ.get('QRCODE_CONCURRENCY', '16'))
+
+# Rendering parameters; they are part of the content-derived key
+QR_PARAMS = {
+    'version': 1,
+    'errorCorrection': 'L',
+    'boxSize': 10,
+    'border': 4
+}
+
+# "fast" encodes the module matrix directly and does not need Pillow;
+# "pil" renders through qr.make_image
+DEFAULT_RENDERER = os.environ.get('QRCODE_RENDERER', 'fast')
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+
+def build_qr(url):
+    qr = qrcode.QRCode(
+        version=QR_PARAMS['version'],
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=QR_PARAMS['boxSize'],
+        border=QR_PARAMS['border'],
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr(url, image_format='png', renderer=DEFAULT_RENDERER):
+    """
+    Render a URL as a QR code and return the encoded PNG or SVG bytes.
+
+    The fast renderer produces pixel-identical PNGs to the PIL path.
+    SVG output is only available from the fast renderer.
+    """
+    with span('encode'):
+        qr = build_qr(url)
+
+    with span('render'):
+        return _render(qr, image_format, renderer)
+
+
+def _render(qr, image_format, renderer):
+    if renderer == 'fast' or image_format == 'svg':
+        if image_format == 'svg':
+            return matrix_to_svg(qr.get_matrix(), QR_PARAMS['boxSize'])
+        return matrix_to_png(qr.get_matrix(), QR_PARAMS['boxSize'])
+
+    # Create an image from the QR Code
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    # Save the image to a bytes buffer
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_code_id(url, image_format='png'):
+    """
+    Content-derived id: the same URL rendered with the same parameters always
+    gets the same id and S3 key.
+    """
+    return cache_key('qrcode', {'url': url, 'params': QR_PARAMS, 'format': image_format})[:32]
+
+
+def store_qr_code(s3_client, bucket, url, image_format='png', renderer=DEFAULT_RENDERER):
+    """
+    Upload the QR code for url unless an identical one already exists in S3.
+    """
+    item_id = qr_code_id(url, image_format)
+    s3_key = f"qrcodes/{item_id}.{image_format}"
+
+    try:
+        with span('exists_check'):
+            s3_client.head_object(Bucket=bucket, Key=s3_key)
+        reused = True
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        body = render_qr(url, image_format, renderer)
+        with span('s3_upload'):
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=s3_key,
+                Body=body,
+                ContentType=CONTENT_TYPES[image_format]
+            )
+        reused = False
+
+    return {
+        'id': item_id,
+        'url': url,
+        's3Key': s3_key,
+        's3Uri': f"s3://{bucket}/{s3_key}",
+        'reused': reused
+    }
+
+
+def generate_batch(urls, bucket, table_name, concurrency, context=None,
+                   image_format='png', renderer=DEFAULT_RENDERER):
+    """
+    Generate QR codes for many URLs at once.
+
+    Repeated URLs are rendered once. Codes that already exist in S3 are
+    reused rather than re-rendered, uploads run concurrently, and the
+    DynamoDB items go through batch_writer. Returns one result per input
+    URL, in order, each with its own success flag.
+    """
+    s3_client = throttled_client('s3', context)
+    unique_urls = list(dict.fromkeys(urls))
+
+    def store(url):
+        try:
+            return store_qr_code(s3_client, bucket, url, image_format, renderer)
+        except Exception as e:
+            print(f"Error generating QR code for {url}: {str(e)}")
+            return {'url': url, 'error': str(e)}
+
+    stored = dict(zip(unique_urls, bounded_map(store, unique_urls, concurrency, context)))
+
+    # batch_writer is not thread-safe, so the writes happen here in bulk
+    timestamp = datetime.now().isoformat()
+    written = [result for result in stored.values() if 'error' not in result]
+    try:
+        table = get_resource('dynamodb').Table(table_name)
+        with span('dynamodb_write'), table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+            for result in written:
+                batch.put_item(Item={
+                    'id': result['id'],
+                    'url': result['url'],
+                    's3Uri': result['s3Uri'],
+                    'createdAt': timestamp
+                })
+        for result in written:
+            result['createdAt'] = timestamp
+    except Exception as e:
+        print(f"Error writing QR code items to DynamoDB: {str(e)}")
+        for result in written:
+            result['error'] = f"DynamoDB write failed: {str(e)}"
+
+    results = []
+    for url in urls:
+        result = stored[url]
+        if 'error' in result:
+            results.append({'url': url, 'success': False, 'error': result['error']})
+            continue
+        results.append({
+            'url': url,
+            'success': True,
+            'id': result['id'],
+            's3Uri': result['s3Uri'],
+            'reused': result['reused'],
+            'createdAt': result['createdAt']
+        })
+    return results
+
+
+@priming_hook
+def prime():
+    """
+    Load qrcode and boto3 and create the S3 and DynamoDB clients ahead of the first request.
+    """
+    preload('concurrent.futures', 'qrcode')
+    throttled_client('s3')
+    get_resource('dynamodb')
+
+
+@instrumented('qrcode')
 def lambda_handler(event, context):
     """
     Lambda function that generates a QR code from a URL, uploads it to S3,
@@ -28,15 +213,53 @@ def lambda_handler(event, context):
       "tableName": "qrcode-urls",
       "filename": "my-qrcode.png"  # Optional
     }
+
+    Batch mode: pass "urls" (a list) instead of "url". Each distinct URL is
+    stored under a content-derived key (qrcodes/<id>.png) so repeated URLs
+    and previously generated codes are reused. Uploads run concurrently
+    (up to "concurrency", default QRCODE_CONCURRENCY) and items are written
+    with batch_writer. Batch mode also needs s3:GetObject and
+    dynamodb:BatchWriteItem.
+
+    "format" may be "png" (default) or "svg". "renderer" selects "fast"
+    (default, QRCODE_RENDERER; encodes the module matrix directly without
+    Pillow) or "pil" (the qr.make_image path).
     """
     # Get parameters from the event
     url = event.get('url')
+    urls = event.get('urls')
     bucket = event.get('bucket')
     table_name = event.get('tableName')
     filename = event.get('filename')
+    image_format = event.get('format', 'png')
+    renderer = event.get('renderer', DEFAULT_RENDERER)
     
     # Validate required parameters
-    if not url:
+    if image_format not in CONTENT_TYPES:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'message': 'format must be "png" or "svg"'
+            })
+        }
+
+    if renderer not in ('fast', 'pil'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'message': 'renderer must be "fast" or "pil"'
+            })
+        }
+
+    if urls is not None and (not isinstance(urls, list) or not all(isinstance(u, str) and u for u in urls)):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'message': 'urls must be a list of non-empty strings'
+            })
+        }
+
+    if not url and not urls:
         return {
             'statusCode': 400,
             'body': json.dumps({
@@ -60,62 +283,64 @@ def lambda_handler(event, context):
             })
         }
     
+    if urls:
+        concurrency = int(event.get('concurrency', DEFAULT_CONCURRENCY))
+        results = generate_batch(urls, bucket, table_name, concurrency, context, image_format, renderer)
+        succeeded = sum(1 for result in results if result['success'])
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': f'Generated {succeeded} of {len(results)} QR code(s)',
+                'results': results
+            })
+        }
+
     # Generate a filename if not provided
     if not filename:
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        filename = f"qrcode-{timestamp}.png"
+        filename = f"qrcode-{timestamp}.{image_format}"
     
     try:
         # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        
-        # Create an image from the QR Code
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save the image to a bytes buffer
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
+        image_bytes = render_qr(url, image_format, renderer)
         
         # Upload to S3
-        s3_client = boto3.client('s3')
+        with span('client_init'):
+            s3_client = throttled_client('s3', context)
         s3_key = f"qrcodes/{filename}"
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=s3_key,
-            Body=buffer,
-            ContentType='image/png'
-        )
+        with span('s3_upload'):
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=s3_key,
+                Body=image_bytes,
+                ContentType=CONTENT_TYPES[image_format]
+            )
         
         # Generate a pre-signed URL (valid for 1 hour)
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket, 'Key': s3_key},
-            ExpiresIn=3600
-        )
+        with span('presign'):
+            presigned_url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket, 'Key': s3_key},
+                ExpiresIn=3600
+            )
         
         # Store URL data in DynamoDB
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(table_name)
+        with span('client_init'):
+            dynamodb = get_resource('dynamodb')
+            table = dynamodb.Table(table_name)
         
         item_id = str(uuid.uuid4())
         timestamp = datetime.now().isoformat()
         
-        table.put_item(
-            Item={
-                'id': item_id,
-                'url': url,
-                's3Uri': f"s3://{bucket}/{s3_key}",
-                'createdAt': timestamp
-            }
-        )
+        with span('dynamodb_write'):
+            table.put_item(
+                Item={
+                    'id': item_id,
+                    'url': url,
+                    's3Uri': f"s3://{bucket}/{s3_key}",
+                    'createdAt': timestamp
+                }
+            )
         
         return {
             'statusCode': 200,
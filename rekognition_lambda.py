@@ -1,19 +1,246 @@
+import io
 import json
-import boto3
-from urllib.parse import unquote_plus
+import os
 
+from cold_start import preload, priming_hook
+from metrics import instrumented, span
+from result_spill import SpillingResults
+from s3_events import is_sqs_event, object_location
+from throttling import throttled_client
+from work_loop import WorkLoop
+
+# Maximum number of detect_labels calls in flight at once
+DEFAULT_CONCURRENCY = int(os.environ.get('REKOGNITION_CONCURRENCY', '8'))
+
+# "s3" lets Rekognition read each image from S3; "bytes" reads it here,
+# downscales it and sends the pixels inline
+DEFAULT_MODE = os.environ.get('REKOGNITION_MODE', 's3')
+
+# Bytes mode: longest edge images are scaled down to, and the JPEG quality
+# they are re-encoded with
+MAX_DIMENSION = int(os.environ.get('REKOGNITION_MAX_DIMENSION', '1600'))
+JPEG_QUALITY = int(os.environ.get('REKOGNITION_JPEG_QUALITY', '85'))
+
+# DetectLabels accepts at most 5 MB of JPEG or PNG image bytes
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+SUPPORTED_FORMATS = ('JPEG', 'PNG')
+
+# Bytes read first to learn an image's format and dimensions, then the
+# size of each read of the rest of the object
+HEADER_BYTES = 64 * 1024
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def read_header(s3, bucket, key):
+    """
+    Return (first HEADER_BYTES of the object, its total size) with one ranged GET.
+    """
+    response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{HEADER_BYTES - 1}")
+    header = response['Body'].read()
+    # "bytes 0-65535/12345678"; absent when the server ignored the range
+    content_range = response.get('ContentRange')
+    size = int(content_range.rsplit('/', 1)[1]) if content_range else len(header)
+    return header, size
+
+
+def read_object(s3, bucket, key, header, size):
+    """
+    Return a stream of the whole object, reading what follows header in chunks.
+    """
+    stream = io.BytesIO()
+    stream.write(header)
+    if size > len(header):
+        body = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={len(header)}-")['Body']
+        for chunk in iter(lambda: body.read(READ_CHUNK_BYTES), b''):
+            stream.write(chunk)
+    stream.seek(0)
+    return stream
+
+
+def probe_image(header):
+    """
+    Return (format, (width, height)) from an image's first bytes, or None if they don't tell.
+    """
+    # Pillow is only needed in bytes mode
+    from PIL import Image
+
+    try:
+        # Opening only parses the header; pixels are decoded on first use
+        with Image.open(io.BytesIO(header)) as image:
+            return image.format, image.size
+    except Exception:
+        return None
+
+
+def downscale(stream, max_dimension, quality=JPEG_QUALITY):
+    """
+    Fit the image within max_dimension pixels and re-encode it as JPEG.
+
+    Returns (JPEG bytes, original (width, height), new (width, height)).
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(stream) as image:
+        original_size = image.size
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, which is much
+        # faster and smaller than decoding every pixel and then resizing
+        image.draft('RGB', (max_dimension, max_dimension))
+        # Apply the EXIF orientation, as Rekognition does for S3 objects
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue(), original_size, image.size
+
+
+def prepare_image(s3, bucket, key, max_dimension):
+    """
+    Return (Image argument for detect_labels, description of what is sent).
+
+    Images that are already JPEG or PNG, within max_dimension and within
+    the DetectLabels size limit are still read by Rekognition from S3, so
+    only their header is downloaded here. Anything else is streamed in,
+    downscaled and re-encoded in memory, and sent as bytes.
+    """
+    with span('s3_read_header'):
+        header, size = read_header(s3, bucket, key)
+    probe = probe_image(header)
+    if probe is not None:
+        image_format, dimensions = probe
+        if image_format in SUPPORTED_FORMATS and max(dimensions) <= max_dimension and size <= MAX_IMAGE_BYTES:
+            return {'S3Object': {'Bucket': bucket, 'Name': key}}, {
+                'source': 's3',
+                'originalSize': list(dimensions),
+                'originalBytes': size
+            }
+
+    with span('s3_read'):
+        stream = read_object(s3, bucket, key, header, size)
+    with span('downscale'):
+        data, original_size, sent_size = downscale(stream, max_dimension)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image is {len(data)} bytes after downscaling, over the {MAX_IMAGE_BYTES} byte limit")
+    return {'Bytes': data}, {
+        'source': 'bytes',
+        'originalSize': list(original_size),
+        'originalBytes': size,
+        'sentSize': list(sent_size),
+        'sentBytes': len(data)
+    }
+
+
+def analyze_record(rekognition, record, s3=None, max_dimension=MAX_DIMENSION):
+    """
+    Detect labels for one S3 record, returning either its labels or its error.
+
+    With an S3 client (bytes mode) the image is downscaled to max_dimension
+    here when needed and sent inline; otherwise Rekognition reads it from S3.
+    """
+    bucket, key = object_location(record)
+
+    try:
+        image = {
+            'S3Object': {
+                'Bucket': bucket,
+                'Name': key
+            }
+        }
+        sent = None
+        if s3 is not None:
+            image, sent = prepare_image(s3, bucket, key, max_dimension)
+
+        # Call Amazon Rekognition to detect labels
+        with span('detect_labels'):
+            response = rekognition.detect_labels(
+                Image=image,
+                MaxLabels=10,
+                MinConfidence=70
+            )
+
+        # Extract labels from the response
+        labels = [{'name': label['Name'], 'confidence': label['Confidence']}
+                 for label in response['Labels']]
+
+        result = {
+            'imageLocation': f"s3://{bucket}/{key}",
+            'labels': labels
+        }
+        if sent is not None:
+            result['imageSent'] = sent
+        return result
+
+    except Exception as e:
+        print(f"Error analyzing image {bucket}/{key}: {str(e)}")
+        return {
+            'imageLocation': f"s3://{bucket}/{key}",
+            'error': str(e)
+        }
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Rekognition client ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('rekognition')
+    if DEFAULT_MODE == 'bytes':
+        preload('PIL.Image', 'PIL.ImageOps', 'PIL.JpegImagePlugin', 'PIL.PngImagePlugin')
+        throttled_client('s3')
+
+
+@instrumented('rekognition')
 def lambda_handler(event, context):
     """
     Lambda function that demonstrates using Amazon Rekognition to detect objects and labels in images.
     
     This function:
-    1. Gets an S3 object (image) from the event
-    2. Uses Amazon Rekognition to detect labels in the image
+    1. Gets the S3 objects (images) from the event
+    2. Uses Amazon Rekognition to detect labels in the images concurrently
     3. Returns the detected labels with confidence scores from all images
+
+    Up to "concurrency" images (default REKOGNITION_CONCURRENCY, 8) are
+    analyzed at once, fewer as the invocation nears its timeout.
+
+    The function can also be fed by an SQS queue that receives the bucket's
+    S3 notifications. The images from every message in the batch are
+    analyzed together, and the response lists the messages whose images
+    failed as batchItemFailures so only those are redelivered (enable
+    ReportBatchItemFailures on the event source mapping).
+
+    Results are serialized one image at a time. If they grow past
+    RESULT_SPILL_THRESHOLD_BYTES they are written, compressed, to the
+    event's "resultBucket" (or RESULT_BUCKET), and the body returns a
+    manifest with a pre-signed URL instead of the results.
+
+    No new image is started once less than WORK_LOOP_RESERVE_MS of the
+    invocation remains. The function then invokes itself asynchronously
+    with only the unstarted images (SQS batches report their messages as
+    failed instead, so they are redelivered), and the body's "checkpoint"
+    says how many were re-enqueued. With CHECKPOINT_TABLE set, completed
+    images are recorded in DynamoDB and skipped when the same batch is
+    retried.
+
+    With "mode": "bytes" (default REKOGNITION_MODE, "s3") the function
+    reads each image itself: a ranged GET of its first 64 KB gives the
+    format and dimensions, and images larger than "maxDimension" pixels
+    (default REKOGNITION_MAX_DIMENSION, 1600), over 5 MB or in a format
+    Rekognition does not read are streamed in, downscaled and re-encoded as
+    JPEG in memory, then sent inline. Each result's "imageSent" tells how
+    the image was sent and at what size. Bytes mode needs Pillow.
     
     The Lambda function requires these permissions:
     rekognition:DetectLabels
     s3:GetObject
+    s3:PutObject (spilled results)
+    lambda:InvokeFunction (re-enqueueing unfinished records)
+    dynamodb:Query (CHECKPOINT_TABLE)
+    dynamodb:BatchWriteItem (CHECKPOINT_TABLE)
+    sqs:ReceiveMessage (SQS source)
+    sqs:DeleteMessage (SQS source)
+    sqs:GetQueueAttributes (SQS source)
     
     Example test event:
     {
@@ -31,51 +258,58 @@ def lambda_handler(event, context):
       ]
     }
     """
-    # Initialize the Rekognition client
-    rekognition = boto3.client('rekognition')
+    # Reuse the container's Rekognition client
+    with span('client_init'):
+        rekognition = throttled_client('rekognition', context)
     
-    # Process all records and store results
-    results = []
+    mode = event.get('mode', DEFAULT_MODE)
     
-    for record in event['Records']:
-        bucket = record['s3']['bucket']['name']
-        key = unquote_plus(record['s3']['object']['key'])
+    # Validate input
+    try:
+        concurrency = int(event.get('concurrency', DEFAULT_CONCURRENCY))
+        max_dimension = int(event.get('maxDimension', MAX_DIMENSION))
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency and maxDimension must be numbers'})
+        }
+    if concurrency < 1 or max_dimension < 1:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency and maxDimension must be at least 1'})
+        }
         
-        try:
-            # Call Amazon Rekognition to detect labels
-            response = rekognition.detect_labels(
-                Image={
-                    'S3Object': {
-                        'Bucket': bucket,
-                        'Name': key
-                    }
-                },
-                MaxLabels=10,
-                MinConfidence=70
-            )
+    if mode not in ('s3', 'bytes'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': f"Invalid input: mode must be 's3' or 'bytes', got {mode!r}"
+            })
+        }
             
-            # Extract labels from the response
-            labels = [{'name': label['Name'], 'confidence': label['Confidence']} 
-                     for label in response['Labels']]
+    # Bytes mode reads the images itself
+    s3 = throttled_client('s3', context) if mode == 'bytes' else None
             
-            # Add this image's results to our collection
-            results.append({
-                'imageLocation': f"s3://{bucket}/{key}",
-                'labels': labels
-            })
+    def analyze(record):
+        return analyze_record(rekognition, record, s3, max_dimension)
             
-        except Exception as e:
-            print(f"Error analyzing image {bucket}/{key}: {str(e)}")
-            results.append({
-                'imageLocation': f"s3://{bucket}/{key}",
-                'error': str(e)
-            })
+    # Records are started only while time remains; the rest are re-enqueued
+    loop = WorkLoop('rekognition', event, context)
     
-    # Return all results
-    return {
-        'statusCode': 200,
-        'body': json.dumps({
-            'message': f'Processed {len(results)} image(s)',
-            'results': results
-        })
-    }
\ No newline at end of file
+    # SQS batches report failed and unfinished messages instead of failing the whole batch
+    if is_sqs_event(event):
+        results, failures = loop.process_sqs_batch(analyze, concurrency)
+        print(f"Processed {len(results)} image(s) from {len(event['Records'])} message(s), "
+              f"{len(failures)} message(s) failed")
+        return {'batchItemFailures': failures}
+
+    # Process the records concurrently; results keep the input order and
+    # each record's errors are captured in its own result. Each result is
+    # serialized as soon as it is ready, and large outputs spill to S3.
+    results = SpillingResults('rekognition', event.get('resultBucket'), context)
+    for result in loop.imap(analyze, concurrency):
+        results.add(result)
+
+    # Return all results, or a manifest pointing at them, and what was
+    # skipped or re-enqueued
+    return results.response(f'Processed {results.count} image(s)', loop.finish())
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from aws_clients import get_resource
+
+# In-process tier: survives across warm invocations of the same container
+MEMORY_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MEMORY_ENTRIES', '1024'))
+
+# Shared tier: a DynamoDB table with partition key "cacheKey" and TTL enabled
+# on the "expiresAt" attribute. Leave RESULT_CACHE_TABLE unset to disable it.
+TABLE_NAME = os.environ.get('RESULT_CACHE_TABLE')
+DEFAULT_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL', '86400'))
+
+# Values reported in the X-Cache response header
+HIT_MEMORY = 'HIT-MEMORY'
+HIT_DYNAMODB = 'HIT-DYNAMODB'
+MISS = 'MISS'
+BYPASS = 'BYPASS'
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+
+def cache_key(service, params):
+    """
+    Content-addressed key: a SHA-256 of the service/model and the canonical
+    JSON of every parameter and input that affects the result.
+    """
+    canonical = json.dumps({'service': service, 'params': params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _memory_get(key, max_age):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        value, stored_at, expires_at = entry
+        now = time.time()
+        if now >= expires_at or (max_age is not None and now - stored_at > max_age):
+            return None
+        _memory.move_to_end(key)
+        return value
+
+
+def _memory_put(key, value, stored_at, expires_at):
+    with _lock:
+        _memory[key] = (value, stored_at, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_MAX_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _table():
+    return get_resource('dynamodb').Table(TABLE_NAME)
+
+
+def prime():
+    """
+    Create the DynamoDB resource for the shared tier, if it is enabled.
+    """
+    if TABLE_NAME:
+        _table()
+
+
+def _dynamodb_get(key, max_age):
+    item = _table().get_item(Key={'cacheKey': key}).get('Item')
+    if not item:
+        return None
+    now = time.time()
+    stored_at = float(item['storedAt'])
+    expires_at = float(item['expiresAt'])
+    # DynamoDB deletes expired items lazily, so check the TTL ourselves
+    if now >= expires_at or (max_age is not None and now - stored_at > max_age):
+        return None
+    return json.loads(item['value']), stored_at, expires_at
+
+
+def _dynamodb_put(key, value, stored_at, expires_at):
+    _table().put_item(Item={
+        'cacheKey': key,
+        'value': json.dumps(value),
+        'storedAt': int(stored_at),
+        'expiresAt': int(expires_at)
+    })
+
+
+def get_or_compute(service, params, compute, cache_control=None, ttl=DEFAULT_TTL_SECONDS):
+    """
+    Return (value, status, key) for a deterministic call, computing it on a miss.
+
+    The in-process LRU is checked first, then the DynamoDB table. cache_control
+    is the caller's "cacheControl" object: {"bypass": true} skips both
+    tiers entirely, and {"maxAge": seconds} ignores entries older than that.
+    Values must be JSON-serializable. Cache failures are logged and never
+    fail the request.
+    """
+    cache_control = cache_control or {}
+    key = cache_key(service, params)
+
+    if cache_control.get('bypass'):
+        return compute(), BYPASS, key
+
+    max_age = cache_control.get('maxAge')
+
+    value = _memory_get(key, max_age)
+    if value is not None:
+        return value, HIT_MEMORY, key
+
+    if TABLE_NAME:
+        try:
+            found = _dynamodb_get(key, max_age)
+        except Exception as e:
+            print(f"Error reading result cache: {str(e)}")
+            found = None
+        if found is not None:
+            value, stored_at, expires_at = found
+            _memory_put(key, value, stored_at, expires_at)
+            return value, HIT_DYNAMODB, key
+
+    value = compute()
+    stored_at = time.time()
+    expires_at = stored_at + ttl
+    _memory_put(key, value, stored_at, expires_at)
+
+    if TABLE_NAME:
+        try:
+            _dynamodb_put(key, value, stored_at, expires_at)
+        except Exception as e:
+            print(f"Error writing result cache: {str(e)}")
+
+    return value, MISS, key
+
+
+def cache_headers(status, key):
+    """
+    Response headers describing how a cached call was served.
+    """
+    return {
+        'X-Cache': status,
+        'X-Cache-Key': key
+    }
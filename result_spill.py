@@ -0,0 +1,205 @@
+import json
+import os
+import zlib
+from datetime import datetime
+
+from cold_start import lazy_import
+from metrics import span
+from s3_jsonl import S3ObjectWriter
+from throttling import throttled_client
+
+# Optional: only needed when RESULT_SPILL_COMPRESSION is "zstd"
+zstandard = lazy_import('zstandard')
+
+# Lambda rejects synchronous responses over 6 MB; bodies larger than this
+# are written to S3 instead, leaving room for the response envelope
+SPILL_THRESHOLD_BYTES = int(os.environ.get('RESULT_SPILL_THRESHOLD_BYTES', str(5 * 1024 * 1024)))
+
+# Where spilled results go, and how they are compressed ("gzip" or "zstd")
+RESULT_BUCKET = os.environ.get('RESULT_BUCKET')
+SPILL_COMPRESSION = os.environ.get('RESULT_SPILL_COMPRESSION', 'gzip')
+
+# Lifetime of the pre-signed URL returned for a spilled result
+RESULT_URL_EXPIRES = int(os.environ.get('RESULT_URL_EXPIRES', '3600'))
+
+# Failed results repeated in a manifest; the spilled object has all of them
+MAX_MANIFEST_FAILURES = int(os.environ.get('RESULT_MANIFEST_FAILURES', '100'))
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# compression -> (file extension, Content-Encoding)
+_ENCODINGS = {
+    'gzip': ('.gz', 'gzip'),
+    'zstd': ('.zst', 'zstd')
+}
+
+
+def compressor(compression):
+    """
+    Return (compression, streaming compressor) for "gzip" or "zstd".
+
+    Both compressors have compress(data) and flush(). zstd needs the
+    zstandard package; without it the results are gzipped instead.
+    """
+    if compression == 'zstd':
+        try:
+            return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        except ImportError:
+            print("zstandard is not installed; spilling results with gzip")
+    elif compression != 'gzip':
+        raise ValueError(f"Unsupported result compression: {compression}")
+    # wbits 31 writes a gzip header and trailer
+    return 'gzip', zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+class SpillingResults:
+    """
+    Builds a handler's {"message", "results"} response one result at a time.
+
+    Each result is serialized as soon as it is added and only its JSON is
+    kept. While the serialized results stay under threshold bytes the
+    response body holds them inline as before. Once they grow past it, they
+    are streamed as compressed JSON Lines (one result per line) into an S3
+    object, and the body carries a manifest with a pre-signed URL to that
+    object instead of the results. Memory then stays at about one multipart
+    part, however many results follow. The manifest repeats the first
+    MAX_MANIFEST_FAILURES failed results and counts them all; every failed
+    result is in the object, as a line with an "error".
+
+    Without a bucket the results are never spilled.
+
+    Example:
+        results = SpillingResults('textract', bucket, context)
+        for result in bounded_imap(extract, event['Records'], concurrency):
+            results.add(result)
+        return results.response(f'Processed {results.count} document(s)')
+    """
+
+    def __init__(self, name, bucket=None, context=None, threshold=None, compression=None):
+        self.name = name
+        self.bucket = bucket or RESULT_BUCKET
+        self.context = context
+        self.threshold = SPILL_THRESHOLD_BYTES if threshold is None else threshold
+        self.compression = compression or SPILL_COMPRESSION
+        self.count = 0
+        self.size = 0
+        self.failures = []
+        self.failure_count = 0
+        self._inline = []
+        self._writer = None
+        self._compressor = None
+
+    def add(self, result):
+        # json.dumps escapes non-ASCII, so its length is the size in bytes
+        encoded = json.dumps(result)
+        self.count += 1
+        self.size += len(encoded)
+        if 'error' in result:
+            self.failure_count += 1
+            if len(self.failures) < MAX_MANIFEST_FAILURES:
+                self.failures.append(result)
+
+        if self._writer is not None:
+            self._write(encoded)
+            return
+
+        self._inline.append(encoded)
+        if self.bucket and self.size > self.threshold:
+            self._spill()
+
+    def _spill(self):
+        """
+        Move the results gathered so far into a new compressed S3 object.
+        """
+        request_id = getattr(self.context, 'aws_request_id', None) or os.urandom(16).hex()
+        self.compression, self._compressor = compressor(self.compression)
+        extension, encoding = _ENCODINGS[self.compression]
+        key = f"results/{self.name}/{datetime.now().strftime('%Y/%m/%d')}/{request_id}.jsonl{extension}"
+
+        self._writer = S3ObjectWriter(
+            throttled_client('s3', self.context),
+            self.bucket,
+            key,
+            'application/jsonl',
+            content_encoding=encoding
+        )
+        inline, self._inline = self._inline, []
+        for encoded in inline:
+            self._write(encoded)
+
+    def _write(self, encoded):
+        try:
+            with span('spill_compress'):
+                data = self._compressor.compress(f"{encoded}\n".encode('ascii'))
+            if data:
+                self._writer.write(data)
+        except Exception:
+            self._writer.abort()
+            raise
+
+    def _close(self):
+        try:
+            data = self._compressor.flush()
+            if data:
+                self._writer.write(data)
+            self._writer.close()
+        except Exception:
+            self._writer.abort()
+            raise
+
+    def body(self, message, checkpoint=None):
+        """
+        Return the JSON response body, finishing the S3 object if results were spilled.
+
+        checkpoint is a work_loop.WorkLoop.finish() summary, added to the
+        body as "checkpoint" unless it is None.
+        """
+        if self._writer is None:
+            # Same text json.dumps({'message': ..., 'results': [...]}) produces,
+            # joined in one step so only one copy of the body is built
+            pieces = [f'{{"message": {json.dumps(message)}, "results": [']
+            for index, encoded in enumerate(self._inline):
+                if index:
+                    pieces.append(', ')
+                pieces.append(encoded)
+            pieces.append(']')
+            if checkpoint is not None:
+                pieces.append(f', "checkpoint": {json.dumps(checkpoint)}')
+            pieces.append('}')
+            self._inline = []
+            return ''.join(pieces)
+
+        self._close()
+        s3 = throttled_client('s3', self.context)
+        with span('presign'):
+            url = s3.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': self._writer.key},
+                ExpiresIn=RESULT_URL_EXPIRES
+            )
+        body = {
+            'message': message,
+            'resultsSpilled': True,
+            'manifest': {
+                'location': f"s3://{self.bucket}/{self._writer.key}",
+                'presignedUrl': url,
+                'expiresIn': RESULT_URL_EXPIRES,
+                'format': 'jsonl',
+                'compression': self.compression,
+                'records': self.count,
+                'uncompressedBytes': self.size,
+                'compressedBytes': self._writer.size,
+                'failureCount': self.failure_count,
+                'failures': self.failures
+            }
+        }
+        if checkpoint is not None:
+            body['checkpoint'] = checkpoint
+        return json.dumps(body)
+
+    def response(self, message, checkpoint=None):
+        return {
+            'statusCode': 200,
+            'body': self.body(message, checkpoint)
+        }
@@ -0,0 +1,164 @@
+import json
+from urllib.parse import unquote_plus
+
+from concurrency import bounded_map
+from metrics import count
+
+
+def is_sqs_event(event):
+    """
+    True if the event is a batch of SQS messages rather than an S3 notification.
+    """
+    records = event.get('Records') or []
+    return bool(records) and records[0].get('eventSource') == 'aws:sqs'
+
+
+def object_location(record):
+    """
+    Return (bucket, key) for an S3 event record, with the key URL-decoded.
+    """
+    return record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key'])
+
+
+def record_id(record):
+    """
+    Stable ID of an S3 event record: its bucket and key, plus the object
+    version or event sequencer when present so a re-uploaded object is new work.
+    """
+    bucket, key = object_location(record)
+    s3_object = record['s3']['object']
+    version = s3_object.get('versionId') or s3_object.get('sequencer')
+    return f"{bucket}/{key}@{version}" if version else f"{bucket}/{key}"
+
+
+def s3_records_from_message(message):
+    """
+    Return the S3 event records carried in one SQS message body.
+
+    Bodies may be an S3 notification sent straight to the queue or one
+    wrapped in an SNS notification. The s3:TestEvent that S3 sends when a
+    notification is configured carries no records.
+    """
+    body = json.loads(message['body'])
+    if body.get('Type') == 'Notification' and 'Message' in body:
+        body = json.loads(body['Message'])
+    if body.get('Event') == 's3:TestEvent':
+        return []
+    return body.get('Records', [])
+
+
+def succeeded(result):
+    """
+    Default completion check: a result is complete unless it has an "error".
+    """
+    return 'error' not in result
+
+
+def _redelivered(message):
+    return int(message.get('attributes', {}).get('ApproximateReceiveCount', '1')) > 1
+
+
+def process_sqs_batch(event, process_record, max_workers, context=None, reserve_ms=None, checkpoints=None,
+                      is_complete=succeeded, pending=None, resume=None):
+    """
+    Run process_record over every S3 record in a batch of SQS messages.
+
+    Records from all messages are processed together on a bounded thread
+    pool (see concurrency.bounded_map). process_record(record) returns a
+    result dict that contains an "error" key if the record failed.
+    is_complete(result) decides whether a record is done; handlers whose
+    results can be unfinished without an error (such as an asynchronous
+    job still running) pass their own check.
+
+    Returns (results, batch_item_failures). A message is reported as failed
+    if its body could not be parsed or any of its records is not complete,
+    so only those messages are redelivered. For FIFO queues every message after the
+    first failure is reported too, keeping each message group in order; with
+    checkpoints, the completed records of those messages are saved as well.
+
+    With reserve_ms, no record is started once less than reserve_ms of
+    invocation time remains, and the messages of records never started
+    are reported as failed: SQS redelivers just those instead of the whole
+    batch timing out. With checkpoints (a work_loop.Checkpoints), the
+    completed records of messages that will be redelivered are saved, and
+    on redelivery those records are skipped. For a record that is not
+    complete, pending(result) may return a token (such as the ID of an
+    asynchronous job it started); the token is saved with the record, and on
+    redelivery resume(record, token) runs instead of process_record.
+    """
+    messages = event['Records']
+    failed = set()
+    work = []
+    skipped = 0
+
+    # Unwrap the S3 records, remembering which message each came from
+    for message in messages:
+        try:
+            records = s3_records_from_message(message)
+            # Only a message seen before can have checkpointed records
+            progress = {}
+            if checkpoints is not None and records and _redelivered(message):
+                progress = checkpoints.progress(message['messageId'])
+            for record in records:
+                token = progress.get(record_id(record), False)
+                if token is None:
+                    # Completed in an earlier delivery
+                    skipped += 1
+                    continue
+                work.append((message['messageId'], record, token or None))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error reading message {message.get('messageId')}: {str(e)}")
+            failed.add(message['messageId'])
+
+    def run(item):
+        _, record, token = item
+        if token is not None and resume is not None:
+            return resume(record, token)
+        return process_record(record)
+
+    outcomes = bounded_map(
+        run,
+        work,
+        max_workers,
+        context,
+        reserve_ms=reserve_ms
+    )
+
+    results = []
+    unstarted = 0
+    for (message_id, _, _), result in zip(work, outcomes):
+        if result is None:
+            # Not started before the deadline reserve
+            unstarted += 1
+            failed.add(message_id)
+            continue
+        results.append(result)
+        if not is_complete(result):
+            failed.add(message_id)
+
+    # On FIFO queues every message after the first failure is redelivered
+    # too, including ones that completed
+    batch_item_failures = []
+    fifo = messages and messages[0].get('eventSourceARN', '').endswith('.fifo')
+    for message in messages:
+        if message['messageId'] in failed or (fifo and batch_item_failures):
+            batch_item_failures.append({'itemIdentifier': message['messageId']})
+    redelivered = {failure['itemIdentifier'] for failure in batch_item_failures}
+
+    # Messages that succeeded are deleted, so only the completed and pending
+    # records of messages that will be redelivered need a checkpoint
+    if checkpoints is not None and redelivered:
+        for (message_id, record, _), result in zip(work, outcomes):
+            if message_id not in redelivered or result is None:
+                continue
+            if is_complete(result):
+                checkpoints.add(message_id, record_id(record))
+            elif pending is not None and pending(result) is not None:
+                checkpoints.add(message_id, record_id(record), pending(result))
+        checkpoints.flush()
+
+    count('sqs_messages', len(messages))
+    count('sqs_failed_messages', len(batch_item_failures))
+    count('work_loop_skipped', skipped)
+    count('work_loop_remaining', unstarted)
+    return results, batch_item_failures
@@ -0,0 +1,201 @@
+import json
+from urllib.parse import urlparse
+
+from metrics import span
+
+# S3 multipart parts (except the last) must be at least 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+# How much of an object is read per request while streaming lines
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_s3_uri(uri):
+    """
+    Split s3://bucket/key into (bucket, key).
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme != 's3' or not parsed.netloc:
+        raise ValueError(f"Not an S3 URI: {uri}")
+    return parsed.netloc, parsed.path.lstrip('/')
+
+
+class S3ObjectWriter:
+    """
+    Streams bytes into one S3 object.
+
+    Data is buffered until a multipart part fills up, so memory stays at
+    about one part however large the object grows. Objects that never
+    fill a part are written with a single put_object. content_encoding
+    (e.g. "gzip") is stored as the object's Content-Encoding.
+    """
+
+    def __init__(self, s3, bucket, key, content_type, part_size=MULTIPART_PART_SIZE, content_encoding=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.headers = {'ContentType': content_type}
+        if content_encoding:
+            self.headers['ContentEncoding'] = content_encoding
+        self.size = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._flush_part()
+
+    def _flush_part(self):
+        if self._upload_id is None:
+            upload = self.s3.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                **self.headers
+            )
+            self._upload_id = upload['UploadId']
+
+        part_number = len(self._parts) + 1
+        with span('s3_upload'):
+            response = self.s3.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=bytes(self._buffer)
+            )
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self._buffer.clear()
+
+    def close(self):
+        if self._upload_id is None:
+            with span('s3_upload'):
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    Body=bytes(self._buffer),
+                    **self.headers
+                )
+            self._buffer.clear()
+            return
+
+        if self._buffer:
+            self._flush_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={'Parts': self._parts}
+        )
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._buffer.clear()
+
+
+class JsonlShardWriter:
+    """
+    Writes records as JSON Lines into numbered shard objects under a prefix.
+
+    A new shard is started once the current one reaches max_records
+    records or max_bytes bytes. Use it as a context manager so a failure
+    aborts any open multipart upload.
+
+    Example:
+        with JsonlShardWriter(s3, bucket, 'jobs/1/input/', max_records=50000) as writer:
+            for record in records:
+                writer.write(record)
+        writer.shards  # [{'key': ..., 'records': ..., 'bytes': ...}, ...]
+    """
+
+    def __init__(self, s3, bucket, prefix, max_records, max_bytes=None, suffix='.jsonl',
+                 part_size=MULTIPART_PART_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.part_size = part_size
+        self.shards = []
+        self._current = None
+        self._records = 0
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        if self._current is not None and self.max_bytes and self._current.size + len(line) > self.max_bytes:
+            self._close_shard()
+        if self._current is None:
+            key = f"{self.prefix}part-{len(self.shards):05d}{self.suffix}"
+            self._current = S3ObjectWriter(self.s3, self.bucket, key, 'application/jsonl', self.part_size)
+        self._current.write(line)
+        self._records += 1
+        if self._records >= self.max_records:
+            self._close_shard()
+
+    def _close_shard(self):
+        self._current.close()
+        self.shards.append({'key': self._current.key, 'records': self._records, 'bytes': self._current.size})
+        self._current = None
+        self._records = 0
+
+    def close(self):
+        if self._current is not None:
+            self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._current is not None:
+            self._current.abort()
+        return False
+
+
+def iter_lines(body, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the lines of a streaming body (without newlines) one chunk at a time.
+    """
+    pending = b''
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_jsonl(s3, bucket, key, chunk_size=READ_CHUNK_SIZE):
+    """
+    Generator over the records of a JSON Lines object, read as a stream so
+    only one chunk of the object is held in memory at a time.
+    """
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    for line in iter_lines(body, chunk_size):
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_keys(s3, bucket, prefix, suffix=''):
+    """
+    Yield every key under prefix that ends with suffix, following pagination.
+    """
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for item in response.get('Contents', []):
+            if item['Key'].endswith(suffix):
+                yield item['Key']
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
@@ -0,0 +1,99 @@
+import re
+
+# Paragraph breaks (a blank line) and whitespace after sentence-ending
+# punctuation. The separator text is captured so it can be restored verbatim.
+_BOUNDARY = re.compile(r'(\s*\n\s*\n\s*|(?<=[.!?。！？])\s+)')
+_WHITESPACE = re.compile(r'(\s+)')
+
+
+def utf8_length(text):
+    return len(text.encode('utf-8'))
+
+
+def _longest_prefix(text, max_size, measure):
+    """
+    Length of the longest prefix of text that fits in max_size (at least 1).
+    """
+    low, high = 1, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if measure(text[:middle]) <= max_size:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _hard_split(text, max_size, measure):
+    """
+    Split a single over-long sentence at whitespace, or anywhere as a last resort.
+    """
+    pieces = []
+    current = ''
+    for token in _WHITESPACE.split(text):
+        if measure(current + token) <= max_size:
+            current += token
+            continue
+        if current:
+            pieces.append(current)
+        # A single word longer than the limit is cut by characters
+        while measure(token) > max_size:
+            cut = _longest_prefix(token, max_size, measure)
+            pieces.append(token[:cut])
+            token = token[cut:]
+        current = token
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text(text, max_size, measure=utf8_length):
+    """
+    Split text into chunks no larger than max_size, preferring paragraph and
+    sentence boundaries.
+
+    Returns a list of (chunk, separator) pairs where separator is the
+    original whitespace that followed the chunk. Joining every chunk with
+    its separator reproduces the input exactly, so translated or
+    synthesized chunks can be reassembled with the original formatting.
+    measure defaults to UTF-8 byte length; pass len for character limits.
+    """
+    leading = text[:len(text) - len(text.lstrip())]
+    parts = _BOUNDARY.split(text[len(leading):])
+    # Parts alternate sentence, separator, sentence, ..., sentence
+    units = []
+    for index in range(0, len(parts), 2):
+        separator = parts[index + 1] if index + 1 < len(parts) else ''
+        sentence = parts[index]
+        if measure(sentence) > max_size:
+            pieces = _hard_split(sentence, max_size, measure)
+            units.extend((piece, '') for piece in pieces[:-1])
+            sentence = pieces[-1]
+        units.append((sentence, separator))
+
+    chunks = []
+    current = ''
+    current_separator = leading
+    for sentence, separator in units:
+        if not current:
+            # Whitespace before the first chunk is kept outside of it
+            if current_separator and not chunks:
+                chunks.append(('', current_separator))
+            current, current_separator = sentence, separator
+        elif measure(current + current_separator + sentence) <= max_size:
+            current += current_separator + sentence
+            current_separator = separator
+        else:
+            chunks.append((current, current_separator))
+            current, current_separator = sentence, separator
+    if current or current_separator:
+        chunks.append((current, current_separator))
+
+    return chunks
+
+
+def join_chunks(chunks):
+    """
+    Reassemble (chunk, separator) pairs produced by split_text.
+    """
+    return ''.join(chunk + separator for chunk, separator in chunks)
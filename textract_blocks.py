@@ -0,0 +1,132 @@
+# Decimal places kept for bounding box ratios and confidence scores
+GEOMETRY_PRECISION = 4
+CONFIDENCE_PRECISION = 1
+
+# Text used for checkboxes and radio buttons inside cells and values
+SELECTION_TEXT = {'SELECTED': '[X]', 'NOT_SELECTED': '[ ]'}
+
+
+class BlockGraph:
+    """
+    Textract blocks indexed by Id.
+
+    The index is built in a single pass over the blocks, and every CHILD or
+    VALUE relationship is then followed with a dictionary lookup. Resolving
+    all tables and key/value pairs is therefore linear in the number of
+    blocks and relationships, however many thousands of blocks a document
+    has, and does not depend on the order Textract returned them in.
+
+    Example:
+        graph = BlockGraph(response['Blocks'])
+        graph.tables()  # [{'page': 1, 'rows': [['Item', 'Qty'], ...], 'confidence': 99.1}]
+        graph.forms()   # {'Invoice number:': 'INV-001', ...}
+        graph.layout()  # {'text': [...], 'page': [...], 'left': [...], ...}
+    """
+
+    def __init__(self, blocks):
+        self.blocks = {}
+        self.by_type = {}
+        for block in blocks:
+            self.blocks[block['Id']] = block
+            self.by_type.setdefault(block['BlockType'], []).append(block)
+
+    def related(self, block, relationship_type):
+        """
+        Yield the blocks that block points to through relationship_type.
+        """
+        for relationship in block.get('Relationships', ()):
+            if relationship['Type'] != relationship_type:
+                continue
+            for block_id in relationship['Ids']:
+                child = self.blocks.get(block_id)
+                if child is not None:
+                    yield child
+
+    def text(self, block):
+        """
+        Text of a CELL or KEY_VALUE_SET block, assembled from its child words.
+        """
+        words = []
+        for child in self.related(block, 'CHILD'):
+            if child['BlockType'] == 'WORD':
+                words.append(child['Text'])
+            elif child['BlockType'] == 'SELECTION_ELEMENT':
+                words.append(SELECTION_TEXT.get(child.get('SelectionStatus'), ''))
+        return ' '.join(words)
+
+    def lines(self):
+        """
+        Yield the text of every LINE block in reading order.
+        """
+        for block in self.by_type.get('LINE', ()):
+            yield block['Text']
+
+    def tables(self):
+        """
+        Return every table as a row-major grid of cell text.
+
+        A cell spanning several rows or columns has its text in its top-left
+        position; the positions it covers are left empty.
+        """
+        tables = []
+        for table in self.by_type.get('TABLE', ()):
+            cells = [cell for cell in self.related(table, 'CHILD') if cell['BlockType'] == 'CELL']
+            row_count = max((cell['RowIndex'] + cell.get('RowSpan', 1) - 1 for cell in cells), default=0)
+            column_count = max((cell['ColumnIndex'] + cell.get('ColumnSpan', 1) - 1 for cell in cells), default=0)
+
+            rows = [[''] * column_count for _ in range(row_count)]
+            for cell in cells:
+                rows[cell['RowIndex'] - 1][cell['ColumnIndex'] - 1] = self.text(cell)
+
+            tables.append({
+                'page': table.get('Page', 1),
+                'rows': rows,
+                'confidence': round(table.get('Confidence', 0.0), CONFIDENCE_PRECISION)
+            })
+        return tables
+
+    def forms(self):
+        """
+        Return the document's key/value pairs as a dict of key text to value text.
+
+        A key that appears more than once gets a " (2)", " (3)", ... suffix
+        so no value is lost.
+        """
+        fields = {}
+        occurrences = {}
+        for block in self.by_type.get('KEY_VALUE_SET', ()):
+            if 'KEY' not in block.get('EntityTypes', ()):
+                continue
+            key = self.text(block)
+            value = ' '.join(self.text(value_block) for value_block in self.related(block, 'VALUE'))
+
+            # Count per key, so each duplicate is numbered in one step
+            occurrence = occurrences.get(key, 0) + 1
+            name = key if occurrence == 1 else f"{key} ({occurrence})"
+            # Skip numbers taken by a key that literally reads "Key (2)"
+            while name in fields:
+                occurrence += 1
+                name = f"{key} ({occurrence})"
+            occurrences[key] = occurrence
+            fields[name] = value
+        return fields
+
+    def layout(self, block_type='LINE'):
+        """
+        Return the text, page, confidence and bounding box of every block of
+        block_type as parallel arrays.
+
+        Entry i of each array describes the i-th block, so the field names
+        are stored once rather than once per block.
+        """
+        columns = {name: [] for name in ('text', 'page', 'confidence', 'left', 'top', 'width', 'height')}
+        for block in self.by_type.get(block_type, ()):
+            box = block.get('Geometry', {}).get('BoundingBox', {})
+            columns['text'].append(block.get('Text', ''))
+            columns['page'].append(block.get('Page', 1))
+            columns['confidence'].append(round(block.get('Confidence', 0.0), CONFIDENCE_PRECISION))
+            columns['left'].append(round(box.get('Left', 0.0), GEOMETRY_PRECISION))
+            columns['top'].append(round(box.get('Top', 0.0), GEOMETRY_PRECISION))
+            columns['width'].append(round(box.get('Width', 0.0), GEOMETRY_PRECISION))
+            columns['height'].append(round(box.get('Height', 0.0), GEOMETRY_PRECISION))
+        return columns
@@ -1,8 +1,276 @@
 import json
-import boto3
 import os
-from urllib.parse import unquote_plus
+import time
 
+from cold_start import lazy_import, preload, priming_hook
+from concurrency import bounded_imap
+from metrics import instrumented, span
+from result_spill import SpillingResults
+from s3_events import is_sqs_event, object_location
+from throttling import throttled_client
+from work_loop import WorkLoop
+
+# Only analyze mode needs the block graph
+textract_blocks = lazy_import('textract_blocks')
+
+# How often to poll an asynchronous job, and how much invocation time to keep
+# in reserve for building the response once we stop waiting
+POLL_INTERVAL_SECONDS = float(os.environ.get('TEXTRACT_POLL_INTERVAL', '2'))
+DEADLINE_RESERVE_MS = 5000
+
+# Maximum number of documents processed at once; Textract's per-account TPS
+# quotas are low, so this defaults well below Rekognition's
+DEFAULT_CONCURRENCY = int(os.environ.get('TEXTRACT_CONCURRENCY', '4'))
+
+# Mode used when the event does not set one (e.g. SQS sources): sync, async or analyze
+DEFAULT_MODE = os.environ.get('TEXTRACT_MODE', 'sync')
+
+# AnalyzeDocument features that analyze mode can request
+ANALYSIS_FEATURE_TYPES = ('TABLES', 'FORMS')
+
+
+def iter_line_text(pages):
+    """
+    Yield the text of every LINE block, one page of blocks at a time.
+    """
+    for page in pages:
+        for block in page['Blocks']:
+            if block['BlockType'] == 'LINE':
+                yield block['Text']
+
+
+def iter_page_text(pages):
+    """
+    Yield (page number, text) for every document page, grouping the LINE
+    blocks of result pages by their Page field.
+    """
+    current, lines = None, []
+    for page in pages:
+        for block in page['Blocks']:
+            if block['BlockType'] != 'LINE':
+                continue
+            number = block.get('Page', 1)
+            if number != current and lines:
+                yield current, join_lines(lines)
+                lines = []
+            current = number
+            lines.append(block['Text'])
+    if lines:
+        yield current, join_lines(lines)
+
+
+def join_lines(lines):
+    """
+    Assemble extracted lines into one string in linear time.
+    """
+    return ''.join(f"{line}\n" for line in lines)
+
+
+def wait_for_text_detection(textract, job_id, context=None):
+    """
+    Poll an asynchronous text detection job until it leaves IN_PROGRESS.
+
+    Returns the first page of results (which carries the final JobStatus)
+    so it does not have to be fetched again, or None if the invocation
+    would run out of time before the job finishes.
+    """
+    while True:
+        response = textract.get_document_text_detection(JobId=job_id)
+        if response['JobStatus'] != 'IN_PROGRESS':
+            return response
+
+        if context is not None:
+            remaining = context.get_remaining_time_in_millis()
+            if remaining - POLL_INTERVAL_SECONDS * 1000 < DEADLINE_RESERVE_MS:
+                return None
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+
+def iter_text_detection_pages(textract, job_id, first_page=None):
+    """
+    Generator over the result pages of an asynchronous text detection job.
+
+    Follows NextToken so only one page of blocks is held in memory at a time.
+    """
+    page = first_page or textract.get_document_text_detection(JobId=job_id)
+    while True:
+        yield page
+        next_token = page.get('NextToken')
+        if not next_token:
+            return
+        page = textract.get_document_text_detection(JobId=job_id, NextToken=next_token)
+
+
+def collect_text_detection(textract, job_id, context=None):
+    """
+    Wait for an asynchronous text detection job and return its text.
+
+    If the job has not finished before the invocation runs low on time,
+    the result has jobStatus IN_PROGRESS; pass its jobId back in a later
+    invocation's "jobIds" to collect it.
+    """
+    first_page = wait_for_text_detection(textract, job_id, context)
+    if first_page is None:
+        return {
+            'jobId': job_id,
+            'jobStatus': 'IN_PROGRESS'
+        }
+
+    if first_page['JobStatus'] != 'SUCCEEDED':
+        raise RuntimeError(
+            f"Text detection job {job_id} {first_page['JobStatus']}: "
+            f"{first_page.get('StatusMessage', 'no status message')}"
+        )
+
+    pages = iter_text_detection_pages(textract, job_id, first_page)
+    return {
+        'jobId': job_id,
+        'jobStatus': 'SUCCEEDED',
+        'pages': first_page.get('DocumentMetadata', {}).get('Pages'),
+        'extractedText': join_lines(iter_line_text(pages))
+    }
+
+
+def collect_job(textract, job_id, context=None):
+    """
+    Collect one earlier job by its id, returning either its text or its error.
+    """
+    try:
+        with span('collect_async'):
+            return collect_text_detection(textract, job_id, context)
+    except Exception as e:
+        print(f"Error collecting text detection job {job_id}: {str(e)}")
+        return {
+            'jobId': job_id,
+            'error': str(e)
+        }
+
+
+def extract_text_async(textract, bucket, key, context=None):
+    """
+    Extract text from a (possibly multi-page) document with the async API.
+    """
+    start = textract.start_document_text_detection(
+        DocumentLocation={
+            'S3Object': {
+                'Bucket': bucket,
+                'Name': key
+            }
+        }
+    )
+    result = {'documentLocation': f"s3://{bucket}/{key}"}
+    result.update(collect_text_detection(textract, start['JobId'], context))
+    return result
+
+
+def analyze_document(textract, bucket, key, feature_types=ANALYSIS_FEATURE_TYPES):
+    """
+    Run AnalyzeDocument and return the document's text, tables, form fields
+    and line layout.
+    """
+    with span('analyze_document'):
+        response = textract.analyze_document(
+            Document={
+                'S3Object': {
+                    'Bucket': bucket,
+                    'Name': key
+                }
+            },
+            FeatureTypes=list(feature_types)
+        )
+
+    with span('resolve_blocks'):
+        graph = textract_blocks.BlockGraph(response['Blocks'])
+        result = {
+            'documentLocation': f"s3://{bucket}/{key}",
+            'pages': response.get('DocumentMetadata', {}).get('Pages'),
+            'extractedText': join_lines(graph.lines()),
+            'layout': graph.layout()
+        }
+        if 'TABLES' in feature_types:
+            result['tables'] = graph.tables()
+        if 'FORMS' in feature_types:
+            result['forms'] = graph.forms()
+    return result
+
+
+def is_complete(result):
+    """
+    True if a result holds the document's text: no error, and no
+    asynchronous job still IN_PROGRESS.
+    """
+    return 'error' not in result and result.get('jobStatus', 'SUCCEEDED') == 'SUCCEEDED'
+
+
+def pending_job(result):
+    """
+    The jobId to checkpoint for a result whose asynchronous job is still IN_PROGRESS.
+    """
+    return result.get('jobId') if result.get('jobStatus') == 'IN_PROGRESS' else None
+
+
+def resume_record(textract, record, job_id, context=None):
+    """
+    Collect the job an earlier delivery of the record started, instead of
+    starting another. A job that failed or expired is started again.
+    """
+    bucket, key = object_location(record)
+    result = {'documentLocation': f"s3://{bucket}/{key}"}
+    result.update(collect_job(textract, job_id, context))
+    if 'error' in result:
+        return extract_record(textract, record, 'async', context)
+    return result
+
+
+def extract_record(textract, record, mode='sync', context=None, feature_types=ANALYSIS_FEATURE_TYPES):
+    """
+    Extract the text of one S3 record, returning either its text or its error.
+    """
+    bucket, key = object_location(record)
+
+    try:
+        if mode == 'async':
+            with span('extract_async'):
+                return extract_text_async(textract, bucket, key, context)
+
+        if mode == 'analyze':
+            return analyze_document(textract, bucket, key, feature_types)
+
+        # Call Amazon Textract to detect text
+        with span('detect_document_text'):
+            response = textract.detect_document_text(
+                Document={
+                    'S3Object': {
+                        'Bucket': bucket,
+                        'Name': key
+                    }
+                }
+            )
+
+        # Extract text from the response
+        return {
+            'documentLocation': f"s3://{bucket}/{key}",
+            'extractedText': join_lines(iter_line_text([response]))
+        }
+
+    except Exception as e:
+        print(f"Error extracting text from {bucket}/{key}: {str(e)}")
+        return {
+            'documentLocation': f"s3://{bucket}/{key}",
+            'error': str(e)
+        }
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Textract client ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('textract')
+
+
+@instrumented('textract')
 def lambda_handler(event, context):
     """
     Lambda function that demonstrates using Amazon Textract to extract text from documents.
@@ -12,13 +280,62 @@ def lambda_handler(event, context):
     2. Uses Amazon Textract to extract text from the document
     3. Returns the extracted text from all records
     
+    Set "mode": "async" in the event to use StartDocumentTextDetection for
+    multi-page PDFs and TIFFs. Result pages are then read one at a time via
+    NextToken. If a job has not finished before the invocation runs low on
+    time, its jobId is returned with jobStatus IN_PROGRESS. Invoke the
+    function later with {"jobIds": [...]} to collect those jobs; each
+    result then has the jobId and either the text or IN_PROGRESS again.
+
+    Set "mode": "analyze" to use AnalyzeDocument instead. Each result then
+    also has "tables" (row/column grids of cell text), "forms" (key text to
+    value text) and "layout" (text, page, confidence and bounding box of
+    every line as parallel arrays). "featureTypes" picks TABLES, FORMS or
+    both (the default). TEXTRACT_MODE sets the mode for events that do not
+    carry one, such as SQS batches.
+
+    Up to "concurrency" documents (default TEXTRACT_CONCURRENCY, 4) are
+    processed at once. The function can also be fed by an SQS queue that
+    receives the bucket's S3 notifications; the response then lists the
+    messages whose documents failed as batchItemFailures so only those are
+    redelivered (enable ReportBatchItemFailures on the event source mapping).
+    In async mode a job still running near the timeout also fails its
+    message, so it is not acknowledged without its text. With
+    CHECKPOINT_TABLE set, the job's id is checkpointed with the message and
+    collected on redelivery instead of starting (and paying for) a new job;
+    without it, the document is extracted again. Give the queue a redrive
+    policy for documents that never finish in time.
+
+    Results are serialized one document at a time. If they grow past
+    RESULT_SPILL_THRESHOLD_BYTES they are written, compressed, to the
+    event's "resultBucket" (or RESULT_BUCKET), and the body returns a
+    manifest with a pre-signed URL instead of the results.
+
+    No new document is started once less than WORK_LOOP_RESERVE_MS of the
+    invocation remains. The function then invokes itself asynchronously
+    with only the unstarted documents (SQS batches report their messages as
+    failed instead, so they are redelivered), and the body's "checkpoint"
+    says how many were re-enqueued. With CHECKPOINT_TABLE set, completed
+    documents are recorded in DynamoDB and skipped when the same batch is
+    retried; async jobs still IN_PROGRESS are not checkpointed.
+
     The Lambda function requires these permissions:
     textract:DetectDocumentText
-    textract:AnalyzeDocument
+    textract:AnalyzeDocument (analyze mode)
+    textract:StartDocumentTextDetection (async mode)
+    textract:GetDocumentTextDetection (async mode)
     s3:GetObject
+    s3:PutObject (spilled results)
+    lambda:InvokeFunction (re-enqueueing unfinished records)
+    dynamodb:Query (CHECKPOINT_TABLE)
+    dynamodb:BatchWriteItem (CHECKPOINT_TABLE)
+    sqs:ReceiveMessage (SQS source)
+    sqs:DeleteMessage (SQS source)
+    sqs:GetQueueAttributes (SQS source)
     
     Example test event:
     {
+      "mode": "async",
       "Records": [
         {
           "s3": {
@@ -32,52 +349,78 @@ def lambda_handler(event, context):
         }
       ]
     }
+
+    Example collection event:
+    {
+      "jobIds": ["1a2b3c4d..."]
+    }
     """
-    # Initialize the Textract client
-    textract = boto3.client('textract')
+    # Reuse the container's Textract client
+    with span('client_init'):
+        textract = throttled_client('textract', context)
+    mode = event.get('mode', DEFAULT_MODE)
+    feature_types = event.get('featureTypes', list(ANALYSIS_FEATURE_TYPES))
     
-    # Process all records and store results
-    results = []
+    # Validate input
+    valid_feature_types = isinstance(feature_types, list) and feature_types and all(
+        feature in ANALYSIS_FEATURE_TYPES for feature in feature_types
+    )
+    if mode == 'analyze' and not valid_feature_types:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: featureTypes must be a non-empty list of TABLES and/or FORMS'})
+        }
     
-    for record in event['Records']:
-        bucket = record['s3']['bucket']['name']
-        key = unquote_plus(record['s3']['object']['key'])
+    job_ids = event.get('jobIds')
+    if job_ids is not None and not (
+        isinstance(job_ids, list) and job_ids and all(isinstance(job_id, str) and job_id for job_id in job_ids)
+    ):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: jobIds must be a non-empty list of job ids'})
+        }
         
-        try:
-            # Call Amazon Textract to detect text
-            response = textract.detect_document_text(
-                Document={
-                    'S3Object': {
-                        'Bucket': bucket,
-                        'Name': key
-                    }
-                }
-            )
+    try:
+        concurrency = int(event.get('concurrency', DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        concurrency = 0
+    if concurrency < 1:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency must be a number of at least 1'})
+        }
             
-            # Extract text from the response
-            extracted_text = ""
-            for item in response['Blocks']:
-                if item['BlockType'] == 'LINE':
-                    extracted_text += item['Text'] + '\n'
+    # Collect asynchronous jobs started by earlier invocations
+    if job_ids is not None:
+        results = SpillingResults('textract', event.get('resultBucket'), context)
+        for result in bounded_imap(lambda job_id: collect_job(textract, job_id, context), job_ids, concurrency, context):
+            results.add(result)
+        return results.response(f'Collected {results.count} job(s)')
             
-            # Add this document's results to our collection
-            results.append({
-                'documentLocation': f"s3://{bucket}/{key}",
-                'extractedText': extracted_text
-            })
+    def extract(record):
+        return extract_record(textract, record, mode, context, feature_types)
             
-        except Exception as e:
-            print(f"Error extracting text from {bucket}/{key}: {str(e)}")
-            results.append({
-                'documentLocation': f"s3://{bucket}/{key}",
-                'error': str(e)
-            })
+    # Records are started only while time remains; the rest are re-enqueued
+    loop = WorkLoop('textract', event, context)
     
-    # Return all results
-    return {
-        'statusCode': 200,
-        'body': json.dumps({
-            'message': f'Processed {len(results)} document(s)',
-            'results': results
-        })
-    }
\ No newline at end of file
+    def resume(record, job_id):
+        return resume_record(textract, record, job_id, context)
+
+    # SQS batches report failed and unfinished messages instead of failing
+    # the whole batch; unfinished jobs are collected on redelivery
+    if is_sqs_event(event):
+        results, failures = loop.process_sqs_batch(extract, concurrency, is_complete, pending_job, resume)
+        print(f"Processed {len(results)} document(s) from {len(event['Records'])} message(s), "
+              f"{len(failures)} message(s) failed")
+        return {'batchItemFailures': failures}
+
+    # Process the records concurrently; results keep the input order and
+    # each record's errors are captured in its own result. Each result is
+    # serialized as soon as it is ready, and large outputs spill to S3.
+    results = SpillingResults('textract', event.get('resultBucket'), context)
+    for result in loop.imap(extract, concurrency, is_complete):
+        results.add(result)
+
+    # Return all results, or a manifest pointing at them, and what was
+    # skipped or re-enqueued
+    return results.response(f'Processed {results.count} document(s)', loop.finish())
@@ -0,0 +1,288 @@
+import os
+import random
+import threading
+import time
+
+from aws_clients import get_client
+from cold_start import lazy_import
+
+botocore_exceptions = lazy_import('botocore.exceptions')
+
+# Error codes that mean "slow down"; they feed the adaptive limiter
+THROTTLING_ERROR_CODES = frozenset((
+    'ThrottlingException',
+    'Throttling',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'LimitExceededException',
+    'SlowDown'
+))
+
+# Transient server-side errors that are retried but do not slow the limiter
+TRANSIENT_ERROR_CODES = frozenset((
+    'InternalServerError',
+    'InternalServerException',
+    'InternalFailure',
+    'InternalError',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+    'RequestTimeout',
+    'RequestTimeoutException'
+))
+
+MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', '6'))
+BASE_BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 10
+
+# Stop retrying once a backoff would leave less than this much invocation time
+DEADLINE_RESERVE_MS = 2000
+
+# Request rates (requests/second) per limiter. A limiter does not limit
+# until the first throttle, then starts at half the rate it was seeing and
+# adapts between MIN_RATE and MAX_RATE, unlimited again once back at
+# MAX_RATE. Set THROTTLE_DEFAULT_RATE to start new limiters at that rate.
+DEFAULT_RATE = float(os.environ['THROTTLE_DEFAULT_RATE']) if os.environ.get('THROTTLE_DEFAULT_RATE') else None
+MIN_RATE = 0.5
+MAX_RATE = float(os.environ.get('THROTTLE_MAX_RATE', '500'))
+
+# Client methods that make no API call and are passed through untouched
+_PASSTHROUGH = frozenset((
+    'generate_presigned_url',
+    'generate_presigned_post',
+    'get_paginator',
+    'get_waiter',
+    'can_paginate',
+    'close'
+))
+
+# Botocore's own retries are disabled for wrapped clients so attempts are not
+# multiplied; this layer retries instead
+_NO_SDK_RETRIES = {'mode': 'standard', 'max_attempts': 1}
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when waiting for capacity or backing off would outlast the invocation.
+    """
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate adapts to observed throttling (AIMD).
+
+    With rate None the limiter lets every request through, counting how
+    many it sees per second, until the first throttle sets the rate to half
+    of that. Then each success raises the rate by a small step, and each
+    throttle halves it and empties the bucket, so callers converge on what
+    the service actually allows for this service and model. Once the rate
+    climbs back to max_rate the limiter stops limiting again.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = rate or 0.0
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+        self._unlimit(self.updated)
+
+    def _unlimit(self, now):
+        # Requests seen while unlimited, in windows of about one second
+        self._window_start = now
+        self._window_requests = 0
+        self._last_window_rate = 0.0
+
+    def _count_unlimited(self, now):
+        elapsed = now - self._window_start
+        if elapsed >= 1:
+            self._last_window_rate = self._window_requests / elapsed
+            self._window_start, self._window_requests = now, 0
+        self._window_requests += 1
+
+    def _observed_rate(self, now):
+        current = self._window_requests / max(1.0, now - self._window_start)
+        return max(self._last_window_rate, current)
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline=None):
+        """
+        Take one token, sleeping until one is available.
+
+        deadline is a time.monotonic() value; DeadlineExceeded is raised
+        rather than sleeping past it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.rate is None:
+                    self.requests += 1
+                    self._count_unlimited(now)
+                    return
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded('No request capacity before the invocation deadline')
+            time.sleep(wait)
+
+    def record_success(self):
+        with self._lock:
+            if self.rate is None:
+                return
+            self.rate += max(0.5, self.rate * 0.05)
+            if self.rate >= self.max_rate:
+                self.rate = None
+                self._unlimit(time.monotonic())
+
+    def record_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            if self.rate is None:
+                self.rate = min(self.max_rate, self._observed_rate(now))
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.updated = now
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': round(self.rate, 2) if self.rate is not None else None,
+                'requests': self.requests,
+                'throttles': self.throttles,
+                'throttleRate': round(self.throttles / self.requests, 4) if self.requests else 0.0
+            }
+
+
+# One limiter per (service, model ID), shared by every thread in the container
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(service_name, model_id=None):
+    key = (service_name, model_id)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.setdefault(key, AdaptiveRateLimiter())
+    return limiter
+
+
+def limiter_stats():
+    """
+    Current rate and throttle counts of every limiter, keyed "service[:model]".
+    """
+    with _limiters_lock:
+        items = list(_limiters.items())
+    return {
+        f"{service}:{model}" if model else service: limiter.stats()
+        for (service, model), limiter in items
+    }
+
+
+def _retryable_exceptions():
+    # Resolved only once a call has failed, by which point botocore is loaded
+    return (
+        botocore_exceptions.ClientError,
+        botocore_exceptions.ConnectionError,
+        botocore_exceptions.ConnectTimeoutError,
+        botocore_exceptions.ReadTimeoutError
+    )
+
+
+def _error_code(error):
+    if isinstance(error, botocore_exceptions.ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+def _deadline(context):
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    remaining_ms = context.get_remaining_time_in_millis() - DEADLINE_RESERVE_MS
+    return time.monotonic() + remaining_ms / 1000
+
+
+def call_with_retry(operation, service_name, model_id=None, context=None, **kwargs):
+    """
+    Call operation(**kwargs) through the shared limiter, retrying throttles and
+    transient errors with full-jitter exponential backoff.
+
+    Retries stop after MAX_ATTEMPTS, or earlier when the next backoff would
+    run into the last DEADLINE_RESERVE_MS of the invocation; the last error
+    is then re-raised so handlers report it as before.
+    """
+    limiter = get_limiter(service_name, model_id)
+    deadline = _deadline(context)
+
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.acquire(deadline)
+        try:
+            result = operation(**kwargs)
+        except _retryable_exceptions() as e:
+            code = _error_code(e)
+            if code in THROTTLING_ERROR_CODES:
+                limiter.record_throttle()
+            elif isinstance(e, botocore_exceptions.ClientError) and code not in TRANSIENT_ERROR_CODES:
+                raise
+
+            delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2 ** attempt)))
+            if attempt == MAX_ATTEMPTS - 1 or (deadline is not None and time.monotonic() + delay > deadline):
+                raise
+            time.sleep(delay)
+            continue
+
+        limiter.record_success()
+        return result
+
+
+class ThrottledClient:
+    """
+    Wraps a boto3 client so every API call goes through call_with_retry.
+
+    Limiters are keyed on the service name plus the call's modelId, if any,
+    so each Bedrock model adapts to its own quota.
+    """
+
+    def __init__(self, client, service_name, context=None):
+        self._client = client
+        self._service_name = service_name
+        self._context = context
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name in _PASSTHROUGH or name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def call(**kwargs):
+            return call_with_retry(
+                attribute,
+                self._service_name,
+                kwargs.get('modelId'),
+                self._context,
+                **kwargs
+            )
+        return call
+
+
+def throttled_client(service_name, context=None, **overrides):
+    """
+    Return the container's shared client for service_name wrapped in the retry layer.
+
+    Pass the Lambda context so backoff never outlasts the invocation.
+    """
+    overrides.setdefault('retries', _NO_SDK_RETRIES)
+    return ThrottledClient(get_client(service_name, **overrides), service_name, context)
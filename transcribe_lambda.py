@@ -1,22 +1,135 @@
 import json
-import boto3
 import os
+import re
 import uuid
-from urllib.parse import unquote_plus
+from urllib.parse import unquote_plus, urlparse
 
+from cold_start import lazy_import, preload, priming_hook
+from concurrency import bounded_map
+from metrics import instrumented, span
+from throttling import throttled_client
+from work_loop import WorkLoop
+
+# Only needed to name a job's output once a record is submitted
+hashlib = lazy_import('hashlib')
+
+# Characters Transcribe accepts in an OutputKey
+_UNSAFE_KEY_CHARACTERS = re.compile(r"[^A-Za-z0-9\-_.!*'()]")
+
+# Maximum number of start_transcription_job calls in flight at once
+DEFAULT_CONCURRENCY = int(os.environ.get('TRANSCRIBE_CONCURRENCY', '10'))
+
+# Map common extensions to formats Transcribe understands
+FORMAT_MAPPING = {
+    'mp3': 'mp3',
+    'mp4': 'mp4',
+    'wav': 'wav',
+    'flac': 'flac',
+    'm4a': 'mp4',
+    'ogg': 'ogg'
+}
+
+
+def event_concurrency(event):
+    """
+    Return the event's "concurrency" (default DEFAULT_CONCURRENCY) as an
+    int, or None if it is not a number of at least 1.
+    """
+    try:
+        concurrency = int(event.get('concurrency', DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        return None
+    return concurrency if concurrency >= 1 else None
+
+
+def output_key(bucket, key):
+    """
+    Transcript key for an audio object: a hash of its full location keeps
+    objects with the same file name in different prefixes apart, and the
+    file name keeps the key readable.
+    """
+    digest = hashlib.sha256(f"{bucket}/{key}".encode('utf-8')).hexdigest()[:16]
+    name = _UNSAFE_KEY_CHARACTERS.sub('_', os.path.basename(key))[:200]
+    return f"transcriptions/{digest}/{name}.json"
+
+
+def submit_record(transcribe, record):
+    """
+    Start a transcription job for one S3 record and return its job details.
+    """
+    bucket = record['s3']['bucket']['name']
+    key = unquote_plus(record['s3']['object']['key'])
+
+    # Generate a unique job name
+    job_name = f"transcription-{uuid.uuid4()}"
+
+    # Get the file extension to determine media format
+    file_extension = os.path.splitext(key)[1].lower()
+    media_format = FORMAT_MAPPING.get(file_extension[1:], 'mp3')  # Default to mp3 if unknown
+
+    # Define the S3 URI for the audio file
+    s3_uri = f"s3://{bucket}/{key}"
+
+    try:
+        # Start the transcription job; throttling is retried by the client
+        with span('start_job'):
+            response = transcribe.start_transcription_job(
+                TranscriptionJobName=job_name,
+                Media={'MediaFileUri': s3_uri},
+                MediaFormat=media_format,
+                LanguageCode='en-US',  # Specify the language of the audio
+                OutputBucketName=bucket,  # Where to store the results
+                OutputKey=output_key(bucket, key)
+            )
+
+        return {
+            'mediaLocation': s3_uri,
+            'jobName': job_name,
+            'jobStatus': response['TranscriptionJob']['TranscriptionJobStatus']
+        }
+
+    except Exception as e:
+        print(f"Error starting transcription job for {s3_uri}: {str(e)}")
+        return {
+            'mediaLocation': s3_uri,
+            'error': str(e)
+        }
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Transcribe and S3 clients ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('transcribe')
+    throttled_client('s3')
+
+
+@instrumented('transcribe')
 def lambda_handler(event, context):
     """
     Lambda function that demonstrates using Amazon Transcribe to convert speech to text.
     
     This function:
-    1. Gets an S3 object (audio file) from the event
-    2. Starts a transcription job
-    3. Returns the job details
+    1. Gets the S3 objects (audio files) from the event
+    2. Starts a transcription job for every file, concurrently
+    3. Returns the job details for all files
+
+    No new job is started once less than WORK_LOOP_RESERVE_MS of the
+    invocation remains. The function then invokes itself asynchronously
+    with only the files not yet submitted, and the body's "checkpoint" says
+    how many were re-enqueued. With CHECKPOINT_TABLE set, submitted files
+    are recorded in DynamoDB, so a retried batch does not start duplicate
+    jobs for them.
     
     The Lambda function requires these permissions:
     transcribe:StartTranscriptionJob
     s3:GetObject (for accessing the audio file)
     s3:PutObject (for storing the transcription results)
+    lambda:InvokeFunction (re-enqueueing unfinished records)
+    dynamodb:Query (CHECKPOINT_TABLE)
+    dynamodb:BatchWriteItem (CHECKPOINT_TABLE)
     
     Example test event:
     {
@@ -34,68 +147,179 @@ def lambda_handler(event, context):
       ]
     }
     
-    Note: This is an asynchronous process. In a real-world scenario, you would need to 
-    check the job status later or set up a notification when the job completes.
+    Note: This is an asynchronous process. Use completion_handler to collect
+    the transcripts once the jobs finish.
     """
-    # Initialize the Transcribe client
-    transcribe = boto3.client('transcribe')
+    # Reuse the container's Transcribe client
+    with span('client_init'):
+        transcribe = throttled_client('transcribe', context)
     
-    # Get the S3 bucket and key from the event
-    for record in event['Records']:
-        bucket = record['s3']['bucket']['name']
-        key = unquote_plus(record['s3']['object']['key'])
-        
-        # Generate a unique job name
-        job_name = f"transcription-{uuid.uuid4()}"
-        
-        # Get the file extension to determine media format
-        file_extension = os.path.splitext(key)[1].lower()
-        media_format = file_extension[1:]  # Remove the dot
-        
-        # Map common extensions to formats Transcribe understands
-        format_mapping = {
-            'mp3': 'mp3',
-            'mp4': 'mp4',
-            'wav': 'wav',
-            'flac': 'flac',
-            'm4a': 'mp4',
-            'ogg': 'ogg'
+    # Validate input
+    concurrency = event_concurrency(event)
+    if concurrency is None:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency must be a number of at least 1'})
         }
         
-        media_format = format_mapping.get(media_format, 'mp3')  # Default to mp3 if unknown
+    # Submit the records concurrently while time remains; the rest are re-enqueued
+    loop = WorkLoop('transcribe', event, context)
+    jobs = list(loop.imap(lambda record: submit_record(transcribe, record), concurrency))
+    checkpoint = loop.finish()
         
-        # Define the S3 URI for the audio file
-        s3_uri = f"s3://{bucket}/{key}"
+    started = sum(1 for job in jobs if 'jobName' in job)
+    body = {
+        'message': f'Started {started} of {len(jobs)} transcription job(s)',
+        'jobs': jobs
+    }
+    if checkpoint is not None:
+        body['checkpoint'] = checkpoint
+    return {
+        'statusCode': 200 if started or not jobs else 500,
+        'body': json.dumps(body)
+    }
         
+
+def parse_transcript_uri(uri):
+    """
+    Split a TranscriptFileUri (https://s3.<region>.amazonaws.com/<bucket>/<key>)
+    into its bucket and key.
+    """
+    path = urlparse(uri).path.lstrip('/')
+    bucket, _, key = path.partition('/')
+    return bucket, unquote_plus(key)
+
+
+def build_artifacts(transcript):
+    """
+    Reduce a Transcribe output document to plain text and compact word timings.
+
+    Word timings are stored as parallel arrays rather than one dict per word.
+    """
+    results = transcript['results']
+    text = ' '.join(item['transcript'] for item in results['transcripts'])
+
+    words, starts, ends, confidences = [], [], [], []
+    for item in results['items']:
+        if item['type'] != 'pronunciation':
+            continue
+        alternative = item['alternatives'][0]
+        words.append(alternative['content'])
+        starts.append(float(item['start_time']))
+        ends.append(float(item['end_time']))
+        confidences.append(float(alternative.get('confidence', 0)))
+
+    timings = {
+        'words': words,
+        'start': starts,
+        'end': ends,
+        'confidence': confidences
+    }
+    return text, timings
+
+
+def harvest_job(transcribe, s3, job_name):
+    """
+    Write plain-text and word-timing artifacts next to a finished job's output.
+    """
+    job = transcribe.get_transcription_job(TranscriptionJobName=job_name)['TranscriptionJob']
+    status = job['TranscriptionJobStatus']
+    if status != 'COMPLETED':
+        return {
+            'jobName': job_name,
+            'jobStatus': status,
+            'failureReason': job.get('FailureReason')
+        }
+
+    bucket, key = parse_transcript_uri(job['Transcript']['TranscriptFileUri'])
+    transcript = json.load(s3.get_object(Bucket=bucket, Key=key)['Body'])
+    text, timings = build_artifacts(transcript)
+
+    base_key = key[:-len('.json')] if key.endswith('.json') else key
+    text_key = f"{base_key}.txt"
+    timings_key = f"{base_key}.words.json"
+
+    s3.put_object(
+        Bucket=bucket,
+        Key=text_key,
+        Body=text.encode('utf-8'),
+        ContentType='text/plain; charset=utf-8'
+    )
+    s3.put_object(
+        Bucket=bucket,
+        Key=timings_key,
+        Body=json.dumps(timings, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json'
+    )
+
+    return {
+        'jobName': job_name,
+        'jobStatus': status,
+        'textUri': f"s3://{bucket}/{text_key}",
+        'wordTimingsUri': f"s3://{bucket}/{timings_key}"
+    }
+
+
+@instrumented('transcribe_completion')
+def completion_handler(event, context):
+    """
+    Lambda function that collects finished Amazon Transcribe jobs.
+
+    This function:
+    1. Gets job names from a Transcribe job state change event, or from a
+       "jobNames" list when invoked on a schedule to poll
+    2. Reads each completed job's output JSON under transcriptions/
+    3. Writes a plain-text transcript (.txt) and compact word timings
+       (.words.json) next to it
+
+    The Lambda function requires these permissions:
+    transcribe:GetTranscriptionJob
+    s3:GetObject
+    s3:PutObject
+
+    Example EventBridge event:
+    {
+      "source": "aws.transcribe",
+      "detail-type": "Transcribe Job State Change",
+      "detail": {
+        "TranscriptionJobName": "transcription-1234",
+        "TranscriptionJobStatus": "COMPLETED"
+      }
+    }
+    """
+    with span('client_init'):
+        transcribe = throttled_client('transcribe', context)
+        s3 = throttled_client('s3', context)
+
+    # Validate input
+    concurrency = event_concurrency(event)
+    if concurrency is None:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency must be a number of at least 1'})
+        }
+
+    if 'detail' in event:
+        job_names = [event['detail']['TranscriptionJobName']]
+    else:
+        job_names = event.get('jobNames', [])
+
+    def harvest(job_name):
         try:
-            # Start the transcription job
-            response = transcribe.start_transcription_job(
-                TranscriptionJobName=job_name,
-                Media={'MediaFileUri': s3_uri},
-                MediaFormat=media_format,
-                LanguageCode='en-US',  # Specify the language of the audio
-                OutputBucketName=bucket,  # Where to store the results
-                OutputKey=f"transcriptions/{os.path.basename(key)}.json"
-            )
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Transcription job started successfully',
-                    'jobName': job_name,
-                    'jobStatus': response['TranscriptionJob']['TranscriptionJobStatus']
-                })
-            }
-            
+            return harvest_job(transcribe, s3, job_name)
         except Exception as e:
-            print(f"Error starting transcription job: {str(e)}")
+            print(f"Error collecting transcription job {job_name}: {str(e)}")
             return {
-                'statusCode': 500,
-                'body': json.dumps({
-                    'message': 'Error starting transcription job',
-                    'error': str(e)
-                })
+                'jobName': job_name,
+                'error': str(e)
             }
+            
+    results = bounded_map(harvest, job_names, concurrency, context)
 
-
-
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'Processed {len(results)} transcription job(s)',
+            'results': results
+        })
+    }
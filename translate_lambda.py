@@ -1,6 +1,87 @@
 import json
-import boto3
+import os
+import time
 
+from cold_start import preload, priming_hook
+from concurrency import bounded_map
+from metrics import instrumented, span
+from result_cache import cache_headers, get_or_compute, prime as prime_result_cache
+from text_chunks import split_text, utf8_length
+from throttling import throttled_client
+
+# TranslateText accepts at most 10,000 UTF-8 bytes per request
+MAX_REQUEST_BYTES = 10000
+
+# Maximum number of translate_text calls in flight for one document
+DEFAULT_CONCURRENCY = int(os.environ.get('TRANSLATE_CONCURRENCY', '8'))
+
+
+def translate_chunk(translate, chunk, source_language, target_language):
+    """
+    Translate one chunk, keeping its leading and trailing whitespace as-is.
+    """
+    body = chunk.strip()
+    if not body:
+        return {'text': chunk, 'latencyMs': 0.0, 'sourceLanguage': None}
+
+    start = time.perf_counter()
+    with span('translate_text'):
+        response = translate.translate_text(
+            Text=body,
+            SourceLanguageCode=source_language,
+            TargetLanguageCode=target_language
+        )
+    latency = (time.perf_counter() - start) * 1000
+
+    leading = chunk[:len(chunk) - len(chunk.lstrip())]
+    trailing = chunk[len(chunk.rstrip()):]
+    return {
+        'text': leading + response['TranslatedText'] + trailing,
+        'latencyMs': round(latency, 1),
+        'sourceLanguage': response['SourceLanguageCode']
+    }
+
+
+def translate_document(translate, text, source_language, target_language, concurrency, context=None):
+    """
+    Translate text of any length by splitting it into sentence- and
+    paragraph-aware chunks under the request size limit.
+
+    Chunks are translated concurrently and reassembled in order with the
+    original whitespace between them. Returns the translated text, the
+    detected source language and the per-chunk latencies in milliseconds.
+    """
+    chunks = split_text(text, MAX_REQUEST_BYTES)
+    translated = bounded_map(
+        lambda chunk: translate_chunk(translate, chunk[0], source_language, target_language),
+        chunks,
+        concurrency,
+        context
+    )
+
+    detected = next(
+        (result['sourceLanguage'] for result in translated if result['sourceLanguage']),
+        source_language
+    )
+    translated_text = ''.join(
+        result['text'] + separator
+        for result, (_, separator) in zip(translated, chunks)
+    )
+    latencies = [result['latencyMs'] for result in translated if result['sourceLanguage']]
+    return translated_text, detected, latencies
+
+
+@priming_hook
+def prime():
+    """
+    Load boto3 and create the Translate client (and cache table) ahead of the first request.
+    """
+    preload('concurrent.futures')
+    throttled_client('translate')
+    prime_result_cache()
+
+
+@instrumented('translate')
 def lambda_handler(event, context):
     """
     Lambda function that demonstrates using Amazon Translate to translate text.
@@ -9,6 +90,15 @@ def lambda_handler(event, context):
     1. Takes text input from the event
     2. Translates the text from source language to target language
     3. Returns the translated text
+
+    Text over the 10,000-byte request limit, or any text when "mode" is
+    "document", is split into chunks that are translated concurrently (up
+    to "concurrency", default TRANSLATE_CONCURRENCY) and reassembled with
+    the original formatting. Document mode also reports per-chunk latency.
+
+    Translations are cached by result_cache; pass "cacheControl" with
+    "bypass" or "maxAge" to control it. The X-Cache header reports the
+    outcome.
     
     The Lambda function requires these permissions:
     translate:TranslateText
@@ -20,31 +110,78 @@ def lambda_handler(event, context):
       "targetLanguage": "es"
     }
     """
-    # Initialize the Translate client
-    translate = boto3.client('translate')
+    # Reuse the container's Translate client
+    with span('client_init'):
+        translate = throttled_client('translate', context)
     
     # Get parameters from the event
     text = event.get('text', 'Hello, world!')
     source_language = event.get('sourceLanguage', 'auto')
     target_language = event.get('targetLanguage', 'es')
     
+    # Validate input
     try:
-        # Call Amazon Translate to translate the text
-        response = translate.translate_text(
-            Text=text,
-            SourceLanguageCode=source_language,
-            TargetLanguageCode=target_language
+        concurrency = int(event.get('concurrency', DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        concurrency = 0
+    if concurrency < 1:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid input: concurrency must be a number of at least 1'})
+        }
+    
+    try:
+        document_mode = event.get('mode') == 'document' or utf8_length(text) > MAX_REQUEST_BYTES
+
+        def translate_text():
+            if document_mode:
+                translated_text, detected, latencies = translate_document(
+                    translate, text, source_language, target_language, concurrency, context
+                )
+                return {
+                    'sourceLanguage': detected,
+                    'targetLanguage': target_language,
+                    'translatedText': translated_text,
+                    'chunks': {
+                        'count': len(latencies),
+                        'concurrency': concurrency,
+                        'latencyMs': latencies
+                    }
+                }
+
+            # Call Amazon Translate to translate the text
+            with span('translate_text'):
+                response = translate.translate_text(
+                    Text=text,
+                    SourceLanguageCode=source_language,
+                    TargetLanguageCode=target_language
+                )
+            return {
+                'sourceLanguage': response['SourceLanguageCode'],
+                'targetLanguage': response['TargetLanguageCode'],
+                'translatedText': response['TranslatedText']
+            }
+
+        # Identical text and language pairs are served from the result cache;
+        # document mode is part of the key because its result has "chunks"
+        result, cache_status, cache_key = get_or_compute(
+            'translate',
+            {'text': text, 'source': source_language, 'target': target_language, 'document': document_mode},
+            translate_text,
+            event.get('cacheControl')
         )
         
         # Return the translated text
         return {
             'statusCode': 200,
+            'headers': cache_headers(cache_status, cache_key),
             'body': json.dumps({
                 'message': 'Translation successful',
-                'sourceLanguage': response['SourceLanguageCode'],
-                'targetLanguage': response['TargetLanguageCode'],
+                'sourceLanguage': result['sourceLanguage'],
+                'targetLanguage': result['targetLanguage'],
                 'originalText': text,
-                'translatedText': response['TranslatedText']
+                'translatedText': result['translatedText'],
+                **({'chunks': result['chunks']} if 'chunks' in result else {})
             })
         }
         
@@ -0,0 +1,340 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from aws_clients import get_resource
+from cold_start import lazy_import
+from concurrency import bounded_imap
+from metrics import count, span
+from s3_events import process_sqs_batch, record_id, succeeded
+from throttling import throttled_client
+
+# Only needed to name a batch that is checkpointed or re-enqueued
+result_cache = lazy_import('result_cache')
+
+# Stop starting records once less than this much invocation time remains,
+# leaving time to finish the records in flight, save the checkpoint and
+# re-enqueue the rest
+RESERVE_MS = int(os.environ.get('WORK_LOOP_RESERVE_MS', '15000'))
+
+# DynamoDB table with partition key "batchId", sort key "recordId" (both
+# strings) and TTL enabled on "expiresAt". Leave CHECKPOINT_TABLE unset to
+# disable checkpointing; the deadline reserve and re-enqueueing still apply.
+CHECKPOINT_TABLE = os.environ.get('CHECKPOINT_TABLE')
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('CHECKPOINT_TTL', '86400'))
+
+# A batch is re-enqueued at most this many times, so records that can never
+# finish in one invocation do not loop forever
+MAX_RESUMES = int(os.environ.get('WORK_LOOP_MAX_RESUMES', '10'))
+
+# Largest payload an asynchronous (Event) Invoke accepts; the remainder of
+# a large batch is split across as many invocations as it needs
+MAX_INVOKE_PAYLOAD_BYTES = 256 * 1024
+
+# Completed records buffered before they are written (one BatchWriteItem)
+CHECKPOINT_FLUSH_RECORDS = 25
+
+# Batches the in-memory store remembers per container
+MEMORY_MAX_BATCHES = 256
+
+
+class ResumeError(Exception):
+    """
+    Raised by WorkLoop.finish() when records that were never started could
+    not be re-enqueued, so the invocation fails and Lambda's retries and
+    on-failure destination see the batch instead of it being dropped.
+    """
+
+
+class MemoryCheckpointStore:
+    """
+    Record progress kept in this process, least recently used batches
+    dropped first. For local runs and benchmarks; pass it as store=.
+
+    Stores map a batch's record IDs to None once a record completed, or to
+    a pending token (such as an asynchronous job ID) while it is unfinished.
+    """
+
+    def __init__(self, max_batches=MEMORY_MAX_BATCHES):
+        self.max_batches = max_batches
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def progress(self, batch_id):
+        with self._lock:
+            return dict(self._batches.get(batch_id, {}))
+
+    def add(self, batch_id, records):
+        with self._lock:
+            self._batches.setdefault(batch_id, {}).update(records)
+            self._batches.move_to_end(batch_id)
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+
+
+class DynamoDBCheckpointStore:
+    """
+    Record progress as one item per record in a DynamoDB table, so it
+    survives across containers and expires after ttl seconds. Unfinished
+    records carry their token in a "pendingToken" attribute.
+    """
+
+    def __init__(self, table_name, ttl=CHECKPOINT_TTL_SECONDS):
+        self.table_name = table_name
+        self.ttl = ttl
+
+    def _table(self):
+        return get_resource('dynamodb').Table(self.table_name)
+
+    def progress(self, batch_id):
+        table = self._table()
+        kwargs = {
+            'KeyConditionExpression': 'batchId = :batch',
+            'ExpressionAttributeValues': {':batch': batch_id},
+            'ProjectionExpression': 'recordId, pendingToken',
+            'ConsistentRead': True
+        }
+        progress = {}
+        while True:
+            response = table.query(**kwargs)
+            progress.update((item['recordId'], item.get('pendingToken')) for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return progress
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def add(self, batch_id, records):
+        expires_at = int(time.time()) + self.ttl
+        with self._table().batch_writer(overwrite_by_pkeys=['batchId', 'recordId']) as batch:
+            for record, token in records.items():
+                item = {'batchId': batch_id, 'recordId': record, 'expiresAt': expires_at}
+                if token is not None:
+                    item['pendingToken'] = token
+                batch.put_item(Item=item)
+
+
+def checkpoint_store():
+    """
+    The default store: DynamoDB when CHECKPOINT_TABLE is set, else None (no checkpoints).
+    """
+    return DynamoDBCheckpointStore(CHECKPOINT_TABLE) if CHECKPOINT_TABLE else None
+
+
+class Checkpoints:
+    """
+    One handler's view of a checkpoint store.
+
+    Batch IDs are prefixed with the handler name. Records are buffered and
+    written CHECKPOINT_FLUSH_RECORDS at a time; call flush() before
+    returning. Store errors are logged and never fail the request: at worst
+    a retry redoes records that had already completed. Without a store
+    every method is a no-op.
+    """
+
+    def __init__(self, name, store=None):
+        self.name = name
+        self.store = store if store is not None else checkpoint_store()
+        self._buffer = {}
+        self._buffered = 0
+
+    def progress(self, batch_id):
+        """
+        Map of the batch's saved record IDs to None (completed) or their pending token.
+        """
+        if self.store is None:
+            return {}
+        try:
+            with span('checkpoint_read'):
+                return self.store.progress(f"{self.name}/{batch_id}")
+        except Exception as e:
+            print(f"Error reading checkpoint {self.name}/{batch_id}: {str(e)}")
+            return {}
+
+    def completed(self, batch_id):
+        return {record for record, token in self.progress(batch_id).items() if token is None}
+
+    def add(self, batch_id, record, pending=None):
+        """
+        Save a record as completed or, with a pending token, as started but
+        unfinished; the token is what a later attempt resumes it from.
+        """
+        if self.store is None:
+            return
+        self._buffer.setdefault(batch_id, {})[record] = pending
+        self._buffered += 1
+        if self._buffered >= CHECKPOINT_FLUSH_RECORDS:
+            self.flush()
+
+    def flush(self):
+        buffer, self._buffer, self._buffered = self._buffer, {}, 0
+        for batch_id, records in buffer.items():
+            try:
+                with span('checkpoint_write'):
+                    self.store.add(f"{self.name}/{batch_id}", records)
+            except Exception as e:
+                print(f"Error writing checkpoint {self.name}/{batch_id}: {str(e)}")
+
+
+class WorkLoop:
+    """
+    Runs a handler's S3 records within the invocation's time limit, resumably.
+
+    With a checkpoint store (CHECKPOINT_TABLE), records that completed in
+    an earlier attempt at the same batch, such as a retry after a timeout,
+    are skipped. Each record is checkpointed as it completes, if
+    is_complete(result) holds (by default, the result has no "error";
+    handlers whose results can be unfinished pass their own check).
+    Once less than reserve_ms (default WORK_LOOP_RESERVE_MS, at most a
+    quarter of the time left when the loop is created) of invocation time
+    remains, no further records are started; finish() then invokes the
+    function again, asynchronously, with only the records that were never
+    started, split over as many invocations as the Invoke payload limit
+    needs. If that fails, finish() raises ResumeError.
+
+    A batch is identified by the event's "batchId" or, failing that, by a
+    hash of its records' IDs, so a retried event maps to the same batch.
+    SQS batches go through process_sqs_batch instead, where each message
+    is checkpointed separately and SQS itself redelivers the remainder.
+
+    Example:
+        loop = WorkLoop('rekognition', event, context)
+        for result in loop.imap(analyze, concurrency):
+            results.add(result)
+        return results.response(message, checkpoint=loop.finish())
+    """
+
+    def __init__(self, name, event, context=None, store=None, reserve_ms=None):
+        self.name = name
+        self.event = event
+        self.context = context
+        self.checkpoints = Checkpoints(name, store)
+        reserve_ms = RESERVE_MS if reserve_ms is None else reserve_ms
+        if context is not None:
+            # Short function timeouts keep most of their time for work
+            reserve_ms = min(reserve_ms, context.get_remaining_time_in_millis() // 4)
+        self.reserve_ms = reserve_ms
+        self._batch_id = event.get('batchId')
+        self.resumes = int(event.get('resumeCount', 0))
+        self.skipped = 0
+        self.remaining = []
+
+    @property
+    def batch_id(self):
+        if self._batch_id is None:
+            records = self.event['Records']
+            self._batch_id = result_cache.cache_key(self.name, [record_id(record) for record in records])
+        return self._batch_id
+
+    def out_of_time(self):
+        return (
+            self.context is not None
+            and self.context.get_remaining_time_in_millis() < self.reserve_ms
+        )
+
+    def imap(self, fn, max_workers, is_complete=succeeded):
+        """
+        Yield fn(record) for every record not yet completed, in input order
+        (see concurrency.bounded_imap), until the deadline reserve is reached.
+        """
+        records = self.event['Records']
+        completed = self.checkpoints.completed(self.batch_id) if self.checkpoints.store else set()
+        todo = [record for record in records if record_id(record) not in completed]
+        self.skipped = len(records) - len(todo)
+
+        def feed():
+            for index, record in enumerate(todo):
+                # Always start one record, so every invocation makes progress
+                if index and self.out_of_time():
+                    self.remaining = todo[index:]
+                    return
+                yield record
+
+        try:
+            for record, result in bounded_imap(lambda record: (record, fn(record)), feed(), max_workers, self.context):
+                if is_complete(result):
+                    self.checkpoints.add(self.batch_id, record_id(record))
+                yield result
+        finally:
+            self.checkpoints.flush()
+
+    def process_sqs_batch(self, fn, max_workers, is_complete=succeeded, pending=None, resume=None):
+        """
+        s3_events.process_sqs_batch with this loop's deadline reserve and
+        checkpoints; SQS redelivers the messages left unfinished.
+        """
+        return process_sqs_batch(self.event, fn, max_workers, self.context, self.reserve_ms, self.checkpoints,
+                                 is_complete, pending, resume)
+
+    def finish(self):
+        """
+        Re-enqueue the records that were never started.
+
+        Returns None if every record was processed in this invocation, else
+        {"batchId", "skipped", "remaining", "resumed", "invocations"} for
+        the response. Raises ResumeError if the remaining records could not
+        all be re-enqueued: the batch was resumed MAX_RESUMES times already,
+        the context has no function ARN, a record is too large for an Invoke
+        payload, or an Invoke failed.
+        """
+        count('work_loop_skipped', self.skipped)
+        count('work_loop_remaining', len(self.remaining))
+        if not self.skipped and not self.remaining:
+            return None
+        invocations = self._resume() if self.remaining else 0
+        return {
+            'batchId': self.batch_id,
+            'skipped': self.skipped,
+            'remaining': len(self.remaining),
+            'resumed': invocations > 0,
+            'invocations': invocations
+        }
+
+    def _payloads(self):
+        """
+        Yield the re-enqueue payloads, each holding as many of the remaining
+        records as fit in MAX_INVOKE_PAYLOAD_BYTES.
+        """
+        event = dict(self.event, Records=[], batchId=self.batch_id, resumeCount=self.resumes + 1)
+        overhead = len(json.dumps(event).encode('utf-8'))
+        records, size = [], overhead
+        for record in self.remaining:
+            # Plus the ", " separating it from the previous record
+            record_size = len(json.dumps(record).encode('utf-8')) + 2
+            if overhead + record_size > MAX_INVOKE_PAYLOAD_BYTES:
+                raise ResumeError(f"A record of batch {self.batch_id} is too large to re-enqueue: "
+                                  f"{overhead + record_size} bytes")
+            if records and size + record_size > MAX_INVOKE_PAYLOAD_BYTES:
+                yield json.dumps(dict(event, Records=records)).encode('utf-8')
+                records, size = [], overhead
+            records.append(record)
+            size += record_size
+        if records:
+            yield json.dumps(dict(event, Records=records)).encode('utf-8')
+
+    def _resume(self):
+        """
+        Invoke the function asynchronously with the remaining records and
+        return the number of invocations.
+        """
+        if self.resumes >= MAX_RESUMES:
+            raise ResumeError(f"Not re-enqueuing {len(self.remaining)} record(s) of batch {self.batch_id}: "
+                              f"already resumed {self.resumes} time(s)")
+        function_arn = getattr(self.context, 'invoked_function_arn', None)
+        if not function_arn:
+            raise ResumeError(f"Cannot re-enqueue {len(self.remaining)} record(s) of batch {self.batch_id}: "
+                              f"no invoked_function_arn in the context")
+
+        lambda_client = throttled_client('lambda', self.context)
+        invocations = 0
+        try:
+            for payload in self._payloads():
+                with span('resume_invoke'):
+                    lambda_client.invoke(FunctionName=function_arn, InvocationType='Event', Payload=payload)
+                invocations += 1
+        except ResumeError:
+            raise
+        except Exception as e:
+            raise ResumeError(f"Error re-enqueuing {len(self.remaining)} record(s) of batch {self.batch_id} "
+                              f"after {invocations} invocation(s): {str(e)}") from e
+        return invocations